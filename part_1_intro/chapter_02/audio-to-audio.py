@@ -12,38 +12,88 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import argparse
 import asyncio
+import os
+import time
 import traceback
-import pyaudio
 
-from google import genai
+# Neither is needed to run batch mode against the local stand-in
+try:
+    import pyaudio
+except ImportError:
+    pyaudio = None
+try:
+    from google import genai
+except ImportError:
+    genai = None
 
-FORMAT = pyaudio.paInt16
+from audio_capture import AudioCapture
+from audio_playback import AudioPlayback
+from batch import run_batch
+from turn_latency import TurnTimer
+from vad import VoiceActivityDetector
+
+FORMAT = pyaudio.paInt16 if pyaudio is not None else None
 CHANNELS = 1
 SEND_SAMPLE_RATE = 16000
 RECEIVE_SAMPLE_RATE = 24000
 CHUNK_SIZE = 512
+# Samples sent to the model per message; a multiple of CHUNK_SIZE sends
+# fewer, larger messages
+SEND_FRAME_SIZE = 512
+# Captured audio held while the event loop is busy before blocks are dropped
+CAPTURE_BUFFER_SECONDS = 2.0
+# Samples written to the speaker at a time (20 ms); smaller blocks start
+# playback and stop it on interruption sooner
+PLAY_BLOCK_SIZE = 480
+# Model audio buffered before a turn starts playing; grows by itself when
+# the network is jittery
+PLAYBACK_TARGET_SECONDS = 0.04
+# How far above the background noise (in dB) the microphone level has to be
+# to count as speech
+VAD_THRESHOLD_DB = 9.0
+# Silence streamed after speech; once this much has passed, the turn ends
+VAD_HANGOVER_SECONDS = 0.5
+# Extra level needed to interrupt the model, so its own voice coming out
+# of the speakers does not
+BARGE_IN_MARGIN_DB = 10.0
+# Set TURN_TRACE_PATH=turns.jsonl to also write every turn's timings there
+TURN_TRACE_PATH = os.environ.get("TURN_TRACE_PATH")
 
 MODEL = "models/gemini-2.0-flash-exp"
 
-client = genai.Client(http_options={'api_version': 'v1alpha'})
+client = None
 
 CONFIG = {
     "generation_config": {"response_modalities": ["AUDIO"], "speech_config": "Puck"},
     "system_instruction": "Always start your sentence with 'mate'."
 }
 
+def live_connect():
+    """Returns client.aio.live.connect, creating the client on first use."""
+    global client
+    if client is None:
+        client = genai.Client(http_options={'api_version': 'v1alpha'})
+    return client.aio.live.connect
+
 async def audio_loop():
-    audio_queue = asyncio.Queue()
     model_speaking = False
+    barged_in = False
     session = None
+    capture = None
+    playback = None
+    vad = VoiceActivityDetector(
+        SEND_SAMPLE_RATE, threshold_db=VAD_THRESHOLD_DB, hangover_seconds=VAD_HANGOVER_SECONDS
+    )
+    timer = TurnTimer(TURN_TRACE_PATH)
 
     pya = pyaudio.PyAudio()
     mic_info = pya.get_default_input_device_info()
 
     try:
         async with (
-            client.aio.live.connect(model=MODEL, config=CONFIG) as session,
+            live_connect()(model=MODEL, config=CONFIG) as session,
             asyncio.TaskGroup() as tg,
         ):
             input_stream = await asyncio.to_thread(
@@ -55,43 +105,158 @@ async def audio_loop():
                 input_device_index=mic_info["index"],
                 frames_per_buffer=CHUNK_SIZE,
             )
+            capture = AudioCapture(
+                lambda: input_stream.read(CHUNK_SIZE, exception_on_overflow=False),
+                bytes_per_second=SEND_SAMPLE_RATE * 2,
+                block_bytes=CHUNK_SIZE * 2,
+                frame_bytes=SEND_FRAME_SIZE * 2,
+                capacity_seconds=CAPTURE_BUFFER_SECONDS,
+                input_latency=input_stream.get_input_latency(),
+            )
+            capture.start()
             output_stream = await asyncio.to_thread(
-                pya.open, format=FORMAT, channels=CHANNELS, rate=RECEIVE_SAMPLE_RATE, output=True
+                pya.open,
+                format=FORMAT,
+                channels=CHANNELS,
+                rate=RECEIVE_SAMPLE_RATE,
+                output=True,
+                frames_per_buffer=PLAY_BLOCK_SIZE,
             )
+            playback = AudioPlayback(
+                output_stream.write,
+                bytes_per_second=RECEIVE_SAMPLE_RATE * 2,
+                block_bytes=PLAY_BLOCK_SIZE * 2,
+                target_seconds=PLAYBACK_TARGET_SECONDS,
+                device_latency=output_stream.get_output_latency(),
+                on_start=timer.playback_started,
+            )
+            playback.start()
 
             async def listen_and_send():
-                nonlocal model_speaking
+                nonlocal model_speaking, barged_in
+                speech_end = None
                 while True:
-                    if not model_speaking:
-                        try:
-                            data = await asyncio.to_thread(input_stream.read, CHUNK_SIZE, exception_on_overflow=False)
-                            await session.send(input={"data": data, "mime_type": "audio/pcm"}, end_of_turn=True)
-                        except OSError as e:
-                            print(f"Audio input error: {e}")
-                            await asyncio.sleep(0.1)
-                    else:
-                        await asyncio.sleep(0.1)
+                    data = await capture.read_frame()
+                    if not data:
+                        break
+                    talking = model_speaking or playback.busy
+                    result = vad.process(data, margin_db=BARGE_IN_MARGIN_DB if talking else 0.0)
+                    if result.speech_started and talking:
+                        # The user talks over the model: stop playing now and
+                        # drop the rest of its answer
+                        print("Barge-in")
+                        playback.flush()
+                        barged_in = True
+                        timer.turn_ended(time.perf_counter(), interrupted=True)
+                    if result.speech:
+                        speech_end = capture.captured_at()
+                    elif speech_end is not None and result.chunks:
+                        # First chunk of the hangover: the model may answer
+                        # before the turn is over for the VAD
+                        timer.speech_ended(speech_end)
+                        speech_end = None
+                    for i, chunk in enumerate(result.chunks):
+                        last = i == len(result.chunks) - 1
+                        await session.send(
+                            input={"data": chunk, "mime_type": "audio/pcm"},
+                            end_of_turn=result.turn_ended and last,
+                        )
+                    if result.turn_ended:
+                        timer.end_of_turn_sent(time.perf_counter())
+                # The microphone stream ended or failed: end the session
+                print("Audio input ended")
+                receiver.cancel()
 
             async def receive_and_play():
-                nonlocal model_speaking
+                nonlocal model_speaking, barged_in
                 while True:
                     async for response in session.receive():
                         server_content = response.server_content
-                        if server_content and server_content.model_turn:
+                        if server_content and server_content.model_turn and not barged_in:
                             model_speaking = True
                             for part in server_content.model_turn.parts:
                                 if part.inline_data:
-                                    await asyncio.to_thread(output_stream.write, part.inline_data.data)
+                                    timer.model_audio(time.perf_counter())
+                                    playback.put(part.inline_data.data)
+
+                        if server_content and server_content.interrupted:
+                            # Stop talking right away rather than finishing
+                            # the buffered audio
+                            playback.flush()
+                            timer.turn_ended(time.perf_counter(), interrupted=True)
+                            model_speaking = barged_in = False
 
                         if server_content and server_content.turn_complete:
                             print("Turn complete")
-                            model_speaking = False
+                            timer.turn_ended(time.perf_counter())
+                            playback.end_turn()
+                            model_speaking = barged_in = False
 
             tg.create_task(listen_and_send())
-            tg.create_task(receive_and_play())
+            receiver = tg.create_task(receive_and_play())
 
     except Exception as e:
         traceback.print_exception(None, e, e.__traceback__)
+    finally:
+        if capture is not None:
+            capture.stop()
+            print(capture.summary())
+        if playback is not None:
+            playback.stop()
+            print(playback.summary())
+        print(vad.summary())
+        timer.close()
+        print(timer.summary())
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Talk to Gemini through the microphone, or stream WAV files to it in batch."
+    )
+    parser.add_argument("inputs", nargs="*", help="WAV files to send instead of the microphone")
+    parser.add_argument("--output-dir", default="output", help="where the model audio of each file is written")
+    parser.add_argument(
+        "--pace", choices=("realtime", "fast"), default="realtime",
+        help="send the files as if spoken, or as fast as possible",
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="sessions per input file")
+    parser.add_argument("--concurrency", type=int, default=0, help="sessions at a time, 0 for all")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for answers after a file ends")
+    parser.add_argument("--stand-in", action="store_true", help="answer locally instead of calling the API")
+    parser.add_argument("--stand-in-delay", type=float, default=0.5, help="seconds the stand-in takes to answer")
+    args = parser.parse_args()
+
+    if not args.inputs:
+        if pyaudio is None or genai is None:
+            parser.error("the live chat needs pyaudio and google-genai installed")
+        asyncio.run(audio_loop(), debug=True)
+        return
+
+    realtime = args.pace == "realtime"
+    if args.stand_in:
+        from live_stand_in import StandInLive
+
+        connect = StandInLive(args.stand_in_delay, speed=1.0 if realtime else None).connect
+    elif genai is None:
+        parser.error("google-genai is not installed; use --stand-in")
+    else:
+        connect = live_connect()
+    asyncio.run(
+        run_batch(
+            connect,
+            MODEL,
+            CONFIG,
+            args.inputs,
+            args.output_dir,
+            repeat=args.repeat,
+            concurrency=args.concurrency,
+            realtime=realtime,
+            frame_bytes=SEND_FRAME_SIZE * 2,
+            vad_threshold_db=VAD_THRESHOLD_DB,
+            hangover_seconds=VAD_HANGOVER_SECONDS,
+            answer_timeout=args.timeout,
+            trace_path=TURN_TRACE_PATH,
+        )
+    )
 
 if __name__ == "__main__":
-    asyncio.run(audio_loop(), debug=True)
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,192 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Microphone capture on a dedicated thread, decoupled from the event loop.
+
+One long-lived thread reads blocks from the input stream and copies them
+into a preallocated ring buffer. The async side drains whole frames of any
+size from the ring, so there is no executor hand-off or future per block.
+"""
+import asyncio
+import threading
+import time
+import traceback
+
+
+class RingBuffer:
+    """
+    Fixed-size byte ring for exactly one producer and one consumer.
+
+    The producer only advances the write position and the consumer only the
+    read position, each after copying its data, so neither side takes a lock.
+    Positions count bytes since the start and are never wrapped.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._view = memoryview(bytearray(capacity))
+        self._written = 0
+        self._read = 0
+
+    def available(self) -> int:
+        """Bytes written but not read yet."""
+        return self._written - self._read
+
+    def write(self, data) -> bool:
+        """Copies all of `data` in, or nothing if it does not fit."""
+        size = len(data)
+        if size > self.capacity - self.available():
+            return False
+        start = self._written % self.capacity
+        first = min(size, self.capacity - start)
+        self._view[start : start + first] = data[:first]
+        self._view[: size - first] = data[first:]
+        self._written += size
+        return True
+
+    def read(self, size: int):
+        """Returns the next `size` bytes, or None if fewer are available."""
+        if self.available() < size:
+            return None
+        start = self._read % self.capacity
+        first = min(size, self.capacity - start)
+        data = bytes(self._view[start : start + first])
+        if first < size:
+            data += bytes(self._view[: size - first])
+        self._read += size
+        return data
+
+
+class AudioCapture:
+    """
+    Fills a RingBuffer from `read_block` (e.g. a PyAudio stream's read) on a
+    dedicated thread; read_frame() returns the captured audio in frames of
+    `frame_bytes`.
+
+    - overflows counts blocks that were dropped because the ring was full,
+      i.e. the async side fell more than the ring's length behind.
+    - underflows counts frames the async side had to wait for longer than
+      a frame plus a capture block, i.e. capture stalled and left a gap.
+
+    When read_block returns no data or raises, read_frame() returns what is left
+    (possibly a short frame) and then b"".
+
+    captured_at() tells when the end of the last frame read was captured;
+    `input_latency` is the device's delay between sound and read_block.
+    """
+
+    def __init__(
+        self,
+        read_block,
+        bytes_per_second: int,
+        block_bytes: int,
+        frame_bytes: int,
+        capacity_seconds: float = 2.0,
+        input_latency: float = 0.0,
+    ) -> None:
+        self._read_block = read_block
+        self.bytes_per_second = bytes_per_second
+        self.frame_bytes = frame_bytes
+        self.input_latency = input_latency
+        self.ring = RingBuffer(max(int(bytes_per_second * capacity_seconds), frame_bytes))
+        # A frame normally arrives within this long of asking for it
+        self._late = (max(frame_bytes, block_bytes) + block_bytes) / bytes_per_second
+        self.finished = False
+        self.overflows = 0
+        self.underflows = 0
+        self.dropped_bytes = 0
+        self._loop = None
+        self._ready = asyncio.Event()
+        self._waiting = False
+        self._stopped = threading.Event()
+        self._thread = None
+        # (bytes written, perf_counter()) after the latest block
+        self._stamp = (0, time.perf_counter())
+
+    def start(self) -> None:
+        """Starts the capture thread; call from the event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._thread = threading.Thread(target=self._run, name="audio-capture", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+    def _run(self) -> None:
+        try:
+            self._capture()
+        except Exception:
+            # The thread would otherwise end silently and the chat would
+            # just stop hearing the user
+            print("Audio capture failed:")
+            traceback.print_exc()
+        finally:
+            self.finished = True
+            self._loop.call_soon_threadsafe(self._ready.set)
+
+    def _capture(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                data = self._read_block()
+            except OSError as e:
+                print(f"Audio input error: {e}")
+                time.sleep(0.1)
+                continue
+            if not data:
+                return  # End of input
+            if self.ring.write(data):
+                self._stamp = (self.ring._written, time.perf_counter())
+            else:
+                self.overflows += 1
+                self.dropped_bytes += len(data)
+            # Only wake the event loop when the consumer is blocked on us
+            if self._waiting and self.ring.available() >= self.frame_bytes:
+                self._waiting = False
+                self._loop.call_soon_threadsafe(self._ready.set)
+
+    async def read_frame(self) -> bytes:
+        """Waits for and returns the next frame of captured audio."""
+        frame = self.ring.read(self.frame_bytes)
+        if frame is not None:
+            return frame
+        started = time.perf_counter()
+        while frame is None:
+            if self.finished:
+                return self.ring.read(self.ring.available())
+            self._ready.clear()
+            self._waiting = True
+            # Re-check after announcing the wait, or a write in between
+            # would never wake us
+            frame = self.ring.read(self.frame_bytes)
+            if frame is None:
+                await self._ready.wait()
+                frame = self.ring.read(self.frame_bytes)
+        self._waiting = False
+        if time.perf_counter() - started > self._late:
+            self.underflows += 1
+        return frame
+
+    def captured_at(self) -> float:
+        """perf_counter() time at which the end of the last frame read was spoken."""
+        written, at = self._stamp
+        backlog = written - self.ring._read
+        return at - backlog / self.bytes_per_second - self.input_latency
+
+    def summary(self) -> str:
+        return (
+            f"capture: {self.overflows} overflows ({self.dropped_bytes} bytes dropped), "
+            f"{self.underflows} underflows"
+        )
@@ -0,0 +1,200 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Playback of model audio through a jitter buffer on a dedicated thread.
+
+The receive loop only appends audio to the buffer, so a slow speaker write
+never holds up the websocket. A writer thread starts each turn once the
+buffer holds the target depth, then writes small blocks to the device. When
+the buffer runs dry mid-turn the target grows; turns that play through
+cleanly shrink it again, so the start-up delay stays as low as the network
+allows.
+"""
+import statistics
+import threading
+import time
+
+IDLE = "idle"
+BUFFERING = "buffering"
+PLAYING = "playing"
+
+
+class AudioPlayback:
+    """
+    Plays PCM audio handed to put() through `write_block` (e.g. a PyAudio
+    output stream's write) in blocks of `block_bytes`.
+
+    - underruns counts times the buffer ran dry in the middle of a turn.
+    - glitches counts the underruns that lasted longer than the audio still
+      queued in the device (`device_latency`), i.e. were audible as a gap.
+    - latencies holds, per turn, the seconds from the first byte put() to
+      the first audio leaving the speaker.
+
+    `on_start`, if given, is called from the writer thread with the
+    perf_counter() time at which each turn becomes audible.
+    """
+
+    def __init__(
+        self,
+        write_block,
+        bytes_per_second: int,
+        block_bytes: int,
+        target_seconds: float = 0.04,
+        min_target_seconds: float = 0.02,
+        max_target_seconds: float = 0.4,
+        device_latency: float = 0.0,
+        on_start=None,
+    ) -> None:
+        self._write_block = write_block
+        self._on_start = on_start
+        self.bytes_per_second = bytes_per_second
+        self.block_bytes = block_bytes
+        self.target_seconds = target_seconds
+        self.min_target_seconds = min_target_seconds
+        self.max_target_seconds = max_target_seconds
+        self.device_latency = device_latency
+        self.underruns = 0
+        self.glitches = 0
+        self.flushes = 0
+        self.latencies = []
+        self._buffer = bytearray()
+        self._state = IDLE
+        self._turn_ended = False
+        self._turn_underruns = 0
+        self._first_byte_at = None
+        self._dry_since = None
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    @property
+    def busy(self) -> bool:
+        """Whether a turn is still buffered or playing."""
+        return self._state != IDLE
+
+    def buffered_seconds(self) -> float:
+        return len(self._buffer) / self.bytes_per_second
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="audio-playback", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+    def put(self, data: bytes) -> None:
+        """Queues model audio; never blocks on the device."""
+        with self._condition:
+            if self._state == IDLE:
+                self._state = BUFFERING
+                self._turn_ended = False
+                self._turn_underruns = 0
+                self._first_byte_at = time.perf_counter()
+            self._buffer += data
+            self._condition.notify()
+
+    def end_turn(self) -> None:
+        """Marks the end of the turn: play what is left without waiting."""
+        with self._condition:
+            if self._state != IDLE:
+                self._turn_ended = True
+                self._condition.notify()
+
+    def flush(self) -> None:
+        """Drops all queued audio at once, e.g. when the model is interrupted."""
+        with self._condition:
+            if self._state != IDLE:
+                self.flushes += 1
+            self._buffer.clear()
+            self._state = IDLE
+            self._dry_since = None
+            self._condition.notify()
+
+    def _target_bytes(self) -> int:
+        target = int(self.target_seconds * self.bytes_per_second)
+        return target - target % 2
+
+    def _next_block(self):
+        """Waits for the next block to play; returns None once stopped."""
+        with self._condition:
+            while True:
+                if self._stopped:
+                    return None
+                if self._state == BUFFERING and (
+                    len(self._buffer) >= self._target_bytes() or self._turn_ended
+                ):
+                    self._state = PLAYING
+                if self._state == PLAYING:
+                    if len(self._buffer) >= self.block_bytes:
+                        break
+                    if self._turn_ended:
+                        if self._buffer:
+                            break
+                        self._finish_turn()
+                    else:
+                        self._underrun()
+                self._condition.wait()
+            block = bytes(self._buffer[: self.block_bytes])
+            del self._buffer[: self.block_bytes]
+            first = self._first_byte_at
+            self._first_byte_at = None
+            if self._dry_since is not None:
+                if time.perf_counter() - self._dry_since > self.device_latency:
+                    self.glitches += 1
+                self._dry_since = None
+        if first is not None:
+            audible = time.perf_counter() + self.device_latency
+            self.latencies.append(audible - first)
+            if self._on_start is not None:
+                self._on_start(audible)
+        return block
+
+    def _underrun(self) -> None:
+        self.underruns += 1
+        self._turn_underruns += 1
+        self._state = BUFFERING
+        # Wait for more next time
+        self.target_seconds = min(self.target_seconds * 1.5, self.max_target_seconds)
+        self._dry_since = time.perf_counter()
+
+    def _finish_turn(self) -> None:
+        self._state = IDLE
+        if not self._turn_underruns:
+            self.target_seconds = max(self.target_seconds * 0.8, self.min_target_seconds)
+
+    def _run(self) -> None:
+        while True:
+            block = self._next_block()
+            if block is None:
+                return
+            try:
+                self._write_block(block)
+            except OSError as e:
+                print(f"Audio output error: {e}")
+
+    def summary(self) -> str:
+        latency = ""
+        if self.latencies:
+            latency = (
+                f", first byte to audio p50 {statistics.median(self.latencies) * 1000:.0f} ms"
+                f" max {max(self.latencies) * 1000:.0f} ms"
+            )
+        return (
+            f"playback: {len(self.latencies)} turns{latency}, {self.underruns} underruns, "
+            f"{self.glitches} glitches, {self.flushes} flushes"
+        )
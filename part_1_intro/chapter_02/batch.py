@@ -0,0 +1,289 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Offline batch mode: WAV files stand in for the microphone and the speaker.
+
+Each input file is streamed through the same VAD and turn timing as the
+live chat, in its own session, and the model's audio is written to a WAV
+file. The files are read at real-time pace, as if spoken, or as fast as the
+model takes them. Sessions run concurrently on one event loop, so a batch
+also measures throughput and turn latency under load, without audio
+hardware.
+"""
+import asyncio
+import os
+import time
+import wave
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from turn_latency import TurnTimer
+from vad import VoiceActivityDetector
+
+SEND_SAMPLE_RATE = 16000
+RECEIVE_SAMPLE_RATE = 24000
+
+
+def read_wav(path: str, sample_rate: int = SEND_SAMPLE_RATE) -> bytes:
+    """Reads a 16-bit WAV file as mono PCM at `sample_rate`."""
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit WAV files are supported")
+        channels = f.getnchannels()
+        rate = f.getframerate()
+        frames = f.readframes(f.getnframes())
+    samples = np.frombuffer(frames, dtype="<i2").reshape(-1, channels).mean(axis=1)
+    if rate != sample_rate and len(samples):
+        count = len(samples) * sample_rate // rate
+        samples = np.interp(np.arange(count) * (rate / sample_rate), np.arange(len(samples)), samples)
+    return samples.astype("<i2").tobytes()
+
+
+def write_wav(path: str, pcm: bytes, sample_rate: int = RECEIVE_SAMPLE_RATE) -> None:
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm)
+
+
+class FileSource:
+    """
+    Hands out frames of a PCM buffer like AudioCapture.read_frame().
+
+    In real time, each frame is returned once it would have been fully
+    captured from a microphone; otherwise frames are returned at once
+    (yielding to the other sessions in between).
+    """
+
+    def __init__(self, pcm: bytes, frame_bytes: int, bytes_per_second: int, realtime: bool) -> None:
+        self.pcm = pcm
+        self.frame_bytes = frame_bytes
+        self.bytes_per_second = bytes_per_second
+        self.realtime = realtime
+        self._offset = 0
+        self._start = None
+        self._captured = None
+
+    async def read_frame(self) -> bytes:
+        """Returns the next frame, or b"" at the end of the file."""
+        if self._offset >= len(self.pcm):
+            return b""
+        frame = self.pcm[self._offset : self._offset + self.frame_bytes]
+        self._offset += len(frame)
+        if self.realtime:
+            if self._start is None:
+                self._start = time.perf_counter()
+            due = self._start + self._offset / self.bytes_per_second
+            await asyncio.sleep(max(due - time.perf_counter(), 0))
+            self._captured = due
+        else:
+            await asyncio.sleep(0)
+            self._captured = time.perf_counter()
+        return frame
+
+    def captured_at(self) -> Optional[float]:
+        """perf_counter() time at which the end of the last frame was captured."""
+        return self._captured
+
+
+class SessionResult(NamedTuple):
+    label: str
+    input_seconds: float
+    output_seconds: float
+    # User turns ended by the VAD, and model turns completed or interrupted
+    turns_sent: int
+    turns_answered: int
+    seconds: float
+    timed_out: bool
+    timer: TurnTimer
+    vad: VoiceActivityDetector
+
+
+async def run_session(
+    connect,
+    model: str,
+    config,
+    label: str,
+    pcm: bytes,
+    out_path: str,
+    realtime: bool = True,
+    frame_bytes: int = 1024,
+    vad_threshold_db: float = 9.0,
+    hangover_seconds: float = 0.5,
+    answer_timeout: float = 30.0,
+    trace_path: Optional[str] = None,
+) -> SessionResult:
+    """
+    Streams `pcm` (16 kHz) through one session opened with
+    `connect(model=..., config=...)` and writes the answers to `out_path`.
+
+    The session ends once the input is sent and every turn the VAD ended
+    has been answered, or `answer_timeout` seconds after the input ended.
+    """
+    source = FileSource(pcm, frame_bytes, SEND_SAMPLE_RATE * 2, realtime)
+    vad = VoiceActivityDetector(
+        SEND_SAMPLE_RATE, threshold_db=vad_threshold_db, hangover_seconds=hangover_seconds
+    )
+    timer = TurnTimer(trace_path, label=label)
+    output = bytearray()
+    sent = answered = 0
+    sending = True
+    timed_out = False
+    all_answered = asyncio.Event()
+    started = time.perf_counter()
+
+    def check_answered():
+        if not sending and answered >= sent:
+            all_answered.set()
+
+    async def send(session):
+        nonlocal sent, sending, timed_out
+        speech_end = None
+        while True:
+            data = await source.read_frame()
+            if not data:
+                break
+            result = vad.process(data)
+            if result.speech:
+                speech_end = source.captured_at()
+            elif speech_end is not None and result.chunks:
+                timer.speech_ended(speech_end)
+                speech_end = None
+            for i, chunk in enumerate(result.chunks):
+                last = i == len(result.chunks) - 1
+                await session.send(
+                    input={"data": chunk, "mime_type": "audio/pcm"},
+                    end_of_turn=result.turn_ended and last,
+                )
+            if result.turn_ended:
+                sent += 1
+                timer.end_of_turn_sent(time.perf_counter())
+        sending = False
+        check_answered()
+        try:
+            await asyncio.wait_for(all_answered.wait(), answer_timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+
+    async def receive(session):
+        nonlocal answered
+        while True:
+            async for response in session.receive():
+                server_content = response.server_content
+                if server_content and server_content.model_turn:
+                    for part in server_content.model_turn.parts:
+                        if part.inline_data:
+                            # The output file is the speaker: the audio is
+                            # "played" as soon as it arrives
+                            now = time.perf_counter()
+                            timer.model_audio(now)
+                            timer.playback_started(now)
+                            output.extend(part.inline_data.data)
+                if server_content and (server_content.turn_complete or server_content.interrupted):
+                    timer.turn_ended(time.perf_counter(), interrupted=bool(server_content.interrupted))
+                    answered += 1
+                    check_answered()
+
+    try:
+        async with connect(model=model, config=config) as session:
+            sender = asyncio.create_task(send(session))
+            receiver = asyncio.create_task(receive(session))
+            # The receiver only returns by failing
+            done, pending = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            for task in pending:
+                task.cancel()
+            for task in done:
+                task.result()
+    finally:
+        timer.close()
+        write_wav(out_path, bytes(output))
+
+    return SessionResult(
+        label,
+        input_seconds=len(pcm) / 2 / SEND_SAMPLE_RATE,
+        output_seconds=len(output) / 2 / RECEIVE_SAMPLE_RATE,
+        turns_sent=sent,
+        turns_answered=answered,
+        seconds=time.perf_counter() - started,
+        timed_out=timed_out,
+        timer=timer,
+        vad=vad,
+    )
+
+
+async def run_batch(
+    connect,
+    model: str,
+    config,
+    paths,
+    output_dir: str,
+    repeat: int = 1,
+    concurrency: int = 0,
+    **options,
+) -> list:
+    """
+    Runs every file in `paths` `repeat` times, each run in its own session
+    and at most `concurrency` sessions at a time (0 for no limit), then
+    prints per-session results and the combined turn latencies.
+
+    `options` are passed on to run_session().
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    # Trailing silence lets the VAD end the last turn of every file
+    hangover = options.get("hangover_seconds", 0.5)
+    silence = bytes(int((hangover + 0.1) * SEND_SAMPLE_RATE) * 2)
+    jobs = []
+    for path in paths:
+        pcm = read_wav(path) + silence
+        stem = os.path.splitext(os.path.basename(path))[0]
+        for n in range(repeat):
+            label = stem if repeat == 1 else f"{stem}-{n + 1}"
+            jobs.append((label, pcm, os.path.join(output_dir, f"{label}.wav")))
+
+    limit = asyncio.Semaphore(concurrency or len(jobs) or 1)
+
+    async def run(label, pcm, out_path):
+        async with limit:
+            return await run_session(connect, model, config, label, pcm, out_path, **options)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(run(*job) for job in jobs), return_exceptions=True)
+    elapsed = time.perf_counter() - started
+
+    timer = TurnTimer()
+    chunks_in = chunks_sent = 0
+    audio_seconds = 0.0
+    for (label, _, out_path), result in zip(jobs, results):
+        if isinstance(result, BaseException):
+            print(f"{label}: failed: {result!r}")
+            continue
+        timer.merge(result.timer)
+        chunks_in += result.vad.chunks_in
+        chunks_sent += result.vad.chunks_sent
+        audio_seconds += result.input_seconds
+        print(
+            f"{label}: {result.input_seconds:.1f} s in, {result.turns_answered}/{result.turns_sent}"
+            f" turns answered, {result.output_seconds:.1f} s out to {out_path}"
+            f" in {result.seconds:.1f} s{' (timed out)' if result.timed_out else ''}"
+        )
+    print(
+        f"batch: {len(jobs)} sessions, {audio_seconds:.1f} s of audio in {elapsed:.2f} s"
+        f" ({audio_seconds / elapsed:.1f}x real time)"
+    )
+    sent = chunks_sent / chunks_in if chunks_in else 0.0
+    print(f"vad: sent {chunks_sent} of {chunks_in} chunks ({sent:.0%})")
+    print(timer.summary())
+    return results
@@ -0,0 +1,136 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Local stand-in for `client.aio.live.connect` of the google-genai SDK.
+
+It needs no network or API key: each user turn (audio ending with
+end_of_turn=True) is answered after `response_delay` seconds by echoing the
+turn's audio back at 24 kHz, streamed in `chunk_ms` chunks at real-time
+pace, or as fast as possible with `speed=None`. Responses have the same
+shape as the SDK's (response.server_content.model_turn.parts[i].inline_data
+.data, .turn_complete, .interrupted), so the chat code runs unchanged.
+"""
+import asyncio
+import contextlib
+import time
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+SEND_SAMPLE_RATE = 16000
+RECEIVE_SAMPLE_RATE = 24000
+
+
+class InlineData(NamedTuple):
+    data: bytes
+    mime_type: str = f"audio/pcm;rate={RECEIVE_SAMPLE_RATE}"
+
+
+class Part(NamedTuple):
+    inline_data: Optional[InlineData]
+
+
+class ModelTurn(NamedTuple):
+    parts: List[Part]
+
+
+class ServerContent(NamedTuple):
+    model_turn: Optional[ModelTurn] = None
+    turn_complete: bool = False
+    interrupted: bool = False
+
+
+class Response(NamedTuple):
+    server_content: ServerContent
+
+
+def upsample(pcm: bytes) -> bytes:
+    """Converts 16 kHz int16 PCM to 24 kHz by linear interpolation."""
+    samples = np.frombuffer(pcm, dtype="<i2", count=len(pcm) // 2)
+    if not len(samples):
+        return b""
+    count = len(samples) * RECEIVE_SAMPLE_RATE // SEND_SAMPLE_RATE
+    positions = np.arange(count) * (SEND_SAMPLE_RATE / RECEIVE_SAMPLE_RATE)
+    return np.interp(positions, np.arange(len(samples)), samples).astype("<i2").tobytes()
+
+
+class StandInSession:
+    """One live session; created by StandInLive.connect()."""
+
+    def __init__(self, response_delay: float, chunk_ms: int, speed: Optional[float]) -> None:
+        self.response_delay = response_delay
+        self.chunk_bytes = RECEIVE_SAMPLE_RATE * 2 * chunk_ms // 1000
+        self.speed = speed
+        self.turns = 0
+        self._turn_audio = []
+        self._responses = asyncio.Queue()
+        self._answers = set()
+
+    async def send(self, input=None, end_of_turn: bool = False) -> None:
+        if isinstance(input, dict) and input.get("mime_type", "").startswith("audio/pcm"):
+            self._turn_audio.append(input["data"])
+        if end_of_turn:
+            audio, self._turn_audio = b"".join(self._turn_audio), []
+            answer = asyncio.create_task(self._answer(audio))
+            self._answers.add(answer)
+            answer.add_done_callback(self._answers.discard)
+
+    async def _sleep(self, seconds: float) -> None:
+        await asyncio.sleep(seconds / self.speed if self.speed else 0)
+
+    async def _answer(self, audio: bytes) -> None:
+        self.turns += 1
+        await self._sleep(self.response_delay)
+        pcm = upsample(audio)
+        started = time.perf_counter()
+        for n, offset in enumerate(range(0, len(pcm), self.chunk_bytes)):
+            chunk = pcm[offset : offset + self.chunk_bytes]
+            part = Part(InlineData(chunk))
+            self._responses.put_nowait(Response(ServerContent(model_turn=ModelTurn([part]))))
+            if self.speed:
+                # Pace against the start so scheduling delays do not add up
+                due = started + (n + 1) * len(chunk) / 2 / RECEIVE_SAMPLE_RATE / self.speed
+                await asyncio.sleep(max(due - time.perf_counter(), 0))
+            else:
+                await asyncio.sleep(0)
+        self._responses.put_nowait(Response(ServerContent(turn_complete=True)))
+
+    async def receive(self):
+        """Yields the responses of one model turn, up to its turn_complete."""
+        while True:
+            response = await self._responses.get()
+            yield response
+            if response.server_content.turn_complete:
+                return
+
+    def close(self) -> None:
+        for answer in list(self._answers):
+            answer.cancel()
+
+
+class StandInLive:
+    """Drop-in for `client.aio.live`."""
+
+    def __init__(self, response_delay: float = 0.5, chunk_ms: int = 40, speed: Optional[float] = 1.0) -> None:
+        self.response_delay = response_delay
+        self.chunk_ms = chunk_ms
+        self.speed = speed
+
+    @contextlib.asynccontextmanager
+    async def connect(self, model: str, config=None):
+        session = StandInSession(self.response_delay, self.chunk_ms, self.speed)
+        try:
+            yield session
+        finally:
+            session.close()
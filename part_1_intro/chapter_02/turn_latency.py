@@ -0,0 +1,175 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Turn latency as felt by the user of the audio chat.
+
+Every stage of a turn is timed from the moment the user stopped speaking
+(the capture time of the last chunk the VAD classified as speech):
+
+    end_of_turn    -> the message with end_of_turn=True was sent
+    first_audio    -> the first model audio was received
+    playback       -> the first model audio came out of the speaker
+    turn_complete  -> turn_complete (or the interruption) was received
+
+The stages are collected in histograms printed on exit and, if a trace
+path is given, appended as one JSON object per turn.
+"""
+import bisect
+import json
+import statistics
+import threading
+import time
+
+STAGES = ("end_of_turn", "first_audio", "playback", "turn_complete")
+
+# Upper bounds of the histogram buckets, in milliseconds
+BUCKETS_MS = (50, 100, 200, 300, 400, 500, 750, 1000, 1500, 2000, 3000, 5000, 10000)
+
+
+class LatencyHistogram:
+    """Bucketed latencies of one stage; also keeps the samples for percentiles."""
+
+    def __init__(self, buckets_ms=BUCKETS_MS) -> None:
+        self.buckets_ms = buckets_ms
+        self.counts = [0] * (len(buckets_ms) + 1)
+        self.samples = []
+
+    def observe(self, seconds: float) -> None:
+        milliseconds = seconds * 1000
+        self.counts[bisect.bisect_left(self.buckets_ms, milliseconds)] += 1
+        self.samples.append(milliseconds)
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.samples.extend(other.samples)
+
+    def render(self, width: int = 30):
+        """Yields one text line per bucket from the fastest to the slowest sample."""
+        if not self.samples:
+            return
+        used = [i for i, count in enumerate(self.counts) if count]
+        peak = max(self.counts)
+        for i in range(used[0], used[-1] + 1):
+            bound = f"<= {self.buckets_ms[i]:>5} ms" if i < len(self.buckets_ms) else "    longer"
+            bar = "#" * round(self.counts[i] / peak * width)
+            yield f"  {bound} {bar:<{width}} {self.counts[i]}"
+
+
+class TurnTimer:
+    """
+    Collects the timestamps of each turn (all time.perf_counter()).
+
+    playback_started() is called from the playback thread; everything else
+    from the event loop. `label`, if given, is added to the trace records
+    as "session", e.g. to tell apart the files of a batch run.
+    """
+
+    def __init__(self, trace_path=None, label=None) -> None:
+        self.label = label
+        self.histograms = {stage: LatencyHistogram() for stage in STAGES}
+        self.turns = 0
+        self.interrupted = 0
+        self._trace = open(trace_path, "a", buffering=1) if trace_path else None
+        self._lock = threading.Lock()
+        self._turn = None
+
+    def speech_ended(self, spoken_at: float) -> None:
+        """The user stopped speaking at `spoken_at` (maybe only for a pause)."""
+        with self._lock:
+            turn = self._turn
+            if turn is not None and "first_audio" not in turn and "turn_complete" not in turn:
+                # The user went on talking before the model answered
+                turn["speech_end"] = spoken_at
+                turn.pop("end_of_turn", None)
+                return
+            if turn is not None:
+                # The last answer never started playing
+                self._finish()
+            self._turn = {"speech_end": spoken_at}
+
+    def end_of_turn_sent(self, now: float) -> None:
+        with self._lock:
+            if self._turn is not None:
+                self._turn.setdefault("end_of_turn", now)
+
+    def model_audio(self, now: float) -> None:
+        with self._lock:
+            if self._turn is not None:
+                self._turn.setdefault("first_audio", now)
+
+    def playback_started(self, audible_at: float) -> None:
+        with self._lock:
+            turn = self._turn
+            if turn is not None and "first_audio" in turn and "playback" not in turn:
+                turn["playback"] = audible_at
+                if "turn_complete" in turn:
+                    self._finish()
+
+    def turn_ended(self, now: float, interrupted: bool = False) -> None:
+        """turn_complete or an interruption was received."""
+        with self._lock:
+            turn = self._turn
+            if turn is None or "turn_complete" in turn:
+                return
+            turn["turn_complete"] = now
+            turn["interrupted"] = interrupted
+            # Wait for the answer to start playing, unless there is none
+            if interrupted or "first_audio" not in turn or "playback" in turn:
+                self._finish()
+
+    def _finish(self) -> None:
+        turn, self._turn = self._turn, None
+        self.turns += 1
+        self.interrupted += bool(turn.get("interrupted"))
+        start = turn["speech_end"]
+        record = {"ts": time.time() - (time.perf_counter() - start), "turn": self.turns}
+        if self.label is not None:
+            record["session"] = self.label
+        for stage in STAGES:
+            if stage in turn:
+                self.histograms[stage].observe(turn[stage] - start)
+                record[f"{stage}_ms"] = round((turn[stage] - start) * 1000, 1)
+            else:
+                record[f"{stage}_ms"] = None
+        record["interrupted"] = bool(turn.get("interrupted"))
+        if self._trace is not None:
+            self._trace.write(json.dumps(record) + "\n")
+
+    def merge(self, other: "TurnTimer") -> None:
+        """Adds the finished turns of another timer, e.g. of another session."""
+        self.turns += other.turns
+        self.interrupted += other.interrupted
+        for stage, histogram in other.histograms.items():
+            self.histograms[stage].merge(histogram)
+
+    def close(self) -> None:
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
+
+    def summary(self) -> str:
+        lines = [f"turns: {self.turns} ({self.interrupted} interrupted), ms after end of speech"]
+        for stage, histogram in self.histograms.items():
+            if not histogram.samples:
+                continue
+            samples = histogram.samples
+            p90 = samples[0]
+            if len(samples) > 1:
+                p90 = statistics.quantiles(samples, n=10, method="inclusive")[-1]
+            lines.append(
+                f"{stage}: p50 {statistics.median(samples):.0f} p90 {p90:.0f} max {max(samples):.0f}"
+            )
+            lines.extend(histogram.render())
+        return "\n".join(lines)
@@ -0,0 +1,138 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Voice activity detection on the microphone audio, before it is sent.
+
+Each captured chunk is split into 10 ms frames whose levels are computed in
+one NumPy pass and compared with a running estimate of the background
+noise. Only speech is streamed: a little audio from before the speech was
+detected, the speech itself, and a hangover of silence after it. When the
+hangover runs out, the turn is over.
+"""
+from typing import List, NamedTuple
+
+import numpy as np
+
+# Level of silence in dBFS, used before anything has been measured
+_SILENCE_DB = -90.0
+
+
+class VadResult(NamedTuple):
+    # Audio to send for this chunk, oldest first
+    chunks: List[bytes]
+    # The user started talking in this chunk
+    speech_started: bool
+    # The hangover ran out: the last chunk above ends the user's turn
+    turn_ended: bool
+    # This chunk itself is speech (not pre-roll, hangover or silence)
+    speech: bool
+
+
+class VoiceActivityDetector:
+    """
+    Gates 16-bit mono PCM chunks by voice activity.
+
+    A chunk counts as speech when at least `min_speech_frames` of its
+    frames are `threshold_db` above the noise floor and above
+    `min_level_db`. The noise floor follows the quietest frames down at
+    once and creeps up by `noise_rise_db` per second, so it adapts to
+    a fan starting up without mistaking speech for noise.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        frame_ms: float = 10.0,
+        threshold_db: float = 9.0,
+        min_level_db: float = -50.0,
+        min_speech_frames: int = 2,
+        noise_rise_db: float = 3.0,
+        preroll_seconds: float = 0.15,
+        hangover_seconds: float = 0.5,
+    ) -> None:
+        self.sample_rate = sample_rate
+        self.frame_samples = int(sample_rate * frame_ms / 1000)
+        self.threshold_db = threshold_db
+        self.min_level_db = min_level_db
+        self.min_speech_frames = min_speech_frames
+        self.noise_rise_db = noise_rise_db
+        self.preroll_seconds = preroll_seconds
+        self.hangover_seconds = hangover_seconds
+        self.noise_db = None
+        self.in_speech = False
+        self._silence = 0.0
+        self._preroll = []
+        self._preroll_seconds = 0.0
+        self.chunks_in = 0
+        self.chunks_sent = 0
+
+    def levels(self, pcm: bytes):
+        """Returns the level in dBFS of each whole frame in `pcm`."""
+        samples = np.frombuffer(pcm, dtype="<i2", count=len(pcm) // 2)
+        count = len(samples) // self.frame_samples
+        if not count:
+            return np.full(1, _SILENCE_DB)
+        frames = samples[: count * self.frame_samples].reshape(count, self.frame_samples)
+        power = np.mean(np.square(frames, dtype=np.float32), axis=1) / (32768.0 * 32768.0)
+        return 10.0 * np.log10(power + 1e-12)
+
+    def process(self, pcm: bytes, margin_db: float = 0.0) -> VadResult:
+        """
+        Classifies the next chunk and returns what to send for it.
+
+        `margin_db` raises the threshold for this chunk, e.g. while the
+        model's voice could be picked up from the speakers.
+        """
+        self.chunks_in += 1
+        duration = len(pcm) / 2 / self.sample_rate
+        levels = self.levels(pcm)
+        quietest = float(levels.min())
+        if self.noise_db is None:
+            self.noise_db = quietest
+        else:
+            self.noise_db = min(self.noise_db + self.noise_rise_db * duration, quietest)
+        threshold = max(self.noise_db + self.threshold_db, self.min_level_db) + margin_db
+        voiced = np.count_nonzero(levels > threshold) >= min(self.min_speech_frames, len(levels))
+
+        if voiced:
+            self._silence = 0.0
+            if self.in_speech:
+                return self._send([pcm], False, False, True)
+            self.in_speech = True
+            chunks = self._preroll + [pcm]
+            self._preroll = []
+            self._preroll_seconds = 0.0
+            return self._send(chunks, True, False, True)
+
+        if self.in_speech:
+            self._silence += duration
+            if self._silence < self.hangover_seconds:
+                return self._send([pcm], False, False, False)
+            self.in_speech = False
+            self._silence = 0.0
+            return self._send([pcm], False, True, False)
+
+        self._preroll.append(pcm)
+        self._preroll_seconds += duration
+        while self._preroll_seconds - len(self._preroll[0]) / 2 / self.sample_rate >= self.preroll_seconds:
+            self._preroll_seconds -= len(self._preroll.pop(0)) / 2 / self.sample_rate
+        return VadResult([], False, False, False)
+
+    def _send(self, chunks, speech_started, turn_ended, speech) -> VadResult:
+        self.chunks_sent += len(chunks)
+        return VadResult(chunks, speech_started, turn_ended, speech)
+
+    def summary(self) -> str:
+        sent = self.chunks_sent / self.chunks_in if self.chunks_in else 0.0
+        return f"vad: sent {self.chunks_sent} of {self.chunks_in} chunks ({sent:.0%})"
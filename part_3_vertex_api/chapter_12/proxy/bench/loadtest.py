@@ -0,0 +1,388 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Load test for proxy.py against the local stand-in upstream.
+
+Starts mock_upstream in this process and proxy.py as a subprocess pointed at
+it, then drives N concurrent simulated clients that stream 16 kHz audio (and
+optionally JPEG-sized video frames) through the proxy. Reports p50/p99
+one-way forwarding latency per direction, messages per second, and the
+proxy's CPU time and RSS.
+
+Usage:
+    python loadtest.py --clients 50 --duration 30
+    python loadtest.py --clients 50 --direct   # baseline without the proxy
+    python loadtest.py --region-delays 0.01,0.05,0.2 --fail-fastest-after 10
+    python loadtest.py --tool-call get_weather --server-tools
+    python loadtest.py --close-after 5   # upstream restarts mid-session
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import websockets
+
+from mock_upstream import (
+    SEND_SAMPLE_RATE,
+    TIMESTAMP_KEY,
+    MockUpstream,
+    read_timestamp,
+    tone,
+)
+from weather_stand_in import WeatherStandIn
+
+PROXY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def free_port() -> int:
+    """Returns a TCP port that is currently free on localhost."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(samples, fraction: float) -> float:
+    """Returns the given percentile of `samples` (nearest-rank)."""
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    index = min(int(fraction * len(ordered)), len(ordered) - 1)
+    return ordered[index]
+
+
+def _process_tree(pid: int):
+    """Returns `pid` and the pids of its child processes (proxy workers)."""
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [pid] + [int(child) for child in f.read().split()]
+    except OSError:
+        return [pid]
+
+
+def process_usage(pid: int):
+    """Returns (cpu_seconds, rss_bytes) of a process and its children, from /proc."""
+    cpu = rss = 0.0
+    try:
+        for member in _process_tree(pid):
+            with open(f"/proc/{member}/stat") as f:
+                # Skip past the command name, which may contain spaces
+                fields = f.read().rsplit(")", 1)[1].split()
+            cpu += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+            with open(f"/proc/{member}/status") as f:
+                rss += next(
+                    int(line.split()[1]) * 1024
+                    for line in f
+                    if line.startswith("VmRSS:")
+                )
+        return cpu, rss
+    except (OSError, IndexError, StopIteration):
+        return float("nan"), float("nan")
+
+
+async def wait_for_port(port: int, timeout: float = 30.0) -> None:
+    """Waits until something accepts connections on localhost:port."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+def start_proxy(upstream_port: int, proxy_port: int, extra_env=None) -> subprocess.Popen:
+    """Starts proxy.py configured to use the local stand-in upstream."""
+    env = dict(os.environ)
+    env.update(
+        {
+            "PROXY_SERVICE_URL": f"ws://127.0.0.1:{upstream_port}",
+            "PROXY_STATIC_TOKEN": "bench",
+            "PROXY_PORT": str(proxy_port),
+            "PROXY_METRICS_PORT": "0",
+        }
+    )
+    env.update(extra_env or {})
+    return subprocess.Popen(
+        [sys.executable, os.path.join(PROXY_DIR, "proxy.py")],
+        cwd=PROXY_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL if not os.environ.get("BENCH_PROXY_LOG") else None,
+    )
+
+
+class ClientStats:
+    """Aggregated results of all simulated clients."""
+
+    def __init__(self) -> None:
+        self.downlink_latencies = []
+        self.messages_sent = 0
+        self.messages_received = 0
+        self.setup_times = []
+        # setupComplete messages after the first one of a session
+        self.extra_setups = 0
+        self.errors = 0
+
+
+async def run_client(url: str, args, stats: ClientStats, stop_at: float) -> None:
+    """One simulated browser session: setup, then streams audio (and video)."""
+    chunk_seconds = args.chunk_samples / SEND_SAMPLE_RATE
+    audio = base64.b64encode(tone(chunk_seconds, SEND_SAMPLE_RATE)).decode("ascii")
+    video = base64.b64encode(random.Random(1).randbytes(args.video_bytes)).decode(
+        "ascii"
+    )
+
+    started = time.perf_counter()
+    try:
+        async with websockets.connect(url, max_size=None) as websocket:
+            await websocket.send(json.dumps({"setup": {"model": "bench"}}))
+            # Skip authComplete (sent by the proxy) until the setup is done
+            async for frame in websocket:
+                if b"setupComplete" in (
+                    frame if isinstance(frame, bytes) else frame.encode()
+                ):
+                    break
+            stats.setup_times.append(time.perf_counter() - started)
+
+            async def send():
+                next_audio = next_video = time.perf_counter()
+                while time.perf_counter() < stop_at:
+                    now = time.perf_counter()
+                    if args.video_fps and now >= next_video:
+                        chunk = {"mime_type": "image/jpeg", "data": video}
+                        next_video += 1 / args.video_fps
+                    else:
+                        chunk = {"mime_type": "audio/pcm", "data": audio}
+                        next_audio += chunk_seconds
+                    await websocket.send(
+                        json.dumps(
+                            {
+                                "realtime_input": {"media_chunks": [chunk]},
+                                TIMESTAMP_KEY: time.perf_counter(),
+                            }
+                        )
+                    )
+                    stats.messages_sent += 1
+                    wake = min(next_audio, next_video if args.video_fps else next_audio)
+                    await asyncio.sleep(max(wake - time.perf_counter(), 0))
+
+            async def answer_tools(frame):
+                # Like the browser, which runs the function itself
+                calls = json.loads(frame)["toolCall"]["functionCalls"]
+                await asyncio.sleep(args.client_tool_delay)
+                responses = [
+                    {"id": call["id"], "name": call["name"], "response": {"result": {}}}
+                    for call in calls
+                ]
+                await websocket.send(
+                    json.dumps({"tool_response": {"function_responses": responses}})
+                )
+
+            async def receive():
+                async for frame in websocket:
+                    received = time.perf_counter()
+                    stats.messages_received += 1
+                    sent = read_timestamp(frame)
+                    if sent is not None:
+                        stats.downlink_latencies.append(received - sent)
+                        continue
+                    head = (frame if isinstance(frame, bytes) else frame.encode())[:32]
+                    if b"toolCall" in head:
+                        asyncio.create_task(answer_tools(frame))
+                    elif b"setupComplete" in head:
+                        stats.extra_setups += 1
+
+            receiver = asyncio.create_task(receive())
+            await send()
+            receiver.cancel()
+    except Exception as e:
+        stats.errors += 1
+        print(f"Client error: {e!r}", file=sys.stderr)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=20.0,
+                        help="seconds each client streams for")
+    parser.add_argument("--ramp-up", type=float, default=2.0,
+                        help="seconds over which client starts are spread")
+    parser.add_argument("--chunk-samples", type=int, default=2048,
+                        help="samples per audio message (the browser worklet sends 2048)")
+    parser.add_argument("--video-fps", type=float, default=0.0,
+                        help="video frames per second per client (the browser sends 2)")
+    parser.add_argument("--video-bytes", type=int, default=60000,
+                        help="size of each simulated JPEG frame")
+    parser.add_argument("--turn-seconds", type=float, default=2.0)
+    parser.add_argument("--response-seconds", type=float, default=1.0)
+    parser.add_argument("--proxy-url",
+                        help="use an already running proxy instead of starting one")
+    parser.add_argument("--direct", action="store_true",
+                        help="connect clients straight to the stand-in (baseline)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="PROXY_WORKERS for the started proxy")
+    parser.add_argument("--upstream-port", type=int, default=0)
+    parser.add_argument("--region-delays",
+                        help="start one stand-in region per comma-separated handshake "
+                             "delay (seconds) and route across them")
+    parser.add_argument("--fail-fastest-after", type=float, default=0.0,
+                        help="with --region-delays, stop the fastest region after "
+                             "this many seconds")
+    parser.add_argument("--tool-call",
+                        help="function the stand-in model calls at the start of every turn, "
+                             "e.g. get_weather")
+    parser.add_argument("--client-tool-delay", type=float, default=0.1,
+                        help="seconds a client takes to run a function call it receives")
+    parser.add_argument("--server-tools", action="store_true",
+                        help="start the weather stand-in and let the proxy answer "
+                             "--tool-call through PROXY_TOOLS")
+    parser.add_argument("--tool-delay", type=float, default=0.1,
+                        help="seconds the weather stand-in takes to answer")
+    parser.add_argument("--close-after", type=float, default=0.0,
+                        help="seconds after the setup at which the stand-in closes every "
+                             "upstream connection; the proxy has to reconnect")
+    parser.add_argument("--close-code", type=int, default=1012,
+                        help="close code sent with --close-after")
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    delays = [float(d) for d in args.region_delays.split(",")] if args.region_delays else [0.0]
+    regions = []  # (name, upstream, port, server)
+    for index, delay in enumerate(delays):
+        upstream = MockUpstream(
+            turn_seconds=args.turn_seconds,
+            response_seconds=args.response_seconds,
+            connect_delay=delay,
+            tool_call=args.tool_call,
+            close_after=args.close_after,
+            close_code=args.close_code,
+        )
+        port = (args.upstream_port + index if args.upstream_port else 0) or free_port()
+        server = await upstream.serve("127.0.0.1", port)
+        regions.append((f"region{index}", upstream, port, server))
+    upstream_port = regions[0][2]
+
+    weather = weather_server = None
+    if args.server_tools:
+        weather = WeatherStandIn(delay=args.tool_delay)
+        weather_port = free_port()
+        weather_server = await weather.serve("127.0.0.1", weather_port)
+
+    proxy = None
+    if args.direct:
+        url = f"ws://127.0.0.1:{upstream_port}"
+    elif args.proxy_url:
+        url = args.proxy_url
+    else:
+        proxy_port = free_port()
+        env = {"PROXY_WORKERS": str(args.workers)}
+        if args.server_tools:
+            env["PROXY_TOOLS"] = f"{args.tool_call}=http://127.0.0.1:{weather_port}/weather"
+        if args.region_delays:
+            env["PROXY_REGION_URLS"] = ",".join(
+                f"{name}=ws://127.0.0.1:{port}" for name, _, port, _ in regions
+            )
+        proxy = start_proxy(upstream_port, proxy_port, env)
+        await wait_for_port(proxy_port)
+        url = f"ws://127.0.0.1:{proxy_port}"
+
+    async def fail_fastest():
+        await asyncio.sleep(args.fail_fastest_after)
+        name, _, _, server = regions[delays.index(min(delays))]
+        print(f"Stopping {name}")
+        server.close()
+
+    stats = ClientStats()
+    cpu_before, _ = process_usage(proxy.pid) if proxy else (float("nan"), 0)
+    started = time.perf_counter()
+    stop_at = started + args.ramp_up + args.duration
+
+    async def delayed_client(index: int):
+        await asyncio.sleep(args.ramp_up * index / max(args.clients, 1))
+        await run_client(url, args, stats, stop_at)
+
+    failing = None
+    if args.region_delays and args.fail_fastest_after:
+        failing = asyncio.create_task(fail_fastest())
+    try:
+        await asyncio.gather(*(delayed_client(i) for i in range(args.clients)))
+        elapsed = time.perf_counter() - started
+        cpu_after, rss = process_usage(proxy.pid) if proxy else (float("nan"), float("nan"))
+    finally:
+        if failing is not None:
+            failing.cancel()
+        if proxy:
+            proxy.terminate()
+            proxy.wait()
+        for _, _, _, server in regions:
+            server.close()
+        if weather_server is not None:
+            weather_server.close()
+
+    uplink = [
+        latency for _, upstream, _, _ in regions for latency in upstream.stats.uplink_latencies
+    ]
+    downlink = stats.downlink_latencies
+    results = {
+        "clients": args.clients,
+        "duration_s": round(elapsed, 3),
+        "errors": stats.errors,
+        "setup_p50_ms": percentile(stats.setup_times, 0.5) * 1000,
+        "uplink_p50_ms": percentile(uplink, 0.5) * 1000,
+        "uplink_p99_ms": percentile(uplink, 0.99) * 1000,
+        "downlink_p50_ms": percentile(downlink, 0.5) * 1000,
+        "downlink_p99_ms": percentile(downlink, 0.99) * 1000,
+        "messages_per_s": (stats.messages_sent + stats.messages_received) / elapsed,
+        "proxy_cpu_s": cpu_after - cpu_before,
+        "proxy_cpu_pct": (cpu_after - cpu_before) / elapsed * 100,
+        "proxy_rss_mb": rss / (1024 * 1024),
+    }
+    if args.tool_call:
+        tools = [
+            latency for _, upstream, _, _ in regions for latency in upstream.stats.tool_latencies
+        ]
+        results["tool_calls"] = len(tools)
+        results["tool_p50_ms"] = percentile(tools, 0.5) * 1000
+        results["tool_p99_ms"] = percentile(tools, 0.99) * 1000
+    if weather is not None:
+        results["tool_requests"] = weather.requests
+        results["tool_connections"] = weather.connections
+    if args.close_after:
+        # Every setup after a session's first one replayed it on a new connection
+        setups = sum(upstream.stats.setups for _, upstream, _, _ in regions)
+        results["upstream_closes"] = sum(upstream.stats.closes for _, upstream, _, _ in regions)
+        results["reconnects"] = setups - len(stats.setup_times)
+        results["repeated_setups"] = stats.extra_setups
+    if args.region_delays:
+        for name, upstream, _, _ in regions:
+            results[f"{name}_setups"] = upstream.stats.setups
+    for key, value in results.items():
+        print(f"{key:>18}: {value:.3f}" if isinstance(value, float) else f"{key:>18}: {value}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,324 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Local stand-in for the Vertex AI LlmBidiService BidiGenerateContent endpoint.
+
+It accepts the setup handshake, consumes realtime_input audio and video, and
+answers every `--turn-seconds` of received audio with `--response-seconds`
+of 24 kHz PCM streamed as serverContent inlineData at real-time pace,
+starting `--response-delay` seconds later like a model thinking. With
+`--tool-call get_weather` every turn first asks for that function and waits
+for the tool_response, like a model that needs a tool to answer. With
+`--close-after 5 --close-code 1012` every connection is closed 5 seconds
+after its setup, like a service restart in the middle of a session.
+
+Usage:
+    python mock_upstream.py --port 9000
+    python mock_upstream.py --port 9001 --connect-delay 0.08  # a "far" region
+    python mock_upstream.py --port 9000 --close-after 5 --close-code 1012
+    PROXY_SERVICE_URL=ws://localhost:9000 PROXY_STATIC_TOKEN=bench python ../proxy.py
+"""
+import argparse
+import array
+import asyncio
+import base64
+import json
+import math
+import time
+
+import websockets
+
+SEND_SAMPLE_RATE = 16000
+RECEIVE_SAMPLE_RATE = 24000
+
+# Frames may carry a "_bench_ts" field (time.perf_counter() of the sender).
+# It is placed after the message type key, so the proxy's prefix sniffing
+# and passthrough are unaffected, and lets in-process load generators
+# measure one-way latency through the proxy.
+TIMESTAMP_KEY = "_bench_ts"
+
+
+def read_timestamp(frame):
+    """Returns the TIMESTAMP_KEY value at the end of a frame, or None."""
+    tail = frame[-64:]
+    if isinstance(tail, bytes):
+        tail = tail.decode("ascii", "replace")
+    index = tail.rfind(TIMESTAMP_KEY)
+    if index == -1:
+        return None
+    # Skip the closing quote and the colon: '"_bench_ts": 12.5}'
+    return float(tail[index + len(TIMESTAMP_KEY) + 2 :].strip("} "))
+
+
+def tone(seconds: float, rate: int, frequency: float = 440.0) -> bytes:
+    """Returns `seconds` of a 16-bit mono sine tone, as PCM bytes."""
+    samples = array.array(
+        "h",
+        (
+            int(8000 * math.sin(2 * math.pi * frequency * n / rate))
+            for n in range(int(seconds * rate))
+        ),
+    )
+    return samples.tobytes()
+
+
+class MockStats:
+    """Counters and uplink latency samples collected by the stand-in."""
+
+    def __init__(self) -> None:
+        self.sessions = 0
+        self.setups = 0
+        self.messages_in = 0
+        self.bytes_in = 0
+        self.messages_out = 0
+        self.bytes_out = 0
+        self.uplink_latencies = []
+        # Seconds from each toolCall sent to its tool_response received
+        self.tool_latencies = []
+        # Connections closed by the stand-in (close_after)
+        self.closes = 0
+
+
+class MockUpstream:
+    """
+    Serves BidiGenerateContent sessions; run it with serve().
+    """
+
+    def __init__(
+        self,
+        turn_seconds: float = 2.0,
+        response_seconds: float = 1.0,
+        chunk_ms: int = 40,
+        speed: float = 1.0,
+        binary: bool = True,
+        connect_delay: float = 0.0,
+        response_delay: float = 0.0,
+        tool_call: str = None,
+        tool_args: dict = None,
+        close_after: float = 0.0,
+        close_code: int = 1012,
+    ) -> None:
+        self.turn_seconds = turn_seconds
+        self.response_seconds = response_seconds
+        self.chunk_ms = chunk_ms
+        self.speed = speed
+        self.binary = binary
+        # Added to every opening handshake, like the round trips to a
+        # distant region
+        self.connect_delay = connect_delay
+        # Time to the first audio of each answer
+        self.response_delay = response_delay
+        # Function the model calls at the start of every turn
+        self.tool_call = tool_call
+        self.tool_args = tool_args if tool_args is not None else {"city": "London"}
+        # Seconds after the setup at which each connection is closed with
+        # close_code (0 keeps connections open)
+        self.close_after = close_after
+        self.close_code = close_code
+        self._call_ids = 0
+        self.stats = MockStats()
+        chunk = tone(chunk_ms / 1000, RECEIVE_SAMPLE_RATE)
+        self._chunk_b64 = base64.b64encode(chunk).decode("ascii")
+
+    async def _send(self, websocket, message: dict) -> None:
+        frame = json.dumps(message)
+        if self.binary:
+            # Like Vertex AI, answer with binary frames containing JSON
+            frame = frame.encode()
+        self.stats.messages_out += 1
+        self.stats.bytes_out += len(frame)
+        await websocket.send(frame)
+
+    async def _call_tool(self, websocket, tool_responses: asyncio.Queue) -> None:
+        """Sends a toolCall and waits for the tool_response answering it."""
+        self._call_ids += 1
+        call_id = f"call-{self._call_ids}"
+        sent = time.perf_counter()
+        await self._send(
+            websocket,
+            {
+                "toolCall": {
+                    "functionCalls": [
+                        {"id": call_id, "name": self.tool_call, "args": self.tool_args}
+                    ]
+                }
+            },
+        )
+        while True:
+            responses = await tool_responses.get()
+            if any(response.get("id") == call_id for response in responses):
+                break
+        self.stats.tool_latencies.append(time.perf_counter() - sent)
+
+    async def _respond(self, websocket, tool_responses: asyncio.Queue) -> None:
+        """Streams one model turn of audio at (scaled) real-time pace."""
+        interval = self.chunk_ms / 1000 / self.speed
+        chunks = max(int(self.response_seconds * 1000 / self.chunk_ms), 1)
+        if self.tool_call:
+            await self._call_tool(websocket, tool_responses)
+        if self.response_delay:
+            await asyncio.sleep(self.response_delay / self.speed)
+        started = time.perf_counter()
+        for n in range(chunks):
+            await self._send(
+                websocket,
+                {
+                    "serverContent": {
+                        "modelTurn": {
+                            "parts": [
+                                {
+                                    "inlineData": {
+                                        "mimeType": f"audio/pcm;rate={RECEIVE_SAMPLE_RATE}",
+                                        "data": self._chunk_b64,
+                                    }
+                                }
+                            ]
+                        }
+                    },
+                    TIMESTAMP_KEY: time.perf_counter(),
+                },
+            )
+            # Pace against the start time so scheduling delays do not add up
+            delay = started + (n + 1) * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await self._send(websocket, {"serverContent": {"turnComplete": True}})
+
+    async def _close_later(self, websocket) -> None:
+        """Closes the connection mid-session, like a restarting server."""
+        await asyncio.sleep(self.close_after)
+        self.stats.closes += 1
+        await websocket.close(self.close_code, "closing after --close-after")
+
+    async def handle(self, websocket) -> None:
+        """Handles one upstream session."""
+        self.stats.sessions += 1
+        audio_bytes = 0
+        responding = None
+        closing = None
+        tool_responses = asyncio.Queue()
+        try:
+            async for frame in websocket:
+                received = time.perf_counter()
+                self.stats.messages_in += 1
+                self.stats.bytes_in += len(frame)
+                sent = read_timestamp(frame)
+                if sent is not None:
+                    self.stats.uplink_latencies.append(received - sent)
+                message = json.loads(frame)
+
+                if "setup" in message:
+                    self.stats.setups += 1
+                    await self._send(websocket, {"setupComplete": {}})
+                    if self.close_after and closing is None:
+                        closing = asyncio.create_task(self._close_later(websocket))
+                    continue
+
+                tool_response = message.get("tool_response") or message.get("toolResponse")
+                if tool_response:
+                    tool_responses.put_nowait(
+                        tool_response.get("function_responses")
+                        or tool_response.get("functionResponses", [])
+                    )
+                    continue
+
+                realtime_input = message.get("realtime_input") or message.get(
+                    "realtimeInput"
+                )
+                if not realtime_input:
+                    continue
+                chunks = realtime_input.get("media_chunks") or realtime_input.get(
+                    "mediaChunks", []
+                )
+                for chunk in chunks:
+                    mime_type = chunk.get("mime_type") or chunk.get("mimeType", "")
+                    if mime_type.startswith("audio/pcm"):
+                        # Size of the decoded PCM without decoding it
+                        audio_bytes += len(chunk["data"]) * 3 // 4
+                # 16-bit mono samples at 16 kHz
+                if audio_bytes >= self.turn_seconds * SEND_SAMPLE_RATE * 2:
+                    audio_bytes = 0
+                    if responding is None or responding.done():
+                        responding = asyncio.create_task(
+                            self._respond(websocket, tool_responses)
+                        )
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            if responding is not None:
+                responding.cancel()
+            if closing is not None:
+                closing.cancel()
+
+    async def _delay_handshake(self, connection, request) -> None:
+        if self.connect_delay:
+            await asyncio.sleep(self.connect_delay)
+
+    async def serve(self, host: str = "localhost", port: int = 9000):
+        """Starts listening; returns the websockets server."""
+        return await websockets.serve(
+            self.handle,
+            host,
+            port,
+            max_size=None,
+            process_request=self._delay_handshake,
+        )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--turn-seconds", type=float, default=2.0,
+                        help="seconds of input audio that trigger a model turn")
+    parser.add_argument("--response-seconds", type=float, default=1.0,
+                        help="seconds of 24 kHz audio in each model turn")
+    parser.add_argument("--chunk-ms", type=int, default=40,
+                        help="duration of each serverContent audio chunk")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="playback pacing factor (1.0 = real time)")
+    parser.add_argument("--connect-delay", type=float, default=0.0,
+                        help="seconds added to every opening handshake")
+    parser.add_argument("--response-delay", type=float, default=0.0,
+                        help="seconds from the triggering input to the first audio of a turn")
+    parser.add_argument("--tool-call",
+                        help="function called at the start of every turn, e.g. get_weather")
+    parser.add_argument("--tool-args", type=json.loads, default={"city": "London"},
+                        help="JSON arguments of the --tool-call function")
+    parser.add_argument("--close-after", type=float, default=0.0,
+                        help="seconds after the setup at which every connection is closed")
+    parser.add_argument("--close-code", type=int, default=1012,
+                        help="close code sent with --close-after (1012 = service restart)")
+    args = parser.parse_args()
+
+    upstream = MockUpstream(
+        turn_seconds=args.turn_seconds,
+        response_seconds=args.response_seconds,
+        chunk_ms=args.chunk_ms,
+        speed=args.speed,
+        connect_delay=args.connect_delay,
+        response_delay=args.response_delay,
+        tool_call=args.tool_call,
+        tool_args=args.tool_args,
+        close_after=args.close_after,
+        close_code=args.close_code,
+    )
+    server = await upstream.serve(args.host, args.port)
+    print(f"Mock upstream listening on ws://{args.host}:{args.port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,260 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Replays a session recording (PROXY_RECORD_DIR) through proxy.py.
+
+The recorded client frames are sent to the proxy, and a local stand-in
+upstream answers with the recorded server frames. Each server frame waits
+for the control messages (setup, client_content, tool_response) that came
+before it in the recording; realtime_input is not used for ordering because
+the proxy may merge or drop it. Frames are sent at their original pace
+scaled by --speed, or as fast as possible with --fast.
+
+Usage:
+    python replay.py recordings/session-....rec
+    python replay.py recordings/session-....rec --fast --sessions 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import websockets
+
+from loadtest import free_port, percentile, process_usage, start_proxy, wait_for_port
+
+PROXY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROXY_DIR)
+
+from frames import CLIENT_CONTENT, SETUP, TOOL_RESPONSE  # noqa: E402
+from recorder import DOWNLINK, UPLINK, read_recording  # noqa: E402
+
+# Client messages the model reacts to; they are never merged or dropped
+_CONTROL_TYPES = (SETUP, CLIENT_CONTENT, TOOL_RESPONSE)
+
+# The upstream closes a session once the client is done and nothing more
+# arrived for this long
+_DRAIN_SECONDS = 0.2
+
+
+class Script:
+    """The two directions of a recording, ready to be replayed."""
+
+    def __init__(self, records) -> None:
+        self.uplink = []
+        # (timestamp, text, payload, control messages received before it)
+        self.downlink = []
+        controls = 0
+        for record in records:
+            if record.direction == UPLINK:
+                self.uplink.append((record.timestamp, record.text, record.payload))
+                if record.msg_type in _CONTROL_TYPES:
+                    controls += 1
+            elif record.direction == DOWNLINK:
+                self.downlink.append(
+                    (record.timestamp, record.text, record.payload, controls)
+                )
+        self.start = self.uplink[0][0] if self.uplink else 0.0
+        self.duration = records[-1].timestamp - self.start if records else 0.0
+
+
+async def _wait_until(started: float, timestamp: float, speed: float) -> None:
+    """Sleeps until `timestamp` (recording time) at the given speed."""
+    if speed:
+        delay = started + timestamp / speed - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class ReplayUpstream:
+    """Stand-in upstream that answers every session with the recorded frames."""
+
+    def __init__(self, script: Script, speed: float) -> None:
+        self.script = script
+        self.speed = speed
+        self.frames_in = 0
+        self.frames_out = 0
+        self.clients_done = 0
+
+    async def handle(self, websocket) -> None:
+        """Replays the downlink of the recording on one upstream connection."""
+        controls = 0
+        last_frame = time.perf_counter()
+        progress = asyncio.Condition()
+        first_frame = asyncio.get_running_loop().create_future()
+
+        async def receive():
+            try:
+                await _receive()
+            finally:
+                if not first_frame.done():
+                    first_frame.cancel()
+
+        async def _receive():
+            nonlocal controls, last_frame
+            async for frame in websocket:
+                last_frame = time.perf_counter()
+                self.frames_in += 1
+                if not first_frame.done():
+                    first_frame.set_result(last_frame)
+                if not frame.startswith(
+                    b'{"realtime_input"' if isinstance(frame, bytes) else '{"realtime_input"'
+                ):
+                    async with progress:
+                        controls += 1
+                        progress.notify_all()
+
+        receiver = asyncio.create_task(receive())
+        try:
+            # Pooled connections idle until a client session starts
+            started = await first_frame - self.script.start / (self.speed or 1)
+            for timestamp, text, payload, needed in self.script.downlink:
+                async with progress:
+                    await progress.wait_for(lambda: controls >= needed or receiver.done())
+                await _wait_until(started, timestamp, self.speed)
+                await websocket.send(bytes(payload), text=text)
+                self.frames_out += 1
+            # Let the rest of the client's frames arrive before closing
+            while receiver.done() is False and (
+                self.clients_done == 0
+                or time.perf_counter() - last_frame < _DRAIN_SECONDS
+            ):
+                await asyncio.sleep(_DRAIN_SECONDS / 4)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            receiver.cancel()
+            await websocket.close()
+
+    async def serve(self, host: str, port: int):
+        return await websockets.serve(self.handle, host, port, max_size=None)
+
+
+class ClientStats:
+    def __init__(self) -> None:
+        self.sent = 0
+        self.received = 0
+        self.received_bytes = 0
+        self.durations = []
+        self.errors = 0
+
+
+async def replay_client(url: str, script: Script, speed: float, stats: ClientStats,
+                        upstream: ReplayUpstream) -> None:
+    """Sends the uplink of the recording and reads everything sent back."""
+    started = time.perf_counter()
+    try:
+        async with websockets.connect(url, max_size=None) as websocket:
+
+            async def receive():
+                async for frame in websocket:
+                    stats.received += 1
+                    stats.received_bytes += len(frame)
+
+            receiver = asyncio.create_task(receive())
+            base = time.perf_counter() - script.start / (speed or 1)
+            for timestamp, text, payload in script.uplink:
+                await _wait_until(base, timestamp, speed)
+                await websocket.send(bytes(payload), text=text)
+                stats.sent += 1
+            upstream.clients_done += 1
+            # The upstream closes the session once it has replayed everything
+            await receiver
+    except Exception as e:
+        stats.errors += 1
+        print(f"Client error: {e!r}", file=sys.stderr)
+    stats.durations.append(time.perf_counter() - started)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("recording")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="pacing factor relative to the recording (2.0 = twice as fast)")
+    parser.add_argument("--fast", action="store_true",
+                        help="send every frame as soon as possible")
+    parser.add_argument("--sessions", type=int, default=1,
+                        help="concurrent replays of the recording")
+    parser.add_argument("--proxy-url",
+                        help="use an already running proxy instead of starting one")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="PROXY_WORKERS for the started proxy")
+    parser.add_argument("--upstream-port", type=int, default=0)
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    args = parser.parse_args()
+    speed = 0.0 if args.fast else args.speed
+
+    metadata, records = read_recording(args.recording)
+    script = Script(records)
+    upstream = ReplayUpstream(script, speed)
+    upstream_port = args.upstream_port or free_port()
+    server = await upstream.serve("127.0.0.1", upstream_port)
+
+    proxy = None
+    if args.proxy_url:
+        url = args.proxy_url
+    else:
+        proxy_port = free_port()
+        proxy = start_proxy(
+            upstream_port, proxy_port, {"PROXY_WORKERS": str(args.workers)}
+        )
+        await wait_for_port(proxy_port)
+        url = f"ws://127.0.0.1:{proxy_port}"
+    # Same extensions (audio_in, audio_out) as the recorded client
+    url = url.rstrip("/") + (metadata.get("path") or "/")
+
+    stats = ClientStats()
+    cpu_before, _ = process_usage(proxy.pid) if proxy else (float("nan"), 0)
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(
+            *(replay_client(url, script, speed, stats, upstream)
+              for _ in range(args.sessions))
+        )
+        elapsed = time.perf_counter() - started
+        cpu_after, rss = process_usage(proxy.pid) if proxy else (float("nan"), float("nan"))
+    finally:
+        if proxy:
+            proxy.terminate()
+            proxy.wait()
+        server.close()
+
+    results = {
+        "sessions": args.sessions,
+        "recorded_s": round(script.duration, 3),
+        "uplink_frames": len(script.uplink),
+        "downlink_frames": len(script.downlink),
+        "elapsed_s": round(elapsed, 3),
+        "session_p50_s": percentile(stats.durations, 0.5),
+        "speedup": script.duration * args.sessions / elapsed if elapsed else float("nan"),
+        "errors": stats.errors,
+        "frames_sent": stats.sent,
+        "frames_upstream_received": upstream.frames_in,
+        "frames_upstream_sent": upstream.frames_out,
+        "frames_received": stats.received,
+        "frames_per_s": (stats.sent + stats.received) / elapsed,
+        "proxy_cpu_s": cpu_after - cpu_before,
+        "proxy_rss_mb": rss / (1024 * 1024),
+    }
+    for key, value in results.items():
+        print(f"{key:>24}: {value:.3f}" if isinstance(value, float) else f"{key:>24}: {value}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
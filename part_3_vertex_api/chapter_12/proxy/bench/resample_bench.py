@@ -0,0 +1,100 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Throughput of the proxy's input audio conversion (resample.py) on one core.
+
+Streams a few seconds of noise through StreamResampler in client-sized
+chunks for each input format and reports input samples per second of CPU
+time, and how many real-time client streams that is per core.
+
+Usage:
+    python resample_bench.py
+    python resample_bench.py --chunk-ms 20 --seconds 30 --output resample.json
+"""
+import os
+
+# Measure a single core: keep NumPy's BLAS from starting threads
+for _variable in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_variable, "1")
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import sys  # noqa: E402
+import time  # noqa: E402
+
+import numpy as np  # noqa: E402
+
+PROXY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROXY_DIR)
+
+from resample import FLOAT32, INT16, AudioFormat, StreamResampler  # noqa: E402
+
+FORMATS = (
+    AudioFormat(48000, 2, FLOAT32),
+    AudioFormat(48000, 1, INT16),
+    AudioFormat(44100, 2, FLOAT32),
+    AudioFormat(44100, 1, INT16),
+    AudioFormat(24000, 1, INT16),
+    AudioFormat(16000, 2, FLOAT32),
+    AudioFormat(8000, 1, INT16),
+)
+
+
+def _signal(audio_format: AudioFormat, seconds: float) -> bytes:
+    rng = np.random.default_rng(0)
+    samples = rng.uniform(-0.5, 0.5, int(seconds * audio_format.rate) * audio_format.channels)
+    if audio_format.encoding == INT16:
+        return np.rint(samples * 32767).astype("<i2").tobytes()
+    return samples.astype("<f4").tobytes()
+
+
+def measure(audio_format: AudioFormat, seconds: float, chunk_ms: float) -> dict:
+    data = _signal(audio_format, seconds)
+    chunk = int(audio_format.rate * chunk_ms / 1000) * audio_format.frame_size
+    resampler = StreamResampler(audio_format)
+    started = time.process_time()
+    for offset in range(0, len(data), chunk):
+        resampler.process(data[offset : offset + chunk])
+    cpu = time.process_time() - started
+    samples = resampler.samples_in * audio_format.channels
+    return {
+        "format": f"{audio_format.rate}Hz/{audio_format.channels}ch/{audio_format.encoding}",
+        "input_samples_per_s": samples / cpu,
+        "realtime_streams_per_core": seconds / cpu,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--seconds", type=float, default=10.0,
+                        help="seconds of audio converted per format")
+    parser.add_argument("--chunk-ms", type=float, default=128.0,
+                        help="audio per client message (the browser sends 2048 samples)")
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = [measure(fmt, args.seconds, args.chunk_ms) for fmt in FORMATS]
+    print(f"{'format':>22} {'Msamples/s':>12} {'streams/core':>14}")
+    for result in results:
+        print(
+            f"{result['format']:>22} {result['input_samples_per_s'] / 1e6:>12.1f}"
+            f" {result['realtime_streams_per_core']:>14.0f}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Local stand-in for the weather service behind shared/weather-api.js.
+
+It answers POST requests whose JSON body holds the get_weather arguments
+({"city": "London"}) with the same fields getWeather() returns, derived
+from the city name so that repeated calls agree. `--delay` holds back every
+answer like a remote API. Connections are kept alive, so the proxy's pooled
+HTTP client can reuse them.
+
+Usage:
+    python weather_stand_in.py --port 8095 --delay 0.2
+    PROXY_TOOLS=get_weather=http://127.0.0.1:8095/weather python ../proxy.py
+"""
+import argparse
+import asyncio
+import json
+import zlib
+
+DESCRIPTIONS = ("clear sky", "few clouds", "scattered clouds", "light rain", "overcast clouds")
+
+
+def weather(city: str) -> dict:
+    """Returns made-up but stable weather for a city."""
+    seed = zlib.crc32(city.lower().encode())
+    return {
+        "temperature": round(seed % 400 / 10 - 5, 1),
+        "description": DESCRIPTIONS[seed % len(DESCRIPTIONS)],
+        "humidity": seed % 70 + 30,
+        "windSpeed": round(seed % 150 / 10, 1),
+        "city": city.title(),
+        "country": "XX",
+    }
+
+
+class WeatherStandIn:
+    """Serves the weather over HTTP/1.1; run it with serve()."""
+
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+        self.requests = 0
+        self.connections = 0
+
+    async def _answer(self, body: bytes):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        try:
+            city = json.loads(body or b"{}").get("city")
+        except (ValueError, AttributeError):
+            return 400, {"error": "expected a JSON object"}
+        if not city:
+            return 400, {"error": "missing city"}
+        return 200, weather(city)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answers the requests of one keep-alive connection."""
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                self.requests += 1
+                status, result = await self._answer(body)
+                payload = json.dumps(result).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Bad Request'}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode()
+                    + payload
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            # The server is shutting down with the connection still open
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8095):
+        """Starts listening; returns the asyncio server."""
+        return await asyncio.start_server(self.handle, host, port)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8095)
+    parser.add_argument("--delay", type=float, default=0.0,
+                        help="seconds before every answer")
+    args = parser.parse_args()
+
+    stand_in = WeatherStandIn(delay=args.delay)
+    server = await stand_in.serve(args.host, args.port)
+    print(f"Weather stand-in listening on http://{args.host}:{args.port}/weather")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Merging of small consecutive realtime_input audio chunks """
+import asyncio
+import time
+
+from config import env_float, env_int
+from frame_queue import FrameQueue, QueueClosed
+from frames import REALTIME_INPUT, extract_pcm_audio, wrap_pcm_audio
+
+# Longest time the first chunk of a merged frame may be held back (0 disables
+# coalescing).
+COALESCE_MAX_DELAY = env_float("PROXY_COALESCE_MAX_DELAY_MS", 30.0) / 1000
+# Merged frames are sent as soon as they hold this much PCM; larger chunks
+# (such as the browser's 2048-sample ones) are forwarded without waiting.
+COALESCE_TARGET_BYTES = env_int("PROXY_COALESCE_TARGET_BYTES", 3200)  # 100 ms
+
+
+async def coalesce_audio(queue: FrameQueue, message, received: float):
+    """
+    Merges `message` with the audio chunks that follow it in `queue`.
+
+    Waits at most until COALESCE_MAX_DELAY after `received` for more audio,
+    and stops early at the first non-audio message, which is returned so the
+    caller can send it right after the merged frame.
+
+    Returns (frame, merged_count, pending) where `frame` is None if
+    `message` is not a small audio chunk, and `pending` is the queue entry
+    that ended the merge (or None).
+    """
+    # Cheap size check first: base64 expands PCM by a third
+    if len(message) * 3 // 4 >= COALESCE_TARGET_BYTES:
+        return None, 1, None
+    pcm = extract_pcm_audio(message)
+    if pcm is None:
+        return None, 1, None
+
+    parts = [pcm]
+    size = len(pcm)
+    pending = None
+    deadline = received + COALESCE_MAX_DELAY
+    while size < COALESCE_TARGET_BYTES:
+        try:
+            entry = await queue.get(timeout=deadline - time.perf_counter())
+        except (asyncio.TimeoutError, QueueClosed):
+            break
+        next_message, (msg_type, _, _) = entry
+        more = extract_pcm_audio(next_message) if msg_type == REALTIME_INPUT else None
+        if more is None:
+            # Flush immediately on anything that is not audio
+            pending = entry
+            break
+        parts.append(more)
+        size += len(more)
+
+    if len(parts) == 1:
+        return None, 1, pending
+    return wrap_pcm_audio(b"".join(parts)), len(parts), pending
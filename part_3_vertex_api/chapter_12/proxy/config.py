@@ -0,0 +1,40 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Proxy settings, read from environment variables """
+import os
+
+
+def env_flag(name: str, default: bool) -> bool:
+    """Reads a boolean setting such as PROXY_PASSTHROUGH=false."""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def env_int(name: str, default: int) -> int:
+    """Reads an integer setting."""
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def env_float(name: str, default: float) -> float:
+    """Reads a float setting."""
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+# Forward frames byte-for-byte and classify them from a short prefix instead
+# of running json.loads/json.dumps on every message.
+PASSTHROUGH = env_flag("PROXY_PASSTHROUGH", True)
@@ -0,0 +1,136 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Process-wide, background-refreshed Vertex AI access token cache """
+import asyncio
+import datetime
+import os
+import time
+from typing import Optional
+
+import google.auth
+from google.auth.transport.requests import Request
+
+from config import env_float
+from metrics import TOKEN_REFRESH, TOKEN_REFRESH_ERRORS
+from proxy_log import log_exception
+
+# Refresh this many seconds before the token expires, so that connecting
+# clients never have to wait for the OAuth round trip.
+REFRESH_MARGIN = env_float("PROXY_TOKEN_REFRESH_MARGIN", 300.0)
+# Delay before retrying a failed background refresh.
+RETRY_DELAY = env_float("PROXY_TOKEN_RETRY_DELAY", 5.0)
+# Lifetime assumed for credentials that do not report an expiry.
+DEFAULT_LIFETIME = 3000.0
+# Fixed token used instead of Google credentials, e.g. when benchmarking
+# against the local stand-in upstream in bench/.
+STATIC_TOKEN = os.environ.get("PROXY_STATIC_TOKEN")
+
+
+class TokenCache:
+    """
+    Hands out a cached access token and keeps it fresh in the background.
+
+    The blocking google-auth calls run in a worker thread, and concurrent
+    refreshes are coalesced into a single in-flight request.
+    """
+
+    def __init__(self, static_token: Optional[str] = STATIC_TOKEN) -> None:
+        self._credentials = None
+        self._request = None
+        self._token: Optional[str] = static_token
+        # time.monotonic() deadline; a static token never expires
+        self._expires_at = float("inf") if static_token else 0.0
+        self._inflight: Optional[asyncio.Future] = None
+        self._background: Optional[asyncio.Task] = None
+
+    def _fresh(self) -> bool:
+        return self._token is not None and time.monotonic() < self._expires_at
+
+    async def get(self) -> str:
+        """Returns a valid token, refreshing only if the cache is empty or expired."""
+        if self._fresh():
+            return self._token
+        return await self.refresh()
+
+    async def refresh(self) -> str:
+        """Refreshes the token, joining a refresh that is already running."""
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._refresh())
+        # Shield the shared refresh so one cancelled caller does not abort it
+        # for everybody else waiting on it.
+        return await asyncio.shield(self._inflight)
+
+    async def _refresh(self) -> str:
+        started = time.perf_counter()
+        try:
+            token, lifetime = await asyncio.to_thread(self._refresh_blocking)
+            TOKEN_REFRESH.observe(time.perf_counter() - started)
+            self._token = token
+            self._expires_at = time.monotonic() + lifetime
+            return token
+        except Exception:
+            TOKEN_REFRESH_ERRORS.inc()
+            raise
+        finally:
+            self._inflight = None
+
+    def _refresh_blocking(self):
+        """Runs in a worker thread: loads default credentials and refreshes them."""
+        if self._credentials is None:
+            self._credentials, _ = google.auth.default()
+            # Reuse one transport (and its HTTP connection pool) for all refreshes
+            self._request = Request()
+        self._credentials.refresh(self._request)
+        expiry = self._credentials.expiry
+        if expiry is None:
+            lifetime = DEFAULT_LIFETIME
+        else:
+            # google-auth reports expiry as a naive UTC datetime
+            now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+            lifetime = (expiry - now).total_seconds()
+        return self._credentials.token, lifetime
+
+    def seconds_until_refresh(self) -> float:
+        """Returns how long the background task may sleep before refreshing."""
+        return max(self._expires_at - REFRESH_MARGIN - time.monotonic(), RETRY_DELAY)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+                await asyncio.sleep(self.seconds_until_refresh())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log_exception("access token refresh failed")
+                await asyncio.sleep(RETRY_DELAY)
+
+    def start(self) -> None:
+        """Starts the background refresh task on the running event loop."""
+        if self._background is None and self._expires_at != float("inf"):
+            self._background = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops the background refresh task."""
+        if self._background is not None:
+            self._background.cancel()
+            try:
+                await self._background
+            except asyncio.CancelledError:
+                pass
+            self._background = None
+
+
+# Shared by every connection handled by this process
+token_cache = TokenCache()
@@ -0,0 +1,150 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Bounded per-direction frame queue with watermarks and a drop policy """
+import asyncio
+import collections
+import time
+import weakref
+from typing import Optional
+
+from config import env_float, env_int
+
+# Once this many bytes are queued, stale video frames are dropped and the
+# reader stops reading (applying backpressure) ...
+HIGH_WATERMARK = env_int("PROXY_QUEUE_HIGH_WATERMARK", 512 * 1024)
+# ... until the writer has drained the queue back down to this many bytes.
+LOW_WATERMARK = env_int("PROXY_QUEUE_LOW_WATERMARK", 128 * 1024)
+# Seconds a finished direction may spend sending what is still queued
+# before the rest is dropped.
+DRAIN_TIMEOUT = env_float("PROXY_QUEUE_DRAIN_TIMEOUT", 5.0)
+
+
+# Every live queue, for the process-wide queue depth metric
+_queues = weakref.WeakSet()
+
+
+def total_queued_bytes() -> int:
+    """Returns the number of bytes queued across all sessions."""
+    return sum(queue.bytes for queue in list(_queues))
+
+
+class QueueClosed(Exception):
+    """Raised by get() once the queue is closed and empty."""
+
+
+class FrameQueue:
+    """
+    FIFO of frames between the reading and the writing side of one direction.
+
+    Frames marked droppable (video) are discarded oldest-first when the queue
+    goes over its high watermark, so that audio and control messages are
+    never lost; if that is not enough, put() waits until the writer has
+    drained the queue to its low watermark.
+    """
+
+    def __init__(
+        self, high_watermark: int = HIGH_WATERMARK, low_watermark: int = LOW_WATERMARK
+    ) -> None:
+        self.high_watermark = high_watermark
+        self.low_watermark = min(low_watermark, high_watermark)
+        self._frames = collections.deque()
+        self._droppable = 0  # droppable frames currently queued
+        self._not_empty = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._closed = False
+        self.bytes = 0
+        self.max_bytes = 0
+        self.dropped = 0
+        self.dropped_bytes = 0
+        _queues.add(self)
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def _drop_stale(self) -> None:
+        """Drops the oldest droppable frames until below the low watermark."""
+        if not self._droppable:
+            return
+        kept = collections.deque()
+        for entry in self._frames:
+            frame, droppable, _ = entry
+            if droppable and self.bytes > self.low_watermark:
+                self.bytes -= len(frame)
+                self._droppable -= 1
+                self.dropped += 1
+                self.dropped_bytes += len(frame)
+            else:
+                kept.append(entry)
+        self._frames = kept
+
+    async def put(self, frame, droppable: bool = False, context=None) -> bool:
+        """
+        Queues a frame; returns False if it was dropped.
+
+        `context` is handed back by get() together with the frame.
+        """
+        size = len(frame)
+        # A single frame larger than the budget is still accepted on its own
+        if self._frames and self.bytes + size > self.high_watermark:
+            self._drop_stale()
+            if self._frames and self.bytes + size > self.high_watermark:
+                if droppable:
+                    self.dropped += 1
+                    self.dropped_bytes += size
+                    return False
+                # Stop reading from the source until the writer catches up
+                self._drained.clear()
+                while not self._drained.is_set() and not self._closed:
+                    await self._drained.wait()
+        self._frames.append((frame, droppable, context))
+        self._droppable += droppable
+        self.bytes += size
+        self.max_bytes = max(self.max_bytes, self.bytes)
+        self._not_empty.set()
+        return True
+
+    async def get(self, timeout: Optional[float] = None):
+        """
+        Returns the next (frame, context), waiting for one if needed.
+
+        Raises asyncio.TimeoutError if `timeout` seconds pass without a frame.
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while not self._frames:
+            if self._closed:
+                raise QueueClosed()
+            self._not_empty.clear()
+            if deadline is None:
+                await self._not_empty.wait()
+                continue
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            try:
+                await asyncio.wait_for(self._not_empty.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        frame, droppable, context = self._frames.popleft()
+        self._droppable -= droppable
+        self.bytes -= len(frame)
+        if self.bytes <= self.low_watermark:
+            self._drained.set()
+        return frame, context
+
+    def close(self) -> None:
+        """Lets get() finish once the remaining frames are consumed."""
+        self._closed = True
+        self._not_empty.set()
+        self._drained.set()
@@ -0,0 +1,260 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Cheap classification of Live API frames without parsing them """
+import binascii
+import json
+import re
+import struct
+from typing import Optional
+
+# Every Live API message is a JSON object whose first key names the message
+# type, e.g. {"realtime_input": {...}} or {"serverContent": {...}}. The
+# interesting markers always appear near the start of the frame, so we only
+# ever look at a bounded prefix instead of the (possibly multi-MB) payload.
+SNIFF_LIMIT = 256
+
+SETUP = "setup"
+SETUP_COMPLETE = "setupComplete"
+REALTIME_INPUT = "realtime_input"
+CLIENT_CONTENT = "client_content"
+TOOL_RESPONSE = "tool_response"
+SERVER_CONTENT = "serverContent"
+TOOL_CALL = "toolCall"
+TOOL_CALL_CANCELLATION = "toolCallCancellation"
+UNKNOWN = "unknown"
+
+# The browser sends snake_case keys while Vertex AI answers in camelCase.
+# Both spellings are accepted by the API, so map them to one canonical name.
+_ALIASES = {
+    "realtimeInput": REALTIME_INPUT,
+    "clientContent": CLIENT_CONTENT,
+    "toolResponse": TOOL_RESPONSE,
+    "server_content": SERVER_CONTENT,
+    "tool_call": TOOL_CALL,
+    "tool_call_cancellation": TOOL_CALL_CANCELLATION,
+    "setup_complete": SETUP_COMPLETE,
+}
+
+_FIRST_KEY_STR = re.compile(r'\s*\{\s*"([A-Za-z_]+)"')
+_FIRST_KEY_BYTES = re.compile(rb'\s*\{\s*"([A-Za-z_]+)"')
+
+
+def sniff_message_type(frame) -> str:
+    """Returns the canonical message type of a text or binary frame."""
+    if isinstance(frame, str):
+        match = _FIRST_KEY_STR.match(frame, 0, SNIFF_LIMIT)
+        key = match.group(1) if match else None
+    else:
+        match = _FIRST_KEY_BYTES.match(frame, 0, SNIFF_LIMIT)
+        key = match.group(1).decode("ascii") if match else None
+    if key is None:
+        return UNKNOWN
+    return _ALIASES.get(key, key)
+
+
+def prefix_contains(frame, marker: str) -> bool:
+    """Checks whether `marker` occurs within the sniffed prefix of a frame."""
+    if isinstance(frame, str):
+        return frame.find(marker, 0, SNIFF_LIMIT) != -1
+    return frame.find(marker.encode("ascii"), 0, SNIFF_LIMIT) != -1
+
+
+def has_inline_data(frame) -> bool:
+    """Checks whether a serverContent frame carries inline (audio) data."""
+    return prefix_contains(frame, '"inlineData"') or prefix_contains(
+        frame, '"inline_data"'
+    )
+
+
+def is_video_frame(frame) -> bool:
+    """Checks whether a realtime_input frame carries an image (video frame)."""
+    return prefix_contains(frame, '"image/')
+
+
+# How a serverContent message ends the model's turn, as returned by turn_end()
+TURN_COMPLETE = "complete"
+TURN_INTERRUPTED = "interrupted"
+
+_TURN_MARKERS_STR = re.compile(r'"(turnComplete|turn_complete|interrupted)"\s*:\s*true')
+_TURN_MARKERS_BYTES = re.compile(rb'"(turnComplete|turn_complete|interrupted)"\s*:\s*true')
+
+
+def turn_end(frame) -> Optional[str]:
+    """
+    Returns TURN_COMPLETE or TURN_INTERRUPTED if a serverContent frame ends
+    the model's turn, else None. The flags follow the (large) model turn
+    when a message carries both, so both ends of the frame are checked.
+    """
+    pattern = _TURN_MARKERS_STR if isinstance(frame, str) else _TURN_MARKERS_BYTES
+    match = pattern.search(frame, 0, SNIFF_LIMIT) or pattern.search(
+        frame, max(len(frame) - SNIFF_LIMIT, 0)
+    )
+    if match is None:
+        return None
+    marker = match.group(1)
+    if marker in ("interrupted", b"interrupted"):
+        return TURN_INTERRUPTED
+    return TURN_COMPLETE
+
+
+# An audio/pcm mime type with parameters other than plain rate=16000
+_AUDIO_PARAMETERS_STR = re.compile(r'"audio/pcm;(?!rate=16000")')
+_AUDIO_PARAMETERS_BYTES = re.compile(rb'"audio/pcm;(?!rate=16000")')
+
+
+def declares_audio_format(frame) -> bool:
+    """
+    Checks whether a realtime_input frame carries audio declared with a
+    rate, channel count or encoding other than 16 kHz mono int16. The mime
+    type may come before or after the (large) data, so both ends are checked.
+    """
+    pattern = _AUDIO_PARAMETERS_STR if isinstance(frame, str) else _AUDIO_PARAMETERS_BYTES
+    return (
+        pattern.search(frame, 0, SNIFF_LIMIT) is not None
+        or pattern.search(frame, max(len(frame) - SNIFF_LIMIT, 0)) is not None
+    )
+
+
+# realtime_input envelope for raw PCM received as a binary frame; the base64
+# payload is spliced in between without building any intermediate dict/str.
+# It is also exactly what the browser's sendAudioChunk() produces.
+_PCM_PREFIX = b'{"realtime_input":{"media_chunks":[{"mime_type":"audio/pcm","data":"'
+_PCM_SUFFIX = b'"}]}}'
+_PCM_PREFIX_STR = _PCM_PREFIX.decode("ascii")
+_PCM_SUFFIX_STR = _PCM_SUFFIX.decode("ascii")
+
+# Mime types of 16 kHz int16 input audio that may be merged together
+_PCM_MIME_TYPES = ("audio/pcm", "audio/pcm;rate=16000")
+
+
+def wrap_pcm_audio(pcm: bytes) -> bytes:
+    """Wraps raw 16 kHz int16 PCM into a realtime_input message (UTF-8 bytes)."""
+    return b"".join((_PCM_PREFIX, binascii.b2a_base64(pcm, newline=False), _PCM_SUFFIX))
+
+
+def extract_pcm_audio(frame) -> Optional[bytes]:
+    """
+    Returns the decoded PCM of a realtime_input message that carries only
+    16 kHz audio chunks, or None for any other message, including ones
+    that are malformed (these are forwarded as they are).
+    """
+    if isinstance(frame, str):
+        prefix, suffix = _PCM_PREFIX_STR, _PCM_SUFFIX_STR
+    else:
+        prefix, suffix = _PCM_PREFIX, _PCM_SUFFIX
+    # Fast path: the exact envelope sent by the browser and wrap_pcm_audio()
+    if frame.startswith(prefix) and frame.endswith(suffix):
+        payload = frame[len(prefix) : -len(suffix)]
+        if payload.find('"' if isinstance(payload, str) else b'"') == -1:
+            try:
+                return binascii.a2b_base64(payload)
+            except (binascii.Error, ValueError):
+                return None
+        return None
+    if not prefix_contains(frame, "audio/pcm"):
+        return None
+    # Slow path: any other spelling of an audio-only realtime_input message
+    try:
+        message = json.loads(frame)
+    except ValueError:
+        return None
+    if not isinstance(message, dict) or len(message) != 1:
+        return None
+    realtime_input = message.get("realtime_input") or message.get("realtimeInput")
+    if not isinstance(realtime_input, dict) or len(realtime_input) != 1:
+        return None
+    chunks = realtime_input.get("media_chunks") or realtime_input.get("mediaChunks")
+    if not isinstance(chunks, list) or not chunks:
+        return None
+    pcm = []
+    try:
+        for chunk in chunks:
+            mime_type = chunk.get("mime_type") or chunk.get("mimeType")
+            if mime_type not in _PCM_MIME_TYPES or len(chunk) != 2:
+                return None
+            pcm.append(binascii.a2b_base64(chunk["data"]))
+    except (binascii.Error, ValueError, AttributeError, KeyError, TypeError):
+        return None
+    return b"".join(pcm)
+
+
+# Header of the binary audio frames sent to clients that negotiated
+# audio_out=pcm16, followed by raw little-endian int16 PCM:
+# version, flags, turn number, sequence number within the turn, sample rate.
+AUDIO_HEADER = struct.Struct("<BBHII")
+AUDIO_HEADER_VERSION = 1
+# Set on the last audio frame of a message that also completes the turn
+AUDIO_FLAG_TURN_COMPLETE = 0x01
+
+# Vertex AI answers with 24 kHz audio unless the mime type says otherwise
+DEFAULT_OUTPUT_RATE = 24000
+_RATE = re.compile(r"rate=(\d+)")
+
+
+def split_inline_audio(frame):
+    """
+    Separates the inline PCM audio of a serverContent message from the rest.
+
+    Returns (chunks, remainder) where `chunks` is a list of
+    (sample_rate, pcm) and `remainder` is the parsed message without those
+    parts, or None if nothing else is left. Returns None if the message
+    carries no PCM audio.
+    """
+    try:
+        message = json.loads(frame)
+    except ValueError:
+        return None
+    server_content = message.get("serverContent") or message.get("server_content")
+    if not isinstance(server_content, dict):
+        return None
+    turn_key = "modelTurn" if "modelTurn" in server_content else "model_turn"
+    model_turn = server_content.get(turn_key)
+    if not isinstance(model_turn, dict):
+        return None
+
+    chunks = []
+    kept = []
+    for part in model_turn.get("parts") or ():
+        inline = part.get("inlineData") or part.get("inline_data")
+        mime_type = ""
+        if isinstance(inline, dict):
+            mime_type = inline.get("mimeType") or inline.get("mime_type") or ""
+        if not mime_type.startswith("audio/pcm") or len(part) != 1:
+            kept.append(part)
+            continue
+        rate = _RATE.search(mime_type)
+        chunks.append(
+            (
+                int(rate.group(1)) if rate else DEFAULT_OUTPUT_RATE,
+                binascii.a2b_base64(inline.get("data", "")),
+            )
+        )
+    if not chunks:
+        return None
+
+    if kept:
+        model_turn["parts"] = kept
+    else:
+        del server_content[turn_key]
+    if not server_content and len(message) == 1:
+        return chunks, None
+    return chunks, message
+
+
+def pack_audio_frame(turn: int, sequence: int, rate: int, pcm: bytes, flags: int = 0) -> bytes:
+    """Builds a binary audio frame: AUDIO_HEADER followed by the PCM."""
+    header = AUDIO_HEADER.pack(
+        AUDIO_HEADER_VERSION, flags, turn & 0xFFFF, sequence & 0xFFFFFFFF, rate
+    )
+    return header + pcm
@@ -0,0 +1,276 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Session liveness: heartbeats, idle timeouts and eviction """
+import asyncio
+import logging
+import math
+import time
+from typing import Optional
+
+import metrics
+from config import env_float, env_int
+from proxy_log import log, log_exception
+
+# Seconds between pings of each session's client and upstream sockets
+# (0 leaves keepalive pings to the websockets library).
+HEARTBEAT_INTERVAL = env_float("PROXY_HEARTBEAT_INTERVAL", 30.0)
+# Seconds to wait for a pong before the socket counts as stale.
+HEARTBEAT_TIMEOUT = env_float("PROXY_HEARTBEAT_TIMEOUT", 10.0)
+# Pings awaiting their pong at the same time, across all sessions.
+HEARTBEAT_CONCURRENCY = env_int("PROXY_HEARTBEAT_CONCURRENCY", 256)
+# Sessions without any frame in either direction for this long are closed
+# (0 disables).
+IDLE_TIMEOUT = env_float("PROXY_IDLE_TIMEOUT", 0.0)
+# Sessions without audio or video in either direction for this long are
+# closed (0 disables).
+MEDIA_TIMEOUT = env_float("PROXY_MEDIA_TIMEOUT", 0.0)
+
+# Seconds between "active sessions" log records
+SUMMARY_INTERVAL = 30.0
+
+# Reasons a session is evicted, used as metric label values
+STALE = "stale"
+IDLE = "idle"
+NO_MEDIA = "no_media"
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel with `resolution`-second slots.
+
+    schedule() and cancel() are O(1); each tick only looks at the entries of
+    one slot, so the cost does not grow with the number of idle sessions.
+    Entries further out than one rotation stay in their slot until due.
+    """
+
+    def __init__(self, slots: int = 64, resolution: float = 1.0) -> None:
+        self.resolution = resolution
+        self._slots = [dict() for _ in range(slots)]
+        self._where = {}  # key -> slot index
+        self._last_tick = None
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def schedule(self, key, deadline: float) -> None:
+        self.cancel(key)
+        # The first tick at or after the deadline
+        index = math.ceil(deadline / self.resolution) % len(self._slots)
+        self._slots[index][key] = deadline
+        self._where[key] = index
+
+    def cancel(self, key) -> None:
+        index = self._where.pop(key, None)
+        if index is not None:
+            del self._slots[index][key]
+
+    def expired(self, now: float):
+        """
+        Removes and returns the keys that are due, looking at every slot
+        passed since the previous call (ticks may be late).
+        """
+        tick = int(now / self.resolution)
+        first = tick if self._last_tick is None else self._last_tick + 1
+        first = max(first, tick - len(self._slots) + 1)
+        self._last_tick = tick
+        due = []
+        for passed in range(first, tick + 1):
+            slot = self._slots[passed % len(self._slots)]
+            for key in [key for key, deadline in slot.items() if deadline <= now]:
+                del slot[key]
+                del self._where[key]
+                due.append(key)
+        return due
+
+
+def _abort(websocket) -> None:
+    """Drops a connection without a closing handshake, freeing its socket."""
+    abort = getattr(websocket, "abort", None)
+    if abort is not None:
+        abort()
+        return
+    transport = getattr(websocket, "transport", None)
+    if transport is not None:
+        transport.abort()
+
+
+class _Entry:
+    __slots__ = ("session", "upstream", "next_heartbeat", "heartbeat")
+
+    def __init__(self, session, upstream, now: float) -> None:
+        self.session = session
+        self.upstream = upstream
+        self.next_heartbeat = now + HEARTBEAT_INTERVAL
+        self.heartbeat: Optional[asyncio.Task] = None
+
+
+class LivenessMonitor:
+    """
+    Watches every proxied session from a single timer wheel.
+
+    Each session is due at the earliest of its next heartbeat, idle deadline
+    and media deadline. Heartbeats ping the client and the upstream socket
+    concurrently, limited to HEARTBEAT_CONCURRENCY outstanding pings. A
+    socket that misses its pong is aborted: a dead client ends the session,
+    a dead upstream is reconnected if PROXY_RECONNECT is on. Sessions idle
+    for too long are closed.
+    """
+
+    def __init__(self) -> None:
+        self._entries = {}  # session id -> _Entry
+        self._wheel = TimerWheel()
+        self._pings = asyncio.Semaphore(HEARTBEAT_CONCURRENCY)
+        self._runner: Optional[asyncio.Task] = None
+        self._tasks = set()
+        self.stale = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def register(self, session, upstream) -> None:
+        """Starts watching a session whose proxy tasks are running."""
+        now = time.perf_counter()
+        session.last_activity = session.last_media = now
+        entry = _Entry(session, upstream, now)
+        self._entries[session.id] = entry
+        self._schedule(entry, now)
+
+    def unregister(self, session) -> None:
+        entry = self._entries.pop(session.id, None)
+        if entry is not None:
+            self._wheel.cancel(session.id)
+            if entry.heartbeat is not None:
+                entry.heartbeat.cancel()
+
+    def _schedule(self, entry: _Entry, now: float) -> None:
+        session = entry.session
+        deadlines = []
+        if HEARTBEAT_INTERVAL:
+            deadlines.append(entry.next_heartbeat)
+        if IDLE_TIMEOUT:
+            deadlines.append(session.last_activity + IDLE_TIMEOUT)
+        if MEDIA_TIMEOUT:
+            deadlines.append(session.last_media + MEDIA_TIMEOUT)
+        if deadlines:
+            # Deadlines never fall before the next tick
+            self._wheel.schedule(session.id, max(min(deadlines), now))
+
+    def _spawn(self, coroutine) -> asyncio.Task:
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _evict(self, entry: _Entry, reason: str, idle: float) -> None:
+        self.unregister(entry.session)
+        self.evicted += 1
+        metrics.SESSIONS_EVICTED.labels(reason).inc()
+        log(
+            logging.INFO,
+            "session evicted",
+            session=entry.session.id,
+            reason=reason,
+            idle_s=round(idle, 1),
+        )
+        self._spawn(entry.session.client.close(code=1000, reason=f"{reason} timeout"))
+
+    async def _ping(self, websocket) -> bool:
+        async with self._pings:
+            try:
+                pong = await websocket.ping()
+                await asyncio.wait_for(pong, HEARTBEAT_TIMEOUT)
+                return True
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                return False
+
+    async def _heartbeat(self, entry: _Entry) -> None:
+        sides = (("client", entry.session.client), ("upstream", entry.upstream))
+        results = await asyncio.gather(*(self._ping(ws) for _, ws in sides))
+        for (side, websocket), alive in zip(sides, results):
+            if alive:
+                continue
+            self.stale += 1
+            metrics.STALE_CONNECTIONS.labels(side).inc()
+            log(logging.WARNING, "stale connection", session=entry.session.id, side=side)
+            _abort(websocket)
+            if side == "client":
+                # The proxy tasks end on their own once the socket is gone
+                entry.heartbeat = None
+                self.unregister(entry.session)
+                metrics.SESSIONS_EVICTED.labels(STALE).inc()
+                self.evicted += 1
+                return
+        entry.heartbeat = None
+
+    def _check(self, entry: _Entry, now: float) -> None:
+        session = entry.session
+        if IDLE_TIMEOUT and now - session.last_activity >= IDLE_TIMEOUT:
+            self._evict(entry, IDLE, now - session.last_activity)
+            return
+        if MEDIA_TIMEOUT and now - session.last_media >= MEDIA_TIMEOUT:
+            self._evict(entry, NO_MEDIA, now - session.last_media)
+            return
+        if HEARTBEAT_INTERVAL and now >= entry.next_heartbeat:
+            entry.next_heartbeat = now + HEARTBEAT_INTERVAL
+            # A slow peer only delays its own session's heartbeat
+            if entry.heartbeat is None:
+                entry.heartbeat = self._spawn(self._heartbeat(entry))
+        self._schedule(entry, now)
+
+    async def _run(self) -> None:
+        resolution = self._wheel.resolution
+        last_summary = time.perf_counter()
+        while True:
+            await asyncio.sleep(resolution - time.perf_counter() % resolution)
+            now = time.perf_counter()
+            if now - last_summary >= SUMMARY_INTERVAL:
+                last_summary = now
+                log(
+                    logging.INFO,
+                    "active sessions",
+                    count=len(self._entries),
+                    stale=self.stale,
+                    evicted=self.evicted,
+                )
+            for session_id in self._wheel.expired(now):
+                entry = self._entries.get(session_id)
+                if entry is None:
+                    continue
+                try:
+                    self._check(entry, now)
+                except Exception:
+                    log_exception("liveness check failed", session=session_id)
+
+    def start(self) -> None:
+        if self._runner is None:
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        for task in list(self._tasks):
+            task.cancel()
+        self._tasks.clear()
+
+
+# Shared by all sessions of this process
+monitor = LivenessMonitor()
@@ -0,0 +1,359 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Proxy metrics in the Prometheus text format, served over HTTP """
+import abc
+import asyncio
+import bisect
+import logging
+
+from config import env_int
+from frame_queue import total_queued_bytes
+from frames import (
+    CLIENT_CONTENT,
+    REALTIME_INPUT,
+    SERVER_CONTENT,
+    SETUP,
+    SETUP_COMPLETE,
+    TOOL_CALL,
+    TOOL_RESPONSE,
+)
+from proxy_log import dropped_records, log, log_exception
+from recorder import dropped_frames
+
+# Port of the /metrics endpoint (0 disables it).
+METRICS_PORT = env_int("PROXY_METRICS_PORT", 9091)
+
+# Message types reported as-is; anything else is counted as "other" so that
+# unexpected messages cannot blow up the number of time series.
+_KNOWN_TYPES = frozenset(
+    (
+        SETUP,
+        SETUP_COMPLETE,
+        REALTIME_INPUT,
+        CLIENT_CONTENT,
+        TOOL_RESPONSE,
+        SERVER_CONTENT,
+        TOOL_CALL,
+    )
+)
+
+# Seconds; spans sub-millisecond forwarding up to multi-second handshakes
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+# Seconds; whole conversational turns, up to the length of a long answer
+TURN_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.75,
+    1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 20.0, 30.0, 60.0,
+)
+
+
+# Every metric registers itself here on creation
+REGISTRY = []
+
+
+def message_type_label(msg_type: str) -> str:
+    """Maps a sniffed message type onto a bounded set of label values."""
+    return msg_type if msg_type in _KNOWN_TYPES else "other"
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Metric(abc.ABC):
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels=()) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._children = {}
+        REGISTRY.append(self)
+
+    def _init_unlabeled(self) -> None:
+        # Series without labels are reported (as zero) before first use
+        if not self.label_names:
+            self.labels()
+
+    def labels(self, *values):
+        """Returns the child series for the given label values."""
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    @abc.abstractmethod
+    def _new_child(self):
+        """Returns a new series of this metric's kind."""
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for values, child in sorted(self._children.items()):
+            yield from child.render(self.name, _format_labels(self.label_names, values))
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def render(self, name: str, labels: str):
+        yield f"{name}{labels} {self.value:g}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels=()) -> None:
+        super().__init__(name, help_text, labels)
+        self._init_unlabeled()
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels=(), callback=None) -> None:
+        super().__init__(name, help_text, labels)
+        # Optional function evaluated at scrape time instead of a stored value
+        self.callback = callback
+        self._init_unlabeled()
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def render(self):
+        if self.callback is not None:
+            self.set(self.callback())
+        yield from super().render()
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str):
+        prefix = labels[:-1] + "," if labels else "{"
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{prefix}le="{bound:g}"}} {cumulative}'
+        yield f'{name}_bucket{prefix}le="+Inf"}} {self.count}'
+        yield f"{name}_sum{labels} {self.sum:g}"
+        yield f"{name}_count{labels} {self.count}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        self._init_unlabeled()
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+
+ACTIVE_SESSIONS = Gauge("proxy_active_sessions", "Client sessions currently proxied.")
+SESSIONS = Counter("proxy_sessions_total", "Client sessions started.")
+MESSAGES = Counter(
+    "proxy_messages_total",
+    "Messages forwarded, by direction and message type.",
+    ("direction", "type"),
+)
+BYTES = Counter(
+    "proxy_bytes_total",
+    "Payload bytes forwarded, by direction and message type.",
+    ("direction", "type"),
+)
+FORWARD_LATENCY = Histogram(
+    "proxy_forward_latency_seconds",
+    "Time from receiving a message to handing it to the other socket.",
+    ("direction", "type"),
+)
+UPSTREAM_CONNECT = Histogram(
+    "proxy_upstream_connect_seconds",
+    "Time to obtain an upstream connection, from the pool or a new connect.",
+    ("source",),
+)
+UPSTREAM_RECONNECTS = Counter(
+    "proxy_upstream_reconnects_total",
+    "Sessions that lost their upstream connection mid-session, by result.",
+    ("result",),
+)
+UPSTREAM_RECONNECT_TIME = Histogram(
+    "proxy_upstream_reconnect_seconds",
+    "Time to reconnect upstream and replay the session's setup.",
+)
+SESSIONS_EVICTED = Counter(
+    "proxy_sessions_evicted_total",
+    "Sessions closed by the liveness monitor, by reason (stale, idle, no_media).",
+    ("reason",),
+)
+STALE_CONNECTIONS = Counter(
+    "proxy_stale_connections_total",
+    "Sockets that missed a heartbeat pong and were dropped, by side.",
+    ("side",),
+)
+TOKEN_REFRESH = Histogram(
+    "proxy_token_refresh_seconds",
+    "Duration of access token refreshes.",
+)
+TOKEN_REFRESH_ERRORS = Counter(
+    "proxy_token_refresh_errors_total", "Failed access token refreshes."
+)
+QUEUED_BYTES = Gauge(
+    "proxy_queued_bytes",
+    "Bytes waiting in per-session forwarding queues.",
+    callback=total_queued_bytes,
+)
+AUDIO_CHUNKS_COALESCED = Counter(
+    "proxy_audio_chunks_coalesced_total",
+    "Client audio chunks merged into a preceding chunk instead of sent alone.",
+)
+AUDIO_SAMPLES_CONVERTED = Counter(
+    "proxy_audio_samples_converted_total",
+    "Client audio samples resampled or downmixed to 16 kHz mono int16.",
+)
+TURN_LATENCY = Histogram(
+    "proxy_turn_latency_seconds",
+    "Stages of a model turn, timed from the last client input "
+    "(uplink, model, downlink, first_audio, turn_complete).",
+    ("stage",),
+    buckets=TURN_BUCKETS,
+)
+TURNS = Counter(
+    "proxy_turns_total",
+    "Model turns answering client input, by how they ended (complete, interrupted).",
+    ("result",),
+)
+TOOL_CALLS = Counter(
+    "proxy_tool_calls_total",
+    "Function calls answered by the proxy (PROXY_TOOLS), by tool and result (ok, cached, error).",
+    ("tool", "result"),
+)
+TOOL_CALL_TIME = Histogram(
+    "proxy_tool_call_seconds",
+    "Time to answer a function call in the proxy, including cache hits.",
+    ("tool",),
+)
+FRAMES_DROPPED = Counter(
+    "proxy_frames_dropped_total",
+    "Frames dropped because a forwarding queue was over its high watermark.",
+    ("direction", "type"),
+)
+VIDEO_FRAMES_FILTERED = Counter(
+    "proxy_video_frames_filtered_total",
+    "Client video frames not forwarded, by reason (duplicate, fps, bitrate).",
+    ("reason",),
+)
+LOG_DROPPED = Gauge(
+    "proxy_log_records_dropped",
+    "Log records dropped because the log writer fell behind.",
+    callback=dropped_records,
+)
+RECORD_DROPPED = Gauge(
+    "proxy_record_frames_dropped",
+    "Frames left out of session recordings because the writer fell behind.",
+    callback=dropped_frames,
+)
+
+
+def render() -> str:
+    """Returns all metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+async def _handle_http(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+) -> None:
+    try:
+        request_line = await reader.readline()
+        # Skip the request headers
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.split()
+        if len(parts) >= 2 and parts[1].split(b"?")[0] == b"/metrics":
+            status, body = "200 OK", render().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+    except Exception:
+        log_exception("metrics request failed")
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host: str = "0.0.0.0", port: int = METRICS_PORT):
+    """Starts the /metrics HTTP endpoint; returns the server, or None if disabled."""
+    if not port:
+        return None
+    server = await asyncio.start_server(_handle_http, host, port)
+    log(logging.INFO, "metrics server running", address=f"{host}:{port}")
+    return server
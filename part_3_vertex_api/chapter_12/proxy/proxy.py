@@ -14,231 +14,486 @@
 """ Vertex AI Gemini Multimodal Live WebSockets Proxy Server """
 import asyncio
 import json
-import ssl
-import traceback
+import logging
+import os
+import signal
+import socket
+import time
 import websockets
-import certifi
-import google.auth
-from google.auth.transport.requests import Request
-from websockets.legacy.protocol import WebSocketCommonProtocol
-from websockets.legacy.server import WebSocketServerProtocol
-
-
-print("DEBUG: proxy.py - Starting script...")  # Add print here
-
-
-HOST = "us-central1-aiplatform.googleapis.com"
-SERVICE_URL = f"wss://{HOST}/ws/google.cloud.aiplatform.v1beta1.LlmBidiService/BidiGenerateContent"
-
-DEBUG = True
+from websockets.asyncio.connection import Connection
+from websockets.asyncio.server import ServerConnection
+
+import metrics
+import proxy_log
+from coalesce import COALESCE_MAX_DELAY, coalesce_audio
+from config import PASSTHROUGH, env_int
+from credentials import token_cache
+from frame_queue import DRAIN_TIMEOUT, FrameQueue, QueueClosed
+from frames import (
+    CLIENT_CONTENT,
+    REALTIME_INPUT,
+    SERVER_CONTENT,
+    SETUP,
+    SETUP_COMPLETE,
+    TOOL_CALL,
+    TOOL_CALL_CANCELLATION,
+    declares_audio_format,
+    has_inline_data,
+    is_video_frame,
+    sniff_message_type,
+    turn_end,
+)
+from liveness import HEARTBEAT_INTERVAL, monitor as liveness_monitor
+from proxy_log import log, log_exception, log_frame, truncate
+from reconnect import RECONNECT, ResumableUpstream
+from recorder import DOWNLINK, UPLINK
+from regions import RegionRouter, configured_regions
+from resample import UnsupportedAudioFormat
+from session import CLIENT_TO_SERVER, SERVER_TO_CLIENT, Session
+from tools import executor as tool_executor
+from video import VIDEO_DEDUP, perceptual_available
+
+
+proxy_log.configure()
+log(logging.INFO, "proxy starting")
+
+
+# Upstream endpoints (PROXY_REGIONS, PROXY_REGION_URLS or PROXY_SERVICE_URL),
+# each with a pool of pre-connected sockets for new client sessions
+router = RegionRouter(configured_regions())
+metrics.Gauge(
+    "proxy_upstream_pool_idle",
+    "Pre-connected upstream connections waiting in the pools.",
+    callback=lambda: router.idle,
+)
 
 # Track active connections
 active_connections = set()
 
+# Number of worker processes sharing the listening port (1 = no supervisor)
+WORKERS = env_int("PROXY_WORKERS", 1)
+# Seconds the supervisor waits for workers to drain before killing them
+SHUTDOWN_TIMEOUT = env_int("PROXY_SHUTDOWN_TIMEOUT", 10)
+# A worker exiting sooner than this after starting is respawned with a delay
+RESPAWN_BACKOFF = 1.0
+
 
 async def get_access_token():
-    """Retrieves the access token for the currently authenticated account."""
+    """
+    Returns the access token for the currently authenticated account.
+
+    The token comes from the process-wide cache, which is refreshed in the
+    background, so no OAuth I/O happens on the connect path.
+    """
     try:
-        creds, _ = google.auth.default()  # Get the default credentials
-        if not creds.valid:
-            # Refresh the credentials if they're not valid
-            request = Request()
-            creds.refresh(request)
-        return creds.token
-    except Exception as e:
-        print(f"Error getting access token: {e}")
-        print(f"Full traceback:\n{traceback.format_exc()}")
+        return await token_cache.get()
+    except Exception:
+        log_exception("access token unavailable")
         raise
 
 
+async def _write_frames(
+    queue: FrameQueue,
+    target_websocket: Connection,
+    name: str,
+    session: Session,
+) -> None:
+    """
+    Sends queued frames to the target until the queue is closed and drained.
+    """
+    # e.g. "Client->Server" -> "client_to_server"
+    direction = name.lower().replace("->", "_to_")
+    # Small audio chunks from the client are merged into fewer upstream frames
+    coalesce = name == CLIENT_TO_SERVER and COALESCE_MAX_DELAY > 0
+    pending = None
+    try:
+        while True:
+            if pending is not None:
+                (message, (msg_type, received, as_text)), pending = pending, None
+            else:
+                message, (msg_type, received, as_text) = await queue.get()
+            if coalesce and msg_type == REALTIME_INPUT:
+                merged, count, pending = await coalesce_audio(queue, message, received)
+                if merged is not None:
+                    message, as_text = merged, True
+                    metrics.AUDIO_CHUNKS_COALESCED.inc(count - 1)
+            try:
+                if as_text:
+                    # Frames built by the proxy as UTF-8 bytes go out as text
+                    await target_websocket.send(message, text=True)
+                else:
+                    await target_websocket.send(message)
+            except Exception as e:
+                log(
+                    logging.WARNING,
+                    "send failed",
+                    session=session.id,
+                    direction=name,
+                    type=msg_type,
+                    error=e,
+                    payload=truncate(message),
+                )
+                raise
+
+            sent = time.perf_counter()
+            if msg_type == SERVER_CONTENT:
+                session.turns.server_content_sent(received, sent)
+            elif msg_type in (REALTIME_INPUT, CLIENT_CONTENT) and not is_video_frame(message):
+                session.turns.input_sent(sent)
+            type_label = metrics.message_type_label(msg_type)
+            metrics.FORWARD_LATENCY.labels(direction, type_label).observe(
+                sent - received
+            )
+            metrics.MESSAGES.labels(direction, type_label).inc()
+            metrics.BYTES.labels(direction, type_label).inc(len(message))
+    except QueueClosed:
+        pass
+    except websockets.exceptions.ConnectionClosed as e:
+        log(
+            logging.INFO,
+            "connection closed",
+            session=session.id,
+            direction=name,
+            code=e.code,
+            reason=e.reason,
+        )
+    except Exception:
+        log_exception("error sending message", session=session.id, direction=name)
+    finally:
+        # Unblock the reader if it is waiting for the queue to drain
+        queue.close()
+
+
 async def proxy_task(
-    source_websocket: WebSocketCommonProtocol,
-    target_websocket: WebSocketCommonProtocol,
-    name: str = "",
+    source_websocket: Connection,
+    target_websocket: Connection,
+    name: str,
+    session: Session,
 ) -> None:
     """
     Forwards messages from one WebSocket connection to another.
+
+    With PROXY_PASSTHROUGH enabled (the default) frames are forwarded exactly
+    as received and only classified by sniffing their first few bytes.
+    Frames pass through a bounded FrameQueue: when the target is too slow,
+    stale video frames are dropped and reading from the source pauses.
+    Client video frames are first deduplicated and rate limited (see
+    video.VideoFilter).
     """
+    direction = name.lower().replace("->", "_to_")
+    queue = FrameQueue()
+    writer = asyncio.create_task(
+        _write_frames(queue, target_websocket, name, session)
+    )
+    # Raw PCM from clients that negotiated audio_in=pcm16
+    wrap_binary_audio = name == CLIENT_TO_SERVER and session.binary_audio_in
+    # Client audio at other rates, channel counts or encodings
+    convert_audio = name == CLIENT_TO_SERVER
+    # Model audio as binary frames for clients that negotiated audio_out=pcm16
+    unwrap_audio = name == SERVER_TO_CLIENT and session.binary_audio_out
+    filter_video = name == CLIENT_TO_SERVER and session.video.enabled
+    # Function calls to PROXY_TOOLS are answered here, not by the client
+    intercept_tools = name == SERVER_TO_CLIENT and tool_executor.enabled
+    if name == CLIENT_TO_SERVER:
+        session.tools.upstream = queue
+    recording = session.recording
+    record_direction = UPLINK if name == CLIENT_TO_SERVER else DOWNLINK
     try:
         async for message in source_websocket:
+            received = time.perf_counter()
             try:
-                data = json.loads(message)
+                raw = message
+                as_text = False
+                if wrap_binary_audio and isinstance(message, bytes):
+                    message = session.wrap_client_audio(message)
+                    as_text = True
+                    msg_type = REALTIME_INPUT
+                else:
+                    msg_type = sniff_message_type(message)
+                if recording is not None:
+                    # Recorded as received, before any rewriting
+                    recording.record(
+                        record_direction, msg_type, raw, isinstance(raw, str)
+                    )
+                if (
+                    convert_audio
+                    and msg_type == REALTIME_INPUT
+                    and message is not None
+                    and declares_audio_format(message)
+                ):
+                    converted = session.convert_realtime_audio(message)
+                    if converted is not message:
+                        # Rebuilt frames are JSON and go out as text, even
+                        # when the client sent a binary frame
+                        as_text = True
+                    message = converted
+                if message is None:
+                    # Not enough converted audio for one sample yet; the
+                    # resampler carries it over to the next frame
+                    continue
+                if intercept_tools and msg_type == TOOL_CALL:
+                    message = session.tools.intercept(message)
+                    if message is None:
+                        # Every call is answered by the proxy
+                        session.last_activity = received
+                        continue
+                elif intercept_tools and msg_type == TOOL_CALL_CANCELLATION:
+                    session.tools.cancel(message)
+                # Only decode the frame when passthrough is disabled; the
+                # original bytes are forwarded otherwise.
+                data = None if PASSTHROUGH else json.loads(message)
 
                 # Log message type for debugging
-                if "setup" in data:
-                    print(f"{name} forwarding setup message")
-                    print(f"Setup message content: {json.dumps(data, indent=2)}")
-                elif "realtime_input" in data:
-                    print(f"{name} forwarding audio/video input")
-                elif "serverContent" in data:
-                    has_audio = "inlineData" in str(data)
-                    print(
-                        f"{name} forwarding server content"
-                        + (" with audio" if has_audio else "")
+                if msg_type == SETUP:
+                    session.setup_message = message
+                    log(
+                        logging.INFO,
+                        "setup",
+                        session=session.id,
+                        direction=name,
+                        payload=truncate(message),
                     )
+                elif msg_type == SETUP_COMPLETE:
+                    session.setup_completed = True
+                    log_frame(name, msg_type, message)
+                elif msg_type == SERVER_CONTENT:
+                    inline_data = has_inline_data(message)
+                    log_frame(name, msg_type, message, audio=inline_data)
                 else:
-                    print(f"{name} forwarding message type: {list(data.keys())}")
-                    print(f"Message content: {json.dumps(data, indent=2)}")
+                    log_frame(name, msg_type, message)
+
+                session.last_activity = received
+                if msg_type == REALTIME_INPUT or (
+                    msg_type == SERVER_CONTENT and inline_data
+                ):
+                    session.last_media = received
+
+                video = msg_type == REALTIME_INPUT and is_video_frame(message)
+                if msg_type in (REALTIME_INPUT, CLIENT_CONTENT) and not video:
+                    session.turns.client_input(received)
+                if filter_video and video:
+                    reason = await session.video.admit(message, received)
+                    if reason is not None:
+                        metrics.VIDEO_FRAMES_FILTERED.labels(reason).inc()
+                        log_frame(name, msg_type, message, filtered=reason)
+                        continue
+
+                forwarded = message if data is None else json.dumps(data)
+                if msg_type == SETUP and session.region is not None:
+                    # The model path names the Vertex AI location
+                    forwarded = session.region.adapt_setup(forwarded)
+                if unwrap_audio:
+                    # JSON goes out as text so the client can tell it apart
+                    # from the binary audio frames
+                    outgoing = [(forwarded, True)]
+                    if msg_type == SERVER_CONTENT:
+                        outgoing = session.unwrap_server_audio(forwarded, inline_data)
+                else:
+                    outgoing = [(forwarded, as_text)]
+                if msg_type == SERVER_CONTENT:
+                    session.turns.server_content(
+                        received, inline_data, turn_end(message), len(outgoing)
+                    )
 
-                # Forward the message
-                try:
-                    await target_websocket.send(json.dumps(data))
-                except Exception as e:
-                    print(f"\n{name} Error sending message:")
-                    print("=" * 80)
-                    print(f"Error details: {str(e)}")
-                    print("=" * 80)
-                    print(f"Message that failed: {json.dumps(data, indent=2)}")
-                    raise
-
-            except websockets.exceptions.ConnectionClosed as e:
-                print(f"\n{name} connection closed during message processing:")
-                print("=" * 80)
-                print(f"Close code: {e.code}")
-                print(f"Close reason (full):")
-                print("-" * 40)
-                print(e.reason)
-                print("=" * 80)
+                # Video frames may be dropped when the target falls behind;
+                # audio and control messages never are
+                for frame, frame_as_text in outgoing:
+                    queued = await queue.put(
+                        frame, video, (msg_type, received, frame_as_text)
+                    )
+                    if not queued:
+                        metrics.FRAMES_DROPPED.labels(
+                            direction, metrics.message_type_label(msg_type)
+                        ).inc()
+                        log_frame(name, msg_type, message, dropped=True)
+                if writer.done():
+                    # The target connection is gone
+                    break
+
+            except UnsupportedAudioFormat as e:
+                # Forwarding it would have the model hear noise
+                log(
+                    logging.WARNING,
+                    "unsupported audio format",
+                    session=session.id,
+                    mime_type=str(e),
+                )
+                await source_websocket.close(code=1003, reason="Unsupported audio format")
                 break
-            except Exception as e:
-                print(f"\n{name} Error processing message:")
-                print("=" * 80)
-                print(f"Error details: {str(e)}")
-                print(f"Full traceback:\n{traceback.format_exc()}")
-                print("=" * 80)
+            except Exception:
+                log_exception(
+                    "error processing message", session=session.id, direction=name
+                )
 
     except websockets.exceptions.ConnectionClosed as e:
-        print(f"\n{name} connection closed:")
-        print("=" * 80)
-        print(f"Close code: {e.code}")
-        print(f"Close reason (full):")
-        print("-" * 40)
-        print(e.reason)
-        print("=" * 80)
-    except Exception as e:
-        print(f"\n{name} Error:")
-        print("=" * 80)
-        print(f"Error details: {str(e)}")
-        print(f"Full traceback:\n{traceback.format_exc()}")
-        print("=" * 80)
+        log(
+            logging.INFO,
+            "connection closed",
+            session=session.id,
+            direction=name,
+            code=e.code,
+            reason=e.reason,
+        )
+    except Exception:
+        log_exception("proxy task failed", session=session.id, direction=name)
     finally:
-        # Clean up connections when done
-        print(f"{name} cleaning up connection")
-        if target_websocket in active_connections:
-            active_connections.remove(target_websocket)
+        # Let the writer send what is still queued, then clean up
+        queue.close()
         try:
-            await target_websocket.close()
-        except:
-            pass
+            # A stalled target must not hold up the session's teardown
+            await asyncio.wait_for(writer, DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            log(
+                logging.WARNING,
+                "queue drain timed out",
+                session=session.id,
+                direction=name,
+                queued_bytes=queue.bytes,
+            )
+        except asyncio.CancelledError:
+            writer.cancel()
+            raise
+        finally:
+            log(
+                logging.INFO,
+                "direction finished",
+                session=session.id,
+                direction=name,
+                dropped=queue.dropped,
+                dropped_bytes=queue.dropped_bytes,
+                max_queued_bytes=queue.max_bytes,
+            )
+            # Clean up connections when done
+            if target_websocket in active_connections:
+                active_connections.remove(target_websocket)
+            try:
+                await target_websocket.close()
+            except:
+                pass
 
 
 async def create_proxy(
-    client_websocket: WebSocketCommonProtocol, bearer_token: str
+    client_websocket: Connection, bearer_token: str, session: Session
 ) -> None:
     """
-    Establishes a WebSocket connection to the server and creates two tasks for
-    bidirectional message forwarding between the client and the server.
+    Takes a WebSocket connection to the server from the preferred region and
+    creates two tasks for bidirectional message forwarding between the
+    client and the server. With PROXY_RECONNECT the upstream side is
+    re-established transparently when it drops (see ResumableUpstream).
     """
     try:
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {bearer_token}",
-        }
-
-        print(f"Connecting to {SERVICE_URL}")
-        async with websockets.connect(
-            SERVICE_URL,
-            additional_headers=headers,
-            ssl=ssl.create_default_context(cafile=certifi.where()),
-        ) as server_websocket:
-            print("Connected to Vertex AI")
-            active_connections.add(server_websocket)
-
-            # Create bidirectional proxy tasks
-            client_to_server = asyncio.create_task(
-                proxy_task(client_websocket, server_websocket, "Client->Server")
-            )
-            server_to_client = asyncio.create_task(
-                proxy_task(server_websocket, client_websocket, "Server->Client")
-            )
-
-            try:
-                # Wait for both tasks to complete
-                await asyncio.gather(client_to_server, server_to_client)
-            except Exception as e:
-                print(f"Error during proxy operation: {e}")
-                print(f"Full traceback: {traceback.format_exc()}")
-            finally:
-                # Clean up tasks
-                for task in [client_to_server, server_to_client]:
-                    if not task.done():
-                        task.cancel()
-                        try:
-                            await task
-                        except asyncio.CancelledError:
-                            pass
-
-    except Exception as e:
-        print(f"Error creating proxy connection: {e}")
-        print(f"Full traceback: {traceback.format_exc()}")
-
+        server_websocket, session.region = await router.acquire(bearer_token)
+        if RECONNECT:
+            server_websocket = ResumableUpstream(router, server_websocket, session)
+        log(
+            logging.INFO,
+            "session started",
+            session=session.id,
+            region=session.region.name,
+            upstream=session.region.url,
+        )
+        active_connections.add(server_websocket)
+        metrics.SESSIONS.inc()
+        metrics.ACTIVE_SESSIONS.inc()
+
+        # Create bidirectional proxy tasks
+        client_to_server = asyncio.create_task(
+            proxy_task(client_websocket, server_websocket, CLIENT_TO_SERVER, session)
+        )
+        server_to_client = asyncio.create_task(
+            proxy_task(server_websocket, client_websocket, SERVER_TO_CLIENT, session)
+        )
+
+        liveness_monitor.register(session, server_websocket)
 
-async def handle_client(client_websocket: WebSocketServerProtocol) -> None:
+        try:
+            # Wait for both tasks to complete
+            await asyncio.gather(client_to_server, server_to_client)
+        except Exception:
+            log_exception("error during proxy operation", session=session.id)
+        finally:
+            liveness_monitor.unregister(session)
+            session.tools.close()
+            # Clean up tasks
+            for task in [client_to_server, server_to_client]:
+                if not task.done():
+                    task.cancel()
+                    try:
+                        await task
+                    except asyncio.CancelledError:
+                        pass
+            active_connections.discard(server_websocket)
+            await server_websocket.close()
+            metrics.ACTIVE_SESSIONS.dec()
+            if session.recording is not None:
+                session.recording.close()
+            log(logging.INFO, "session ended", session=session.id)
+
+    except Exception:
+        log_exception("error creating proxy connection", session=session.id)
+
+
+async def handle_client(client_websocket: ServerConnection) -> None:
     """
     Handles a new client connection.
     """
-    print("New connection...")
+    log(logging.DEBUG, "new connection")
     try:
         # Get auth token automatically
         bearer_token = await get_access_token()
-        print("Retrieved bearer token automatically")
 
-        # Send auth complete message to client
-        await client_websocket.send(json.dumps({"authComplete": True}))
-        print("Sent auth complete message")
+        # Send auth complete message to client, confirming the extensions
+        # it asked for in the connection URL
+        session = Session(client_websocket)
+        await client_websocket.send(
+            json.dumps({"authComplete": True, **session.negotiated()})
+        )
 
-        print("Creating proxy connection")
-        await create_proxy(client_websocket, bearer_token)
+        await create_proxy(client_websocket, bearer_token, session)
 
     except asyncio.TimeoutError:
-        print("Timeout in handle_client")
+        log(logging.WARNING, "auth timeout")
         await client_websocket.close(code=1008, reason="Auth timeout")
     except Exception as e:
-        print(f"Error in handle_client: {e}")
-        print(f"Full traceback: {traceback.format_exc()}")
+        log_exception("error in handle_client")
         await client_websocket.close(code=1011, reason=str(e))
 
 
-async def cleanup_connections() -> None:
-    """
-    Periodically clean up stale connections
-    """
-    while True:
-        print(f"Active connections: {len(active_connections)}")
-        for conn in list(active_connections):
-            try:
-                await conn.ping()
-            except:
-                print("Found stale connection, removing...")
-                active_connections.remove(conn)
-                try:
-                    await conn.close()
-                except:
-                    pass
-        await asyncio.sleep(30)  # Check every 30 seconds
-
-
-async def main() -> None:
+async def main(worker: int = 0) -> None:
     """
     Starts the WebSocket server.
-    """
-    print(f"DEBUG: proxy.py - main() function started")
-    # Get the port from the environment variable, defaulting to 8081
-    # port = int(os.environ.get("PORT", 8081))
-    port = 8081
 
-    # Start the cleanup task
-    cleanup_task = asyncio.create_task(cleanup_connections())
+    `worker` is the index of this process when running several workers
+    with PROXY_WORKERS; each worker serves /metrics on its own port.
+    """
+    # Get the port from the environment variable, defaulting to 8081. PORT
+    # itself belongs to nginx when running in the chapter_12 container.
+    port = env_int("PROXY_PORT", 8081)
+
+    # Stop gracefully on SIGTERM (sent by the supervisor or the container)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+
+    # Fetch the first token now and keep it fresh in the background
+    token_cache.start()
+    router.start()
+
+    if VIDEO_DEDUP and not perceptual_available():
+        log(
+            logging.WARNING,
+            "Pillow not installed, video dedup only drops byte-identical frames",
+        )
+
+    # Heartbeats and idle timeouts of all sessions
+    liveness_monitor.start()
+    tool_executor.start()
+
+    # Serve /metrics next to the WebSocket listener
+    metrics_server = await metrics.start_metrics_server(
+        port=metrics.METRICS_PORT + worker if metrics.METRICS_PORT else 0
+    )
 
     async with websockets.serve(
         handle_client,
@@ -246,14 +501,30 @@ async def main() -> None:
         # "localhost",
         # 8080,
         port,
-        ping_interval=30,  # Send ping every 30 seconds
-        ping_timeout=10,  # Wait 10 seconds for pong
+        # Client sockets are pinged by the liveness monitor unless
+        # PROXY_HEARTBEAT_INTERVAL=0
+        ping_interval=None if HEARTBEAT_INTERVAL else 30,
+        ping_timeout=None if HEARTBEAT_INTERVAL else 10,
+        # Lets every worker process bind the same port; the kernel spreads
+        # incoming connections across them
+        reuse_port=WORKERS > 1,
     ):
-        print(f"Running websocket server on 0.0.0.0:{port}...")
+        log(
+            logging.INFO,
+            "websocket server running",
+            address=f"0.0.0.0:{port}",
+            worker=worker,
+            pid=os.getpid(),
+        )
         try:
-            await asyncio.Future()  # run forever
+            await stop.wait()  # run until SIGTERM/SIGINT
         finally:
-            cleanup_task.cancel()
+            await liveness_monitor.stop()
+            if metrics_server is not None:
+                metrics_server.close()
+            await router.stop()
+            await token_cache.stop()
+            await tool_executor.stop()
             # Close all remaining connections
             for conn in list(active_connections):
                 try:
@@ -263,5 +534,87 @@ async def main() -> None:
             active_connections.clear()
 
 
+def _spawn_worker(worker: int) -> int:
+    """Forks a worker process running main(); returns its pid."""
+    pid = os.fork()
+    if pid == 0:
+        status = 0
+        try:
+            # The supervisor handles these; the worker installs its own
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            asyncio.run(main(worker))
+        except BaseException:
+            log_exception("worker crashed", worker=worker)
+            status = 1
+        finally:
+            proxy_log.shutdown()
+            os._exit(status)
+    return pid
+
+
+def supervise(workers: int) -> None:
+    """
+    Runs `workers` forked worker processes that share the listening port.
+
+    Each worker has its own event loop, connections, upstream pool and token
+    cache. Workers that exit unexpectedly are respawned; SIGTERM/SIGINT are
+    forwarded to all workers, which are killed if they do not finish
+    within PROXY_SHUTDOWN_TIMEOUT seconds.
+    """
+    children = {}  # pid -> (worker index, start time)
+    stopping = []
+
+    def request_stop(signum, frame):
+        if not stopping:
+            stopping.append(time.monotonic())
+            log(logging.INFO, "supervisor stopping", workers=len(children))
+            for pid in children:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    for worker in range(workers):
+        children[_spawn_worker(worker)] = (worker, time.monotonic())
+    log(logging.INFO, "supervisor started", workers=workers, pid=os.getpid())
+
+    while children:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            if stopping and time.monotonic() - stopping[0] > SHUTDOWN_TIMEOUT:
+                for pid in children:
+                    try:
+                        os.kill(pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+            time.sleep(0.2)
+            continue
+        if pid not in children:
+            continue
+        worker, started = children.pop(pid)
+        if stopping:
+            continue
+        log(
+            logging.WARNING,
+            "worker exited, respawning",
+            worker=worker,
+            pid=pid,
+            status=os.waitstatus_to_exitcode(status),
+        )
+        if time.monotonic() - started < RESPAWN_BACKOFF:
+            time.sleep(RESPAWN_BACKOFF)
+        children[_spawn_worker(worker)] = (worker, time.monotonic())
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    if WORKERS > 1 and hasattr(socket, "SO_REUSEPORT"):
+        supervise(WORKERS)
+    else:
+        if WORKERS > 1:
+            log(logging.WARNING, "SO_REUSEPORT unavailable, running one worker")
+            WORKERS = 1
+        asyncio.run(main())
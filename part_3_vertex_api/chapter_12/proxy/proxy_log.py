@@ -0,0 +1,185 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Non-blocking structured logging for the proxy """
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+from config import env_int
+
+# DEBUG enables per-frame logging; INFO logs session lifecycle and errors.
+LOG_LEVEL = os.environ.get("PROXY_LOG_LEVEL", "INFO").upper()
+# "text" (key=value) or "json" (one object per line).
+LOG_FORMAT = os.environ.get("PROXY_LOG_FORMAT", "text").lower()
+# Payloads included in log records are cut to this many characters.
+LOG_MAX_PAYLOAD = env_int("PROXY_LOG_MAX_PAYLOAD", 512)
+# Records waiting for the writer thread; further records are dropped.
+LOG_QUEUE_SIZE = env_int("PROXY_LOG_QUEUE_SIZE", 10000)
+
+
+def _parse_sampling(spec: str) -> dict:
+    """Parses "realtime_input=100,serverContent=20" into {type: every_nth}."""
+    rates = {}
+    for item in spec.split(","):
+        if "=" in item:
+            msg_type, every = item.split("=", 1)
+            rates[msg_type.strip()] = max(int(every), 1)
+    return rates
+
+
+# Log only every Nth frame of the high-volume message types.
+LOG_SAMPLE = _parse_sampling(
+    os.environ.get("PROXY_LOG_SAMPLE", "realtime_input=100,serverContent=100")
+)
+
+logger = logging.getLogger("proxy")
+
+_frame_counts = {}
+_dropped = 0
+_listener = None
+
+
+def truncate(payload, limit: int = LOG_MAX_PAYLOAD) -> str:
+    """Returns a printable prefix of a (possibly huge) str or bytes payload."""
+    head = payload[:limit]
+    if isinstance(head, (bytes, bytearray)):
+        head = head.decode("utf-8", "replace")
+    if len(payload) > limit:
+        return f"{head}...(+{len(payload) - limit} more)"
+    return head
+
+
+class _StructuredFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, "fields", {})
+        timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+        timestamp += f".{int(record.msecs):03d}Z"
+        if LOG_FORMAT == "json":
+            entry = {"ts": timestamp, "level": record.levelname, "event": record.msg}
+            entry.update(fields)
+            if record.exc_info:
+                entry["traceback"] = self.formatException(record.exc_info)
+            return json.dumps(entry, default=str)
+        parts = [timestamp, record.levelname, str(record.msg)]
+        for key, value in fields.items():
+            value = str(value)
+            if not value or any(c in value for c in ' ="\n'):
+                value = json.dumps(value)
+            parts.append(f"{key}={value}")
+        line = " ".join(parts)
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread without formatting or blocking."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting happens in the writer thread, not on the event loop
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped += 1
+
+
+def _start_writer() -> None:
+    global _listener
+    records = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(_StructuredFormatter())
+    _listener = logging.handlers.QueueListener(records, stream_handler)
+    _listener.start()
+    logger.handlers[:] = [_NonBlockingQueueHandler(records)]
+
+
+def _restart_after_fork() -> None:
+    # The writer thread does not survive fork() and its queue may have been
+    # locked at that moment, so forked workers get a fresh queue and thread.
+    if _listener is not None:
+        _start_writer()
+
+
+def configure() -> None:
+    """Routes the proxy logger through a queue drained by a writer thread."""
+    if _listener is not None:
+        return
+    _start_writer()
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    atexit.register(shutdown)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def shutdown() -> None:
+    """Writes out all queued records and stops the writer thread."""
+    global _listener
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
+
+
+def dropped_records() -> int:
+    """Number of log records dropped because the writer fell behind."""
+    return _dropped
+
+
+def log(level: int, event: str, **fields) -> None:
+    """Logs `event` with structured key/value fields."""
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
+
+
+def log_exception(event: str, **fields) -> None:
+    """Logs `event` at ERROR level together with the current traceback."""
+    if logger.isEnabledFor(logging.ERROR):
+        logger.error(event, exc_info=True, extra={"fields": fields})
+
+
+def log_frame(direction: str, msg_type: str, frame, **fields) -> None:
+    """
+    Logs a forwarded frame at DEBUG level, sampled per message type.
+
+    Returns immediately when DEBUG logging is disabled.
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    every = LOG_SAMPLE.get(msg_type, 1)
+    if every > 1:
+        count = _frame_counts.get(msg_type, 0)
+        _frame_counts[msg_type] = count + 1
+        if count % every:
+            return
+        fields["sampled"] = f"1/{every}"
+    logger.debug(
+        "forward",
+        extra={
+            "fields": {
+                "direction": direction,
+                "type": msg_type,
+                "bytes": len(frame),
+                **fields,
+            }
+        },
+    )
@@ -0,0 +1,181 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Upstream connection that transparently reconnects and replays the setup """
+import asyncio
+import collections
+import logging
+import os
+import time
+
+from websockets.exceptions import ConnectionClosed
+
+import metrics
+from config import env_flag, env_float
+from frames import SETUP, SETUP_COMPLETE, sniff_message_type
+from proxy_log import log
+
+# Reconnect to the upstream when it drops the connection mid-session.
+RECONNECT = env_flag("PROXY_RECONNECT", True)
+# Close codes that are retried: going away, abnormal closure (no close
+# frame), internal error, service restart, try again later, bad gateway.
+RECONNECT_CODES = frozenset(
+    int(code)
+    for code in os.environ.get(
+        "PROXY_RECONNECT_CODES", "1001,1006,1011,1012,1013,1014"
+    ).split(",")
+    if code.strip()
+)
+# Seconds a session may spend reconnecting before it is torn down. Client
+# frames are held in the forwarding queue during that time.
+RECONNECT_WINDOW = env_float("PROXY_RECONNECT_WINDOW", 5.0)
+# First delay between reconnect attempts; doubled after every failure.
+RECONNECT_BACKOFF = env_float("PROXY_RECONNECT_BACKOFF", 0.05)
+
+
+def close_code(error: ConnectionClosed) -> int:
+    """Close code sent by the peer; 1006 if the connection just dropped."""
+    return error.rcvd.code if error.rcvd is not None else 1006
+
+
+class ResumableUpstream:
+    """
+    Upstream side of one session that survives upstream disconnects.
+
+    Used in place of the upstream WebSocket by both proxy directions. When
+    send() or the iteration fails with a retryable close code, a new
+    connection is taken from the router (authenticated with the cached
+    token, possibly in another region),
+    the session's setup message is replayed, and the setupComplete answer is
+    swallowed since the client already received one. Both directions then
+    continue on the new connection.
+    """
+
+    def __init__(self, router, websocket, session) -> None:
+        self.router = router
+        self.websocket = websocket
+        self.session = session
+        self.reconnects = 0
+        self._lock = asyncio.Lock()
+        self._pending = collections.deque()  # frames read while reconnecting
+        self._closed = False
+
+    async def _connect(self, deadline: float):
+        websocket, region = await self.router.acquire()
+        self.session.region = region
+        setup = self.session.setup_message
+        if setup is None:
+            return websocket
+        try:
+            await websocket.send(region.adapt_setup(setup))
+            while True:
+                frame = await asyncio.wait_for(
+                    websocket.recv(), deadline - time.monotonic()
+                )
+                if sniff_message_type(frame) == SETUP_COMPLETE:
+                    if not self.session.setup_completed:
+                        self._pending.append(frame)
+                    return websocket
+                self._pending.append(frame)
+        except BaseException:
+            try:
+                await websocket.close()
+            except Exception:
+                pass
+            raise
+
+    async def _recover(self, websocket, error: ConnectionClosed) -> None:
+        """Replaces `websocket` with a new connection, or re-raises `error`."""
+        async with self._lock:
+            if self.websocket is not websocket:
+                return  # The other direction already reconnected
+            code = close_code(error)
+            if self._closed or not RECONNECT or code not in RECONNECT_CODES:
+                raise error
+
+            started = time.perf_counter()
+            deadline = time.monotonic() + RECONNECT_WINDOW
+            delay = RECONNECT_BACKOFF
+            attempts = 0
+            while True:
+                attempts += 1
+                try:
+                    new_websocket = await asyncio.wait_for(
+                        self._connect(deadline), deadline - time.monotonic()
+                    )
+                    break
+                except Exception as e:
+                    if time.monotonic() + delay >= deadline:
+                        metrics.UPSTREAM_RECONNECTS.labels("failed").inc()
+                        log(
+                            logging.WARNING,
+                            "upstream reconnect failed",
+                            session=self.session.id,
+                            code=code,
+                            attempts=attempts,
+                            error=e,
+                        )
+                        raise error from e
+                    await asyncio.sleep(delay)
+                    delay *= 2
+
+            self.websocket = new_websocket
+            self.reconnects += 1
+            elapsed = time.perf_counter() - started
+            metrics.UPSTREAM_RECONNECTS.labels("ok").inc()
+            metrics.UPSTREAM_RECONNECT_TIME.observe(elapsed)
+            log(
+                logging.INFO,
+                "upstream reconnected",
+                session=self.session.id,
+                code=code,
+                reason=error.rcvd.reason if error.rcvd is not None else "",
+                attempts=attempts,
+                ms=round(elapsed * 1000, 1),
+            )
+
+    async def send(self, message, text=None) -> None:
+        while True:
+            websocket = self.websocket
+            try:
+                await websocket.send(message, text=text)
+                return
+            except ConnectionClosed as e:
+                await self._recover(websocket, e)
+                if sniff_message_type(message) == SETUP:
+                    return  # Already replayed on the new connection
+
+    async def __aiter__(self):
+        while True:
+            while self._pending:
+                yield self._pending.popleft()
+            websocket = self.websocket
+            try:
+                frame = await websocket.recv()
+            except ConnectionClosed as e:
+                if self._closed:
+                    return  # Closed by the proxy at the end of the session
+                await self._recover(websocket, e)
+                continue
+            yield frame
+
+    async def ping(self):
+        return await self.websocket.ping()
+
+    def abort(self) -> None:
+        """Drops the current connection; a retryable 1006 for the readers."""
+        self.websocket.transport.abort()
+
+    async def close(self) -> None:
+        self._closed = True
+        await self.websocket.close()
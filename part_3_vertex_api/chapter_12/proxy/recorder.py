@@ -0,0 +1,235 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Append-only binary recordings of proxied sessions.
+
+A recording starts with MAGIC, a uint32 length and that many bytes of JSON
+metadata (the client's request path, wall-clock start time, session id).
+Every frame follows as a RECORD_HEADER and the frame's bytes exactly as
+they were received:
+
+    uint64  nanoseconds since the session started
+    uint8   direction (UPLINK: client to server, DOWNLINK: server to client)
+    uint8   message type code (index into TYPES)
+    uint8   flags (FLAG_TEXT: received as a text frame)
+    uint8   reserved
+    uint32  payload length
+
+Recording hands frames to a writer thread, so the event loop only pays for
+a queue put. Recordings are read with read_recording(), which maps the file
+instead of reading it.
+"""
+import asyncio
+import atexit
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from typing import NamedTuple
+
+from config import env_int
+from frames import (
+    CLIENT_CONTENT,
+    REALTIME_INPUT,
+    SERVER_CONTENT,
+    SETUP,
+    SETUP_COMPLETE,
+    TOOL_CALL,
+    TOOL_CALL_CANCELLATION,
+    TOOL_RESPONSE,
+    UNKNOWN,
+)
+
+# Directory that receives one recording per session; empty disables recording.
+RECORD_DIR = os.environ.get("PROXY_RECORD_DIR", "")
+# Frames waiting for the writer thread; further frames are left out.
+RECORD_QUEUE_SIZE = env_int("PROXY_RECORD_QUEUE_SIZE", 10000)
+
+MAGIC = b"LIVEREC\x01"
+_METADATA_LENGTH = struct.Struct("<I")
+RECORD_HEADER = struct.Struct("<QBBBxI")
+
+UPLINK = 0
+DOWNLINK = 1
+FLAG_TEXT = 0x01
+
+TYPES = (
+    UNKNOWN,
+    SETUP,
+    SETUP_COMPLETE,
+    REALTIME_INPUT,
+    CLIENT_CONTENT,
+    TOOL_RESPONSE,
+    SERVER_CONTENT,
+    TOOL_CALL,
+    # Appended so that the codes in existing recordings stay valid
+    TOOL_CALL_CANCELLATION,
+)
+_TYPE_CODES = {msg_type: code for code, msg_type in enumerate(TYPES)}
+
+_frames = None
+_writer = None
+_dropped = 0
+_lock = threading.Lock()
+
+
+class Record(NamedTuple):
+    timestamp: float  # seconds since the session started
+    direction: int
+    msg_type: str
+    text: bool
+    payload: memoryview
+
+
+def dropped_frames() -> int:
+    """Number of frames left out of recordings because the writer fell behind."""
+    return _dropped
+
+
+def _write_loop(frames: queue.Queue) -> None:
+    files = {}
+    while True:
+        entry = frames.get()
+        if entry is None:
+            break
+        recording, header, payload = entry
+        f = files.get(recording)
+        if f is None:
+            f = files[recording] = open(recording.path, "ab", buffering=1024 * 1024)
+            metadata = json.dumps(recording.metadata).encode("utf-8")
+            f.write(MAGIC + _METADATA_LENGTH.pack(len(metadata)) + metadata)
+        if header is None:
+            # End of the session
+            files.pop(recording).close()
+            continue
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        timestamp, direction, type_code, flags = header
+        f.write(RECORD_HEADER.pack(timestamp, direction, type_code, flags, len(payload)))
+        f.write(payload)
+    for f in files.values():
+        f.close()
+
+
+def _start_writer() -> None:
+    global _frames, _writer
+    with _lock:
+        if _writer is None:
+            _frames = queue.Queue(maxsize=RECORD_QUEUE_SIZE)
+            _writer = threading.Thread(
+                target=_write_loop, args=(_frames,), name="recorder", daemon=True
+            )
+            _writer.start()
+            atexit.register(shutdown)
+
+
+def shutdown() -> None:
+    """Writes out all queued frames and closes the recordings."""
+    global _writer
+    if _writer is not None:
+        writer, _writer = _writer, None
+        _frames.put(None)
+        writer.join()
+
+
+class SessionRecording:
+    """Recording of one client session, written to `path`."""
+
+    def __init__(self, path: str, metadata: dict) -> None:
+        self.path = path
+        self.metadata = metadata
+        self._started = time.perf_counter_ns()
+        _start_writer()
+
+    def record(self, direction: int, msg_type: str, frame, text: bool) -> None:
+        """Queues one received frame; never blocks."""
+        global _dropped
+        header = (
+            time.perf_counter_ns() - self._started,
+            direction,
+            _TYPE_CODES.get(msg_type, 0),
+            FLAG_TEXT if text else 0,
+        )
+        try:
+            _frames.put_nowait((self, header, frame))
+        except queue.Full:
+            _dropped += 1
+
+    def close(self) -> None:
+        """Ends the recording; never blocks the event loop."""
+        entry = (self, None, None)
+        try:
+            _frames.put_nowait(entry)
+        except queue.Full:
+            # The writer is behind: wait for room on a worker thread. The
+            # session's frames are all queued already, so the order holds.
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                _frames.put(entry)
+            else:
+                loop.run_in_executor(None, _frames.put, entry)
+
+
+def start_recording(session_id: int, request_path: str):
+    """Returns a SessionRecording in RECORD_DIR, or None if recording is off."""
+    if not RECORD_DIR:
+        return None
+    os.makedirs(RECORD_DIR, exist_ok=True)
+    started = time.time()
+    stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(started))
+    path = os.path.join(RECORD_DIR, f"session-{stamp}-{os.getpid()}-{session_id}.rec")
+    return SessionRecording(
+        path, {"session": session_id, "path": request_path, "started": started}
+    )
+
+
+def read_recording(path: str):
+    """
+    Returns (metadata, records) of a recording, where records is a list of
+    Record whose payloads are views into the memory-mapped file.
+    """
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(data)
+    if bytes(view[: len(MAGIC)]) != MAGIC:
+        raise ValueError(f"{path} is not a session recording")
+    offset = len(MAGIC)
+    (length,) = _METADATA_LENGTH.unpack_from(view, offset)
+    offset += _METADATA_LENGTH.size
+    metadata = json.loads(bytes(view[offset : offset + length]))
+    offset += length
+
+    records = []
+    while offset + RECORD_HEADER.size <= len(view):
+        timestamp, direction, type_code, flags, size = RECORD_HEADER.unpack_from(
+            view, offset
+        )
+        offset += RECORD_HEADER.size
+        if offset + size > len(view):
+            break  # Truncated by a crash while writing
+        records.append(
+            Record(
+                timestamp / 1e9,
+                direction,
+                TYPES[type_code] if type_code < len(TYPES) else UNKNOWN,
+                bool(flags & FLAG_TEXT),
+                view[offset : offset + size],
+            )
+        )
+        offset += size
+    return metadata, records
@@ -0,0 +1,243 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Latency-aware routing of sessions across regional upstream endpoints """
+import asyncio
+import logging
+import os
+import re
+import ssl
+import time
+from typing import Optional
+
+import certifi
+
+import metrics
+from config import env_float
+from proxy_log import log, log_exception
+from upstream_pool import UpstreamPool
+
+# {region} is replaced by each entry of PROXY_REGIONS
+URL_TEMPLATE = (
+    "wss://{region}-aiplatform.googleapis.com"
+    "/ws/google.cloud.aiplatform.v1beta1.LlmBidiService/BidiGenerateContent"
+)
+SERVICE_URL = os.environ.get("PROXY_SERVICE_URL", URL_TEMPLATE.format(region="us-central1"))
+
+# Vertex AI locations to choose from, e.g. "us-central1,europe-west4".
+REGIONS = os.environ.get("PROXY_REGIONS", "")
+# Explicit endpoints as name=url pairs, e.g. for local stand-ins:
+# "a=ws://127.0.0.1:9001,b=ws://127.0.0.1:9002".
+REGION_URLS = os.environ.get("PROXY_REGION_URLS", "")
+# Seconds between latency probes of every region.
+PROBE_INTERVAL = env_float("PROXY_REGION_PROBE_INTERVAL", 15.0)
+# A probe that takes longer than this marks the region unhealthy.
+PROBE_TIMEOUT = env_float("PROXY_REGION_PROBE_TIMEOUT", 5.0)
+# Weight of the newest probe in a region's smoothed latency.
+PROBE_SMOOTHING = 0.3
+
+_LOCATION_STR = re.compile(r"/locations/[a-z0-9-]+/")
+_LOCATION_BYTES = re.compile(rb"/locations/[a-z0-9-]+/")
+
+# Built once: creating a context re-reads the CA bundle from disk.
+_SSL_CONTEXT = ssl.create_default_context(cafile=certifi.where())
+
+REGION_LATENCY = metrics.Gauge(
+    "proxy_region_latency_seconds",
+    "Smoothed connect and handshake time of each upstream region.",
+    ("region",),
+)
+REGION_HEALTHY = metrics.Gauge(
+    "proxy_region_healthy",
+    "1 if the region answered its last probe or connect, else 0.",
+    ("region",),
+)
+REGION_SESSIONS = metrics.Counter(
+    "proxy_region_sessions_total",
+    "Upstream connections handed to sessions, by region.",
+    ("region",),
+)
+REGION_FAILOVERS = metrics.Counter(
+    "proxy_region_failovers_total",
+    "Upstream connects that failed and moved on to the next region.",
+    ("region",),
+)
+
+
+class Region:
+    """One upstream endpoint with its pool and probe results."""
+
+    def __init__(self, name: str, url: str, location: Optional[str] = None) -> None:
+        self.name = name
+        self.url = url
+        # Vertex AI location used in the setup's model path, if known
+        self.location = location
+        ssl_context = _SSL_CONTEXT if url.startswith("wss://") else None
+        self.pool = UpstreamPool(url, ssl_context)
+        self.latency: Optional[float] = None
+        self.healthy = True
+        self.last_error = None
+
+    def adapt_setup(self, frame):
+        """Points the model path of a setup message at this region."""
+        if self.location is None:
+            return frame
+        if isinstance(frame, str):
+            return _LOCATION_STR.sub(f"/locations/{self.location}/", frame, count=1)
+        return _LOCATION_BYTES.sub(
+            f"/locations/{self.location}/".encode("ascii"), frame, count=1
+        )
+
+    def record_latency(self, seconds: float) -> None:
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += PROBE_SMOOTHING * (seconds - self.latency)
+        self.healthy = True
+        REGION_LATENCY.labels(self.name).set(self.latency)
+        REGION_HEALTHY.labels(self.name).set(1)
+
+    def record_failure(self, error) -> None:
+        self.healthy = False
+        self.last_error = error
+        REGION_HEALTHY.labels(self.name).set(0)
+
+
+def _check_names(regions: list, setting: str) -> list:
+    """Raises ValueError unless every region has its own, non-empty name."""
+    seen = set()
+    for region in regions:
+        if not region.name:
+            raise ValueError(f"{setting}: every region needs a name")
+        if region.name in seen:
+            raise ValueError(f"{setting}: region {region.name!r} is listed twice")
+        seen.add(region.name)
+    return regions
+
+
+def configured_regions() -> list:
+    """Regions from PROXY_REGION_URLS, PROXY_REGIONS or PROXY_SERVICE_URL."""
+    if REGION_URLS:
+        regions = []
+        for item in REGION_URLS.split(","):
+            name, _, url = item.strip().partition("=")
+            if not url:
+                raise ValueError(f"PROXY_REGION_URLS: expected name=url, got {item!r}")
+            regions.append(Region(name.strip(), url.strip()))
+        return _check_names(regions, "PROXY_REGION_URLS")
+    if REGIONS:
+        regions = [
+            Region(location.strip(), URL_TEMPLATE.format(region=location.strip()), location.strip())
+            for location in REGIONS.split(",")
+            if location.strip()
+        ]
+        return _check_names(regions, "PROXY_REGIONS")
+    return [Region("default", SERVICE_URL)]
+
+
+class RegionRouter:
+    """
+    Hands out upstream connections from the fastest healthy region.
+
+    Every PROBE_INTERVAL seconds each region is probed by opening (and
+    closing) an authenticated WebSocket, which measures DNS, TCP, TLS and
+    handshake time. acquire() tries regions from the fastest healthy one
+    down, so a failing region is skipped until it passes a probe again.
+    With a single region no probes are sent.
+    """
+
+    def __init__(self, regions: list) -> None:
+        self.regions = regions
+        self._prober: Optional[asyncio.Task] = None
+
+    @property
+    def idle(self) -> int:
+        return sum(region.pool.idle for region in self.regions)
+
+    def ranked(self) -> list:
+        """Regions in order of preference: healthy first, then by latency."""
+        return sorted(
+            self.regions,
+            key=lambda region: (
+                not region.healthy,
+                region.latency if region.latency is not None else float("inf"),
+            ),
+        )
+
+    async def acquire(self, bearer_token: Optional[str] = None):
+        """Returns (websocket, region), failing over to the next region."""
+        candidates = self.ranked()
+        for index, region in enumerate(candidates):
+            try:
+                websocket = await region.pool.acquire(bearer_token)
+            except Exception as e:
+                region.record_failure(e)
+                if index == len(candidates) - 1:
+                    raise
+                REGION_FAILOVERS.labels(region.name).inc()
+                log(logging.WARNING, "region failover", region=region.name, error=e)
+                continue
+            REGION_SESSIONS.labels(region.name).inc()
+            return websocket, region
+
+    async def _probe(self, region: Region) -> None:
+        started = time.perf_counter()
+        try:
+            websocket = await asyncio.wait_for(region.pool.connect(), PROBE_TIMEOUT)
+        except Exception as e:
+            if region.healthy:
+                log(logging.WARNING, "region unhealthy", region=region.name, error=e)
+            region.record_failure(e)
+            return
+        region.record_latency(time.perf_counter() - started)
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.gather(*(self._probe(region) for region in self.regions))
+                best = self.ranked()[0]
+                log(
+                    logging.DEBUG,
+                    "regions probed",
+                    preferred=best.name,
+                    latencies=",".join(
+                        f"{region.name}={round(region.latency * 1000, 1)}"
+                        if region.latency is not None
+                        else f"{region.name}=down"
+                        for region in self.regions
+                    ),
+                )
+            except Exception:
+                log_exception("region probe failed")
+            await asyncio.sleep(PROBE_INTERVAL)
+
+    def start(self) -> None:
+        for region in self.regions:
+            region.pool.start()
+        if len(self.regions) > 1 and self._prober is None:
+            self._prober = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._prober is not None:
+            self._prober.cancel()
+            try:
+                await self._prober
+            except asyncio.CancelledError:
+                pass
+            self._prober = None
+        for region in self.regions:
+            await region.pool.stop()
@@ -0,0 +1,225 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Conversion of client audio to the 16 kHz mono int16 PCM the Live API expects.
+
+Clients declare what they send in the mime type of each audio chunk, e.g.
+"audio/pcm;rate=48000;channels=2;encoding=float32" (rate defaults to 16000,
+channels to 1 and encoding to int16). Interleaved channels are averaged and
+the result is resampled with a windowed-sinc polyphase filter that keeps its
+history between chunks, so chunk boundaries leave no clicks.
+"""
+import functools
+import math
+import re
+from typing import NamedTuple, Optional
+
+from config import env_flag, env_int
+
+try:
+    # Optional: without NumPy, clients sending non-native audio are closed
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+except ImportError:
+    np = None
+
+# Convert client audio that is not 16 kHz mono int16.
+RESAMPLE = env_flag("PROXY_RESAMPLE", True)
+# Zero crossings of the sinc on each side of a filter tap. More are sharper
+# and cost proportionally more CPU.
+RESAMPLE_ZERO_CROSSINGS = env_int("PROXY_RESAMPLE_ZERO_CROSSINGS", 16)
+
+TARGET_RATE = 16000
+INT16 = "int16"
+FLOAT32 = "float32"
+# Accepted sample rates and channel counts of client audio
+MIN_RATE = 8000
+MAX_RATE = 192000
+MAX_CHANNELS = 8
+
+# Fraction of the output Nyquist frequency kept by the anti-aliasing filter
+_ROLLOFF = 0.94
+_KAISER_BETA = 8.6
+
+_PARAMETER = re.compile(r";\s*([A-Za-z]+)\s*=\s*([A-Za-z0-9]+)")
+
+
+class AudioFormat(NamedTuple):
+    rate: int = TARGET_RATE
+    channels: int = 1
+    encoding: str = INT16
+
+    @property
+    def native(self) -> bool:
+        return self == NATIVE
+
+    @property
+    def frame_size(self) -> int:
+        return self.channels * (2 if self.encoding == INT16 else 4)
+
+
+NATIVE = AudioFormat()
+
+
+class UnsupportedAudioFormat(ValueError):
+    """Client audio whose declared format cannot be converted."""
+
+
+def available() -> bool:
+    """Whether non-native audio can be converted in this process."""
+    return RESAMPLE and np is not None
+
+
+def parse_format(rate=None, channels=None, encoding=None) -> Optional[AudioFormat]:
+    """Returns the AudioFormat for the given values, or None if unsupported."""
+    try:
+        audio_format = AudioFormat(
+            int(rate) if rate else TARGET_RATE,
+            int(channels) if channels else 1,
+            (encoding or INT16).lower(),
+        )
+    except ValueError:
+        return None
+    if (
+        not MIN_RATE <= audio_format.rate <= MAX_RATE
+        or not 1 <= audio_format.channels <= MAX_CHANNELS
+        or audio_format.encoding not in (INT16, FLOAT32)
+    ):
+        return None
+    return audio_format
+
+
+def parse_mime_type(mime_type: str) -> Optional[AudioFormat]:
+    """Returns the AudioFormat of an audio/pcm mime type, or None."""
+    if not mime_type.startswith("audio/pcm"):
+        return None
+    parameters = {
+        name.lower(): value for name, value in _PARAMETER.findall(mime_type)
+    }
+    return parse_format(
+        parameters.get("rate"), parameters.get("channels"), parameters.get("encoding")
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _filter_bank(in_rate: int, out_rate: int, zero_crossings: int):
+    """
+    Returns (up, down, half_width, bank) for resampling in_rate to out_rate.
+
+    Output sample k lies at input position k * down / up. Row p of `bank`
+    holds the 2 * half_width taps applied to the input samples around an
+    output sample whose position has the fractional part p / up.
+    """
+    divisor = math.gcd(in_rate, out_rate)
+    up, down = out_rate // divisor, in_rate // divisor
+    # Cut-off relative to the input rate: the lower of the two Nyquist
+    # frequencies, so downsampling does not alias
+    cutoff = min(1.0, out_rate / in_rate) * _ROLLOFF
+    half_width = math.ceil(zero_crossings / cutoff)
+    offsets = np.arange(-half_width + 1, half_width + 1, dtype=np.float64)
+    distance = np.arange(up, dtype=np.float64)[:, None] / up - offsets[None, :]
+    window = np.i0(
+        _KAISER_BETA * np.sqrt(np.clip(1.0 - (distance / half_width) ** 2, 0.0, None))
+    ) / np.i0(_KAISER_BETA)
+    bank = cutoff * np.sinc(cutoff * distance) * window
+    # Unity gain at DC for every phase
+    bank /= bank.sum(axis=1, keepdims=True)
+    return up, down, half_width, bank.astype(np.float32)
+
+
+class StreamResampler:
+    """
+    Converts one client's audio stream to 16 kHz mono int16, chunk by chunk.
+
+    Partial sample frames and the filter history are carried over to the
+    next chunk. The output lags the input by half the filter length (about
+    1 ms at 44.1 kHz).
+    """
+
+    def __init__(
+        self,
+        audio_format: AudioFormat,
+        out_rate: int = TARGET_RATE,
+        zero_crossings: int = RESAMPLE_ZERO_CROSSINGS,
+    ) -> None:
+        self.format = audio_format
+        self._dtype = np.dtype("<i2" if audio_format.encoding == INT16 else "<f4")
+        self._partial = b""
+        self._bank = None
+        if audio_format.rate != out_rate:
+            self._up, self._down, self._half_width, self._bank = _filter_bank(
+                audio_format.rate, out_rate, zero_crossings
+            )
+            # Input samples from absolute index self._base on, starting
+            # with silence before the first real sample
+            self._base = -(self._half_width - 1)
+            self._history = np.zeros(self._half_width - 1, dtype=np.float32)
+            self._next = 0  # index of the next output sample
+        self.samples_in = 0
+        self.samples_out = 0
+
+    def _decode(self, data: bytes):
+        """Returns the mono float32 samples of whole frames in `data`."""
+        if self._partial:
+            data = self._partial + data
+        usable = len(data) - len(data) % self.format.frame_size
+        self._partial = data[usable:]
+        samples = np.frombuffer(data, dtype=self._dtype, count=usable // self._dtype.itemsize)
+        samples = samples.astype(np.float32)
+        if self.format.encoding == INT16:
+            samples *= 1.0 / 32768
+        if self.format.channels > 1:
+            samples = samples.reshape(-1, self.format.channels).mean(axis=1, dtype=np.float32)
+        return samples
+
+    def _resample(self, samples):
+        half_width = self._half_width
+        buffer = np.concatenate((self._history, samples))
+        end = self._base + len(buffer)
+        # Output k needs input up to floor(k * down / up) + half_width
+        last = ((end - 1 - half_width) * self._up + self._up - 1) // self._down
+        if last < self._next:
+            self._history = buffer
+            return np.empty(0, dtype=np.float32)
+
+        positions = np.arange(self._next, last + 1, dtype=np.int64) * self._down
+        starts = positions // self._up - (half_width - 1) - self._base
+        windows = sliding_window_view(buffer, 2 * half_width)[starts]
+        if self._up == 1:
+            output = windows @ self._bank[0]
+        else:
+            output = np.einsum(
+                "ij,ij->i", windows, self._bank[positions % self._up]
+            )
+
+        self._next = last + 1
+        keep_from = self._next * self._down // self._up - (half_width - 1)
+        self._history = buffer[keep_from - self._base :]
+        self._base = keep_from
+        # Every `up` outputs advance the input by exactly `down` samples;
+        # rebasing keeps the indices small in long sessions
+        periods = self._next // self._up
+        self._next -= periods * self._up
+        self._base -= periods * self._down
+        return output
+
+    def process(self, data: bytes) -> bytes:
+        """Converts the next chunk; returns 16 kHz mono int16 PCM bytes."""
+        samples = self._decode(data)
+        self.samples_in += len(samples)
+        if self._bank is not None:
+            samples = self._resample(samples)
+        pcm = np.rint(np.clip(samples * 32768.0, -32768.0, 32767.0)).astype("<i2")
+        self.samples_out += len(pcm)
+        return pcm.tobytes()
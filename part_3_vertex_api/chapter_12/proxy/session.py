@@ -0,0 +1,247 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Per-client session state and the options a client negotiated """
+import binascii
+import itertools
+import json
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import metrics
+from frames import (
+    AUDIO_FLAG_TURN_COMPLETE,
+    pack_audio_frame,
+    prefix_contains,
+    split_inline_audio,
+    wrap_pcm_audio,
+)
+from recorder import start_recording
+from resample import (
+    FLOAT32,
+    INT16,
+    StreamResampler,
+    UnsupportedAudioFormat,
+    available as resampling_available,
+    parse_format,
+    parse_mime_type,
+)
+from tools import SessionTools
+from turns import TurnTracker
+from video import VideoFilter
+
+# Value of the audio_in / audio_out query parameters for raw int16 frames
+PCM16 = "pcm16"
+# Value of the audio_in query parameter for raw float32 frames
+F32 = "f32"
+
+CLIENT_TO_SERVER = "Client->Server"
+SERVER_TO_CLIENT = "Server->Client"
+
+# Session ids used to correlate log records of one client session
+_session_ids = itertools.count(1)
+
+
+def _request_path(websocket) -> str:
+    request = getattr(websocket, "request", None)
+    if request is not None:
+        return request.path
+    # Legacy websockets server protocol
+    return getattr(websocket, "path", "") or ""
+
+
+class Session:
+    """
+    State of one proxied client session, shared by both directions.
+
+    Clients opt into extensions with query parameters on the WebSocket URL:
+
+    - audio_in=pcm16: binary frames sent by the client are raw 16 kHz mono
+      int16 PCM, which the proxy wraps into realtime_input messages.
+      audio_in=f32 sends float32 samples instead, and audio_in_rate and
+      audio_in_channels declare another rate and interleaved channel count;
+      such audio is converted to 16 kHz mono int16 (see resample.py).
+    - audio_out=pcm16: model audio is decoded from serverContent inlineData
+      and sent as binary frames (frames.AUDIO_HEADER + PCM); everything else
+      the server sends goes out as text frames.
+    """
+
+    def __init__(self, client_websocket) -> None:
+        self.id = next(_session_ids)
+        self.client = client_websocket
+        path = _request_path(client_websocket)
+        query = parse_qs(urlsplit(path).query)
+        self.audio_in = query.get("audio_in", [""])[0]
+        self.audio_out = query.get("audio_out", [""])[0]
+        # Format of the binary audio frames the client sends
+        self.input_format = parse_format(
+            query.get("audio_in_rate", [""])[0],
+            query.get("audio_in_channels", [""])[0],
+            FLOAT32 if self.audio_in == F32 else INT16,
+        )
+        # One stateful converter per audio format the client sends
+        self._resamplers = {}
+        # perf_counter() of the last frame and the last audio/video frame
+        # in either direction, for the liveness monitor
+        self.last_activity = self.last_media = time.perf_counter()
+        # Upstream region the session was routed to
+        self.region = None
+        # Replayed when the upstream connection is re-established
+        self.setup_message = None
+        self.setup_completed = False
+        # Set when PROXY_RECORD_DIR is configured
+        self.recording = start_recording(self.id, path)
+        # Dedup and rate limits for the video frames the client sends
+        self.video = VideoFilter()
+        # Latency from the client's last input to the model's answer
+        self.turns = TurnTracker(self)
+        # Function calls answered by the proxy (PROXY_TOOLS)
+        self.tools = SessionTools(self)
+        # Position of the next binary audio frame sent to the client
+        self.turn = 0
+        self.audio_sequence = 0
+
+    @property
+    def binary_audio_in(self) -> bool:
+        return (
+            self.audio_in in (PCM16, F32)
+            and self.input_format is not None
+            and (self.input_format.native or resampling_available())
+        )
+
+    @property
+    def binary_audio_out(self) -> bool:
+        return self.audio_out == PCM16
+
+    def negotiated(self) -> dict:
+        """Extensions accepted for this session, echoed in authComplete."""
+        options = {}
+        if self.binary_audio_in:
+            options["audioIn"] = self.audio_in
+            if not self.input_format.native:
+                options["audioInRate"] = self.input_format.rate
+                options["audioInChannels"] = self.input_format.channels
+        if self.binary_audio_out:
+            options["audioOut"] = PCM16
+        return options
+
+    def convert_audio(self, data: bytes, audio_format) -> bytes:
+        """Converts client audio in `audio_format` to 16 kHz mono int16 PCM."""
+        if audio_format.native:
+            return data
+        resampler = self._resamplers.get(audio_format)
+        if resampler is None:
+            resampler = self._resamplers[audio_format] = StreamResampler(audio_format)
+        samples = resampler.samples_in
+        pcm = resampler.process(data)
+        metrics.AUDIO_SAMPLES_CONVERTED.inc(resampler.samples_in - samples)
+        return pcm
+
+    def wrap_client_audio(self, data: bytes):
+        """
+        Wraps a binary audio frame from the client into a realtime_input
+        message, or returns None if it did not complete an output sample.
+        """
+        pcm = self.convert_audio(data, self.input_format)
+        return wrap_pcm_audio(pcm) if pcm else None
+
+    def convert_realtime_audio(self, frame):
+        """
+        Converts the audio chunks of a realtime_input frame that declare a
+        format other than 16 kHz mono int16 (frames.declares_audio_format).
+        Returns the frame to forward, or None if nothing is left to send.
+
+        Raises UnsupportedAudioFormat for audio that cannot be converted:
+        an invalid format, or any other format without resampling.
+        """
+        message = json.loads(frame)
+        realtime_input = message.get("realtime_input") or message.get("realtimeInput")
+        if not isinstance(realtime_input, dict):
+            return frame
+        chunks_key = "media_chunks" if "media_chunks" in realtime_input else "mediaChunks"
+        chunks = realtime_input.get(chunks_key)
+        if not isinstance(chunks, list):
+            return frame
+        converted = False
+        forwarded = []
+        for chunk in chunks:
+            mime_key = "mime_type" if "mime_type" in chunk else "mimeType"
+            mime_type = chunk.get(mime_key) or ""
+            if not mime_type.startswith("audio/pcm"):
+                forwarded.append(chunk)
+                continue
+            audio_format = parse_mime_type(mime_type)
+            if audio_format is None or not (audio_format.native or resampling_available()):
+                raise UnsupportedAudioFormat(mime_type)
+            if audio_format.native:
+                forwarded.append(chunk)
+                continue
+            converted = True
+            pcm = self.convert_audio(binascii.a2b_base64(chunk["data"]), audio_format)
+            if pcm:
+                data = binascii.b2a_base64(pcm, newline=False).decode("ascii")
+                forwarded.append({mime_key: "audio/pcm", "data": data})
+        if not converted:
+            return frame
+        if not forwarded:
+            return None
+        if len(message) == 1 and len(realtime_input) == 1 and len(chunks) == 1:
+            # A lone audio chunk goes out in the canonical envelope, which
+            # the coalescing stage can merge
+            return wrap_pcm_audio(pcm)
+        realtime_input[chunks_key] = forwarded
+        return json.dumps(message)
+
+    def _end_turn(self) -> None:
+        self.turn += 1
+        self.audio_sequence = 0
+
+    def unwrap_server_audio(self, frame, inline_data: bool) -> list:
+        """
+        Splits a serverContent frame into binary audio frames and the
+        remaining JSON message, as a list of (frame, as_text).
+        """
+        split = split_inline_audio(frame) if inline_data else None
+        if split is None:
+            # A turn ends with a small {"serverContent": {"turnComplete": ...}}
+            if prefix_contains(frame, "turnComplete") or prefix_contains(
+                frame, "interrupted"
+            ):
+                self._end_turn()
+            return [(frame, True)]
+
+        chunks, remainder = split
+        server_content = {}
+        if remainder is not None:
+            server_content = (
+                remainder.get("serverContent") or remainder.get("server_content") or {}
+            )
+        turn_ends = bool(
+            server_content.get("turnComplete")
+            or server_content.get("turn_complete")
+            or server_content.get("interrupted")
+        )
+        outgoing = []
+        for index, (rate, pcm) in enumerate(chunks):
+            flags = 0
+            if turn_ends and index == len(chunks) - 1:
+                flags |= AUDIO_FLAG_TURN_COMPLETE
+            outgoing.append(
+                (pack_audio_frame(self.turn, self.audio_sequence, rate, pcm, flags), False)
+            )
+            self.audio_sequence += 1
+        if remainder is not None:
+            outgoing.append((json.dumps(remainder), True))
+        if turn_ends:
+            self._end_turn()
+        return outgoing
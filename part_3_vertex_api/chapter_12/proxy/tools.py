@@ -0,0 +1,272 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Function calls answered by the proxy instead of the client.
+
+Tools registered with PROXY_TOOLS are HTTP endpoints: the proxy POSTs the
+call's arguments as JSON and uses the JSON it gets back as the result.
+Calls to them are taken out of the model's toolCall messages and answered
+with a tool_response sent straight upstream, so the model does not wait
+for a round trip to the browser and back. Calls to other functions still
+go to the client.
+
+All sessions of a worker share one pooled aiohttp client and a cache of
+results keyed by function name and arguments; identical calls made while a
+request is in flight share that request.
+"""
+import asyncio
+import collections
+import json
+import logging
+import os
+import time
+
+import metrics
+from config import env_float, env_int
+from frames import TOOL_RESPONSE
+from proxy_log import log, log_exception
+
+try:
+    # Optional: without aiohttp, every function call goes to the client
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# Tools answered by the proxy as name=url pairs, e.g.
+# "get_weather=http://127.0.0.1:8095/weather"; empty disables interception.
+TOOLS = os.environ.get("PROXY_TOOLS", "")
+# Seconds a tool request may take before the call is answered with an error.
+TOOL_TIMEOUT = env_float("PROXY_TOOL_TIMEOUT", 10.0)
+# Connections the pooled HTTP client keeps open across all tools.
+TOOL_CONNECTIONS = env_int("PROXY_TOOL_CONNECTIONS", 100)
+# Results kept in the cache; the least recently used are evicted first.
+TOOL_CACHE_SIZE = env_int("PROXY_TOOL_CACHE_SIZE", 1024)
+# Seconds a cached result stays valid; 0 disables the cache.
+TOOL_CACHE_TTL = env_float("PROXY_TOOL_CACHE_TTL", 300.0)
+
+
+def configured_tools() -> dict:
+    """Tool endpoints by function name, from PROXY_TOOLS."""
+    tools = {}
+    for item in TOOLS.split(","):
+        name, _, url = item.strip().partition("=")
+        if name and url:
+            tools[name] = url
+    return tools
+
+
+class TtlCache:
+    """LRU cache whose entries also expire `ttl` seconds after being stored."""
+
+    def __init__(self, size: int, ttl: float) -> None:
+        self.size = size
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key):
+        """Returns the cached value, or None if missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value) -> None:
+        if self.size <= 0 or self.ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+
+class ToolExecutor:
+    """
+    Calls the registered tools for all sessions of this process.
+
+    The HTTP client is created on the first call, inside the event loop,
+    and keeps up to TOOL_CONNECTIONS connections alive for reuse.
+    """
+
+    def __init__(self, tools: dict) -> None:
+        self.tools = tools
+        self.cache = TtlCache(TOOL_CACHE_SIZE, TOOL_CACHE_TTL)
+        self._inflight = {}
+        self._http = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.tools) and aiohttp is not None
+
+    def handles(self, name) -> bool:
+        return name in self.tools
+
+    def start(self) -> None:
+        """Reports the registered tools; requests are made on demand."""
+        if self.tools and aiohttp is None:
+            log(logging.WARNING, "PROXY_TOOLS needs aiohttp, function calls go to the client")
+        elif self.tools:
+            log(logging.INFO, "tools registered", tools=",".join(self.tools))
+
+    async def stop(self) -> None:
+        if self._http is not None:
+            http, self._http = self._http, None
+            await http.close()
+
+    def _client(self):
+        if self._http is None:
+            self._http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=TOOL_CONNECTIONS, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=TOOL_TIMEOUT),
+            )
+        return self._http
+
+    async def call(self, name: str, args: dict) -> dict:
+        """Returns the result of one function call, from the cache if possible."""
+        started = time.perf_counter()
+        key = (name, json.dumps(args, sort_keys=True, separators=(",", ":")))
+        result = self.cache.get(key)
+        if result is not None:
+            outcome = "cached"
+        else:
+            request = self._inflight.get(key)
+            if request is None:
+                request = self._inflight[key] = asyncio.ensure_future(self._request(key, name, args))
+                request.add_done_callback(lambda _: self._inflight.pop(key, None))
+            # A session that goes away must not cancel a request others share
+            result, ok = await asyncio.shield(request)
+            outcome = "ok" if ok else "error"
+        metrics.TOOL_CALLS.labels(name, outcome).inc()
+        metrics.TOOL_CALL_TIME.labels(name).observe(time.perf_counter() - started)
+        return result
+
+    async def _request(self, key, name: str, args: dict):
+        """POSTs the arguments to the tool; returns (result, ok)."""
+        try:
+            async with self._client().post(self.tools[name], json=args) as response:
+                response.raise_for_status()
+                result = await response.json(content_type=None)
+        except Exception as e:
+            log(logging.WARNING, "tool call failed", tool=name, error=e)
+            return {"error": f"{name} failed: {e}"}, False
+        if not isinstance(result, dict):
+            # The response has to be a JSON object
+            result = {"result": result}
+        self.cache.put(key, result)
+        return result, True
+
+
+executor = ToolExecutor(configured_tools())
+
+
+class SessionTools:
+    """
+    Answers one session's calls to registered tools.
+
+    `upstream` is the session's client-to-server FrameQueue, through which
+    the tool responses are sent; it is set by the forwarding task.
+    """
+
+    def __init__(self, session) -> None:
+        self.session = session
+        self.upstream = None
+        # Calls being answered, by call id
+        self._tasks = {}
+
+    def intercept(self, frame):
+        """
+        Starts answering the calls of a toolCall frame that go to registered
+        tools. Returns what to forward to the client: the frame itself, the
+        frame without those calls, or None if no call is left.
+        """
+        if self.upstream is None:
+            return frame
+        try:
+            message = json.loads(frame)
+            tool_call = message.get("toolCall") or message.get("tool_call")
+            key = "functionCalls" if "functionCalls" in tool_call else "function_calls"
+            calls = tool_call.get(key) or []
+        except (ValueError, AttributeError, TypeError):
+            return frame
+        local = [call for call in calls if executor.handles(call.get("name"))]
+        if not local:
+            return frame
+
+        task = asyncio.create_task(self._answer(local))
+        ids = [call.get("id") for call in local]
+        for call_id in ids:
+            self._tasks[call_id] = task
+
+        def forget(_):
+            for call_id in ids:
+                self._tasks.pop(call_id, None)
+
+        task.add_done_callback(forget)
+
+        if len(local) == len(calls):
+            return None
+        tool_call[key] = [call for call in calls if not executor.handles(call.get("name"))]
+        forwarded = json.dumps(message)
+        return forwarded.encode() if isinstance(frame, bytes) else forwarded
+
+    def cancel(self, frame) -> None:
+        """Stops answering the calls named in a toolCallCancellation frame."""
+        try:
+            message = json.loads(frame)
+            cancellation = message.get("toolCallCancellation") or message.get("tool_call_cancellation")
+            ids = cancellation.get("ids") or []
+        except (ValueError, AttributeError, TypeError):
+            return
+        for call_id in ids:
+            task = self._tasks.get(call_id)
+            if task is not None:
+                task.cancel()
+
+    async def _answer(self, calls) -> None:
+        started = time.perf_counter()
+        try:
+            results = await asyncio.gather(
+                *(executor.call(call["name"], call.get("args") or {}) for call in calls)
+            )
+            responses = []
+            for call, result in zip(calls, results):
+                response = {"name": call["name"], "response": {"result": {"object_value": result}}}
+                if call.get("id") is not None:
+                    response["id"] = call["id"]
+                responses.append(response)
+            frame = json.dumps({"tool_response": {"function_responses": responses}}).encode()
+            await self.upstream.put(frame, False, (TOOL_RESPONSE, time.perf_counter(), True))
+            log(
+                logging.INFO,
+                "tool calls answered",
+                session=self.session.id,
+                tools=",".join(call["name"] for call in calls),
+                ms=round((time.perf_counter() - started) * 1000, 1),
+            )
+        except asyncio.CancelledError:
+            log(logging.INFO, "tool calls cancelled", session=self.session.id)
+            raise
+        except Exception:
+            log_exception("answering tool calls failed", session=self.session.id)
+
+    def close(self) -> None:
+        for task in set(self._tasks.values()):
+            task.cancel()
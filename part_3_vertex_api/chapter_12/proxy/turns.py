@@ -0,0 +1,230 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Turn latency as seen by the proxy.
+
+A turn starts with the last client input (realtime_input or client_content)
+before the model answers. Its timeline is split at the proxy's edges so
+proxy overhead can be told apart from the time spent upstream:
+
+    uplink         last input received from the client -> sent upstream
+    model          last input sent upstream -> first model audio received
+    downlink       first model audio received -> sent to the client
+    first_audio    last input received -> first model audio sent
+    turn_complete  last input received -> turnComplete/interrupted sent
+
+Each stage is observed in the proxy_turn_latency_seconds histogram, and
+with PROXY_TURN_TRACE every turn is also appended to a JSON Lines file by a
+writer thread.
+
+For clients that stream audio continuously, the last input is simply the
+latest chunk; the times are those felt by the user when the client stops
+sending at the end of speech, as a client-side VAD does.
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+
+import metrics
+from config import env_int
+from frames import TURN_INTERRUPTED
+
+# JSON Lines file that receives one record per turn; empty disables tracing.
+TURN_TRACE = os.environ.get("PROXY_TURN_TRACE", "")
+# Records waiting for the writer thread; further records are left out.
+TURN_TRACE_QUEUE_SIZE = env_int("PROXY_TURN_TRACE_QUEUE_SIZE", 10000)
+
+_records = None
+_writer = None
+_dropped = 0
+_lock = threading.Lock()
+
+
+def dropped_traces() -> int:
+    """Number of turn records left out of the trace because the writer fell behind."""
+    return _dropped
+
+
+metrics.Gauge(
+    "proxy_turn_trace_dropped",
+    "Turn records left out of PROXY_TURN_TRACE because the writer fell behind.",
+    callback=dropped_traces,
+)
+
+
+def _write_loop(records: queue.Queue, path: str) -> None:
+    with open(path, "a", buffering=1) as f:
+        while True:
+            record = records.get()
+            if record is None:
+                break
+            f.write(json.dumps(record) + "\n")
+
+
+def _start_writer() -> None:
+    global _records, _writer
+    with _lock:
+        if _writer is None:
+            _records = queue.Queue(maxsize=TURN_TRACE_QUEUE_SIZE)
+            _writer = threading.Thread(
+                target=_write_loop, args=(_records, TURN_TRACE), name="turn-trace", daemon=True
+            )
+            _writer.start()
+            atexit.register(shutdown)
+
+
+def shutdown() -> None:
+    """Writes out all queued records and closes the trace file."""
+    global _writer
+    if _writer is not None:
+        writer, _writer = _writer, None
+        _records.put(None)
+        writer.join()
+
+
+def _trace(record: dict) -> None:
+    global _dropped
+    _start_writer()
+    try:
+        _records.put_nowait(record)
+    except queue.Full:
+        _dropped += 1
+
+
+def _milliseconds(start, end):
+    if start is None or end is None:
+        return None
+    return round(max(end - start, 0.0) * 1000, 3)
+
+
+class _Turn:
+    __slots__ = (
+        "inputs", "input_received", "input_sent", "audio_received", "audio_sent",
+        "end_received", "result",
+    )
+
+    def __init__(self) -> None:
+        self.inputs = 0
+        self.input_received = None
+        self.input_sent = None
+        self.audio_received = None
+        self.audio_sent = None
+        self.end_received = None
+        self.result = None
+
+
+class TurnTracker:
+    """
+    Correlates one session's client input with the model's answers.
+
+    The reading side of each direction reports what it received (with the
+    perf_counter() stamp it attaches to the frame), the writing side reports
+    when a frame with that stamp went out, so queueing in the proxy is
+    counted where it happens.
+    """
+
+    def __init__(self, session) -> None:
+        self.session = session
+        self.turns = 0
+        self._current = _Turn()
+        # (turn, frames left to send) waiting for the downlink frames of one
+        # received message, by its received stamp
+        self._pending = {}
+
+    def client_input(self, received: float) -> None:
+        """A realtime_input or client_content frame arrived from the client."""
+        turn = self._current
+        if turn.audio_received is None:
+            turn.inputs += 1
+            turn.input_received = received
+
+    def input_sent(self, now: float) -> None:
+        """A client input frame was sent upstream."""
+        turn = self._current
+        if turn.audio_received is None and turn.input_received is not None:
+            turn.input_sent = now
+
+    def server_content(self, received: float, audio: bool, end, frames: int = 1) -> None:
+        """
+        A serverContent frame arrived; `audio` tells whether it carries
+        inline data and `end` is frames.turn_end() of it. It goes to the
+        client as `frames` frames (audio_out=pcm16 splits it up).
+        """
+        turn = self._current
+        if turn.input_received is None:
+            # The model spoke without being asked, e.g. a greeting
+            if end is not None:
+                self._current = _Turn()
+            return
+        if audio and turn.audio_received is None:
+            turn.audio_received = received
+            self._pending[received] = (turn, frames)
+        if end is not None:
+            turn.end_received = received
+            turn.result = end
+            self._pending[received] = (turn, frames)
+            self._current = _Turn()
+
+    def server_content_sent(self, received: float, now: float) -> None:
+        """
+        A serverContent frame with the given received stamp went to the
+        client. The first frame of a message delivers its audio; the turn
+        ends with the last one.
+        """
+        entry = self._pending.get(received)
+        if entry is None:
+            return
+        turn, frames = entry
+        if turn.audio_received == received and turn.audio_sent is None:
+            turn.audio_sent = now
+        if frames > 1:
+            self._pending[received] = (turn, frames - 1)
+            return
+        del self._pending[received]
+        if turn.end_received == received:
+            self._finish(turn, now)
+
+    def _finish(self, turn: _Turn, now: float) -> None:
+        self.turns += 1
+        stages = {
+            "uplink": (turn.input_received, turn.input_sent),
+            "model": (turn.input_sent, turn.audio_received),
+            "downlink": (turn.audio_received, turn.audio_sent),
+            "first_audio": (turn.input_received, turn.audio_sent),
+            "turn_complete": (turn.input_received, now),
+        }
+        result = "interrupted" if turn.result == TURN_INTERRUPTED else "complete"
+        metrics.TURNS.labels(result).inc()
+        record = {}
+        for stage, (start, end) in stages.items():
+            if start is not None and end is not None:
+                metrics.TURN_LATENCY.labels(stage).observe(max(end - start, 0.0))
+            record[f"{stage}_ms"] = _milliseconds(start, end)
+        if TURN_TRACE:
+            region = self.session.region
+            _trace(
+                {
+                    "ts": time.time() - (now - turn.input_received),
+                    "session": self.session.id,
+                    "pid": os.getpid(),
+                    "turn": self.turns,
+                    "region": region.name if region is not None else None,
+                    "result": result,
+                    "inputs": turn.inputs,
+                    **record,
+                }
+            )
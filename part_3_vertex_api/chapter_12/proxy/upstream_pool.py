@@ -0,0 +1,182 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Pool of pre-connected, authenticated upstream WebSockets """
+import asyncio
+import collections
+import logging
+import time
+from typing import Optional
+
+import websockets
+from websockets.protocol import State
+
+from config import env_float, env_int
+from credentials import token_cache
+from liveness import HEARTBEAT_INTERVAL
+from metrics import UPSTREAM_CONNECT
+from proxy_log import log, log_exception
+
+# Number of idle upstream connections to keep ready (0 disables pooling).
+POOL_SIZE = env_int("PROXY_UPSTREAM_POOL_SIZE", 2)
+# Idle connections older than this are closed and replaced, so clients never
+# receive a socket the server is about to time out.
+POOL_MAX_IDLE = env_float("PROXY_UPSTREAM_POOL_MAX_IDLE", 60.0)
+# Delay before retrying after a failed pre-connect.
+POOL_RETRY_DELAY = env_float("PROXY_UPSTREAM_POOL_RETRY_DELAY", 5.0)
+
+
+class UpstreamPool:
+    """
+    Keeps `size` authenticated WebSockets to `url` open and ready to use.
+
+    acquire() hands out a warm connection when one is available, so a new
+    session skips the DNS, TCP, TLS and WebSocket handshakes. When the pool
+    is empty it falls back to connecting on demand.
+    """
+
+    def __init__(self, url: str, ssl_context, size: int = POOL_SIZE) -> None:
+        self.url = url
+        self.ssl_context = ssl_context
+        self.size = size
+        self._idle = collections.deque()  # (websocket, connected_at)
+        self._wakeup = asyncio.Event()
+        self._filler: Optional[asyncio.Task] = None
+        self._closing = set()
+
+    async def connect(self, bearer_token: Optional[str] = None):
+        """Opens a new authenticated upstream connection."""
+        if bearer_token is None:
+            bearer_token = await token_cache.get()
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {bearer_token}",
+        }
+        return await websockets.connect(
+            self.url,
+            additional_headers=headers,
+            ssl=self.ssl_context,
+            # Sessions are pinged by the liveness monitor; idle pooled
+            # connections are replaced before they could time out
+            ping_interval=None if HEARTBEAT_INTERVAL else 20,
+        )
+
+    async def acquire(self, bearer_token: Optional[str] = None):
+        """Returns an open upstream connection, preferring a pre-warmed one."""
+        started = time.perf_counter()
+        now = time.monotonic()
+        try:
+            while self._idle:
+                websocket, connected_at = self._idle.popleft()
+                if (
+                    websocket.state is State.OPEN
+                    and now - connected_at < POOL_MAX_IDLE
+                ):
+                    UPSTREAM_CONNECT.labels("pool").observe(
+                        time.perf_counter() - started
+                    )
+                    return websocket
+                self._close_later(websocket)
+        finally:
+            # Let the filler top the pool back up
+            self._wakeup.set()
+        websocket = await self.connect(bearer_token)
+        UPSTREAM_CONNECT.labels("connect").observe(time.perf_counter() - started)
+        return websocket
+
+    @property
+    def idle(self) -> int:
+        """Number of warm connections currently waiting in the pool."""
+        return len(self._idle)
+
+    @staticmethod
+    async def _close(websocket) -> None:
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+
+    def _close_later(self, websocket) -> None:
+        task = asyncio.create_task(self._close(websocket))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    def _evict_expired(self) -> None:
+        now = time.monotonic()
+        keep = collections.deque()
+        for websocket, connected_at in self._idle:
+            if websocket.state is State.OPEN and now - connected_at < POOL_MAX_IDLE:
+                keep.append((websocket, connected_at))
+            else:
+                self._close_later(websocket)
+        self._idle = keep
+
+    async def _fill(self) -> None:
+        while True:
+            self._wakeup.clear()
+            self._evict_expired()
+            missing = self.size - len(self._idle)
+            if missing > 0:
+                results = await asyncio.gather(
+                    *(self.connect() for _ in range(missing)),
+                    return_exceptions=True,
+                )
+                failed = False
+                for result in results:
+                    if isinstance(result, BaseException):
+                        failed = True
+                        log(
+                            logging.WARNING,
+                            "upstream pre-connect failed",
+                            url=self.url,
+                            error=result,
+                        )
+                    else:
+                        self._idle.append((result, time.monotonic()))
+                if failed:
+                    await asyncio.sleep(POOL_RETRY_DELAY)
+                    continue
+            try:
+                # Wake up when a connection is taken, or in time to replace
+                # connections before they reach their maximum idle age.
+                await asyncio.wait_for(self._wakeup.wait(), POOL_MAX_IDLE / 2)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._fill()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log_exception("upstream pool error", url=self.url)
+                await asyncio.sleep(POOL_RETRY_DELAY)
+
+    def start(self) -> None:
+        """Starts keeping the pool filled in the background."""
+        if self.size > 0 and self._filler is None:
+            self._filler = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops the filler and closes all idle connections."""
+        if self._filler is not None:
+            self._filler.cancel()
+            try:
+                await self._filler
+            except asyncio.CancelledError:
+                pass
+            self._filler = None
+        while self._idle:
+            websocket, _ = self._idle.popleft()
+            await self._close(websocket)
@@ -0,0 +1,185 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Per-session filtering of client video frames: dedup and rate limits """
+import asyncio
+import binascii
+import hashlib
+import io
+import re
+from typing import Optional
+
+from config import env_flag, env_float, env_int
+
+try:
+    # Optional: enables perceptual (near-duplicate) matching of JPEG frames
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Drop frames that look the same as the last forwarded frame (opt-in).
+VIDEO_DEDUP = env_flag("PROXY_VIDEO_DEDUP", False)
+# Hamming distance (out of 256 bits) up to which two frames count as the same
+# picture. Only used when Pillow is installed; otherwise only byte-identical
+# frames are dropped.
+VIDEO_DEDUP_DISTANCE = env_int("PROXY_VIDEO_DEDUP_DISTANCE", 6)
+# Seconds after which a frame is forwarded even if it looks the same, so a
+# change the hash misses is never hidden from the model for long.
+VIDEO_DEDUP_MAX_AGE = env_float("PROXY_VIDEO_DEDUP_MAX_AGE", 2.0)
+# Per-session ceilings on forwarded video; 0 means unlimited.
+VIDEO_MAX_FPS = env_float("PROXY_VIDEO_MAX_FPS", 0.0)
+VIDEO_MAX_KBPS = env_float("PROXY_VIDEO_MAX_KBPS", 0.0)
+
+# Reasons a frame is filtered, used as metric label values
+DUPLICATE = "duplicate"
+FPS = "fps"
+BITRATE = "bitrate"
+
+_DATA_STR = re.compile(r'"data"\s*:\s*"([^"]*)"')
+_DATA_BYTES = re.compile(rb'"data"\s*:\s*"([^"]*)"')
+
+# Side of the dHash grid; the hash has _HASH_SIZE ** 2 bits
+_HASH_SIZE = 16
+
+
+def perceptual_available() -> bool:
+    """Whether near-duplicate frames can be matched (Pillow is installed)."""
+    return Image is not None
+
+
+def _image_payload(frame):
+    """Returns the base64 image data of a realtime_input video frame."""
+    pattern = _DATA_STR if isinstance(frame, str) else _DATA_BYTES
+    match = pattern.search(frame)
+    return match.group(1) if match else None
+
+
+def _difference_hash(jpeg: bytes) -> int:
+    """256-bit dHash of a picture: brightness gradients of a 17x16 thumbnail."""
+    image = Image.open(io.BytesIO(jpeg))
+    # Let the JPEG decoder scale down by up to 8x instead of decoding fully
+    image.draft("L", (128, 128))
+    width = _HASH_SIZE + 1
+    pixels = image.convert("L").resize((width, _HASH_SIZE)).tobytes()
+    bits = 0
+    for row in range(_HASH_SIZE):
+        for col in range(_HASH_SIZE):
+            left = pixels[row * width + col]
+            bits = (bits << 1) | (left > pixels[row * width + col + 1])
+    return bits
+
+
+def fingerprint(payload):
+    """
+    Returns (perceptual, digest) for base64 image data. `perceptual` is a
+    dHash, or None if Pillow is missing or the image cannot be decoded.
+    """
+    if isinstance(payload, str):
+        payload = payload.encode("ascii")
+    digest = hashlib.blake2b(payload, digest_size=16).digest()
+    if Image is None:
+        return None, digest
+    try:
+        return _difference_hash(binascii.a2b_base64(payload)), digest
+    except Exception:
+        return None, digest
+
+
+class VideoFilter:
+    """
+    Decides which video frames of one session are forwarded upstream.
+
+    A frame is dropped when it matches the last forwarded frame (unless
+    that one is older than VIDEO_DEDUP_MAX_AGE), when it arrives sooner
+    than VIDEO_MAX_FPS allows, or when forwarding it would exceed
+    VIDEO_MAX_KBPS (a token bucket holding one second of budget).
+    """
+
+    def __init__(
+        self,
+        dedup: bool = VIDEO_DEDUP,
+        dedup_distance: int = VIDEO_DEDUP_DISTANCE,
+        dedup_max_age: float = VIDEO_DEDUP_MAX_AGE,
+        max_fps: float = VIDEO_MAX_FPS,
+        max_kbps: float = VIDEO_MAX_KBPS,
+    ) -> None:
+        self.dedup = dedup
+        self.dedup_distance = dedup_distance
+        self.dedup_max_age = dedup_max_age
+        self.min_interval = 1 / max_fps if max_fps > 0 else 0.0
+        self.max_bytes_per_s = max_kbps * 1000 / 8
+        self._next_due = 0.0
+        self._last_fingerprint = (None, None)
+        self._last_forwarded = None
+        self._budget = self.max_bytes_per_s
+        self._budget_updated = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.dedup or self.min_interval > 0 or self.max_bytes_per_s > 0
+
+    def _is_duplicate(self, fingerprint_) -> bool:
+        perceptual, digest = fingerprint_
+        last_perceptual, last_digest = self._last_fingerprint
+        if digest == last_digest:
+            return True
+        if perceptual is None or last_perceptual is None:
+            return False
+        return bin(perceptual ^ last_perceptual).count("1") <= self.dedup_distance
+
+    def _refill(self, now: float) -> None:
+        if self._budget_updated is not None:
+            self._budget = min(
+                self._budget + (now - self._budget_updated) * self.max_bytes_per_s,
+                self.max_bytes_per_s,
+            )
+        self._budget_updated = now
+
+    async def admit(self, frame, now: float) -> Optional[str]:
+        """
+        Returns None if the frame should be forwarded, else the drop reason.
+        The image is decoded in a worker thread to keep the event loop free.
+        """
+        # Frames may come up to half an interval early, so capture jitter
+        # around the allowed rate does not drop every other frame
+        if self.min_interval and now < self._next_due - self.min_interval / 2:
+            return FPS
+
+        fingerprint_ = (None, None)
+        if self.dedup:
+            payload = _image_payload(frame)
+            if payload is not None:
+                if Image is None:
+                    fingerprint_ = fingerprint(payload)
+                else:
+                    fingerprint_ = await asyncio.to_thread(fingerprint, payload)
+                stale = (
+                    self._last_forwarded is None
+                    or now - self._last_forwarded >= self.dedup_max_age
+                )
+                if not stale and self._is_duplicate(fingerprint_):
+                    return DUPLICATE
+
+        if self.max_bytes_per_s:
+            self._refill(now)
+            # A frame bigger than the whole budget still passes once the
+            # bucket is full, and is paid off by the following frames
+            if len(frame) > self._budget and self._budget < self.max_bytes_per_s:
+                return BITRATE
+            self._budget -= len(frame)
+
+        self._next_due = max(self._next_due, now) + self.min_interval
+        self._last_forwarded = now
+        if fingerprint_ != (None, None):
+            self._last_fingerprint = fingerprint_
+        return None
@@ -29,9 +29,11 @@ function arrayBufferToBase64(buffer) {
 }
 
 export class AudioRecorder extends EventEmitter3 {
-  constructor() {
+  constructor(sampleRate = 16000) {
     super();
-    this.sampleRate = 16000;
+    // null records at the device's native rate, which the proxy converts
+    // to 16 kHz; sampleRate holds the actual rate once started
+    this.sampleRate = sampleRate;
     this.stream = undefined;
     this.audioContext = undefined;
     this.source = undefined;
@@ -49,6 +51,7 @@ export class AudioRecorder extends EventEmitter3 {
     this.starting = new Promise(async (resolve, reject) => {
       this.stream = await navigator.mediaDevices.getUserMedia({ audio: true });
       this.audioContext = await audioContext({ sampleRate: this.sampleRate });
+      this.sampleRate = this.audioContext.sampleRate;
       this.source = this.audioContext.createMediaStreamSource(this.stream);
 
       const workletName = "audio-recorder-worklet";
@@ -74,8 +77,12 @@ export class AudioRecorder extends EventEmitter3 {
         const arrayBuffer = ev.data.data.int16arrayBuffer;
 
         if (arrayBuffer) {
-          const arrayBufferString = arrayBufferToBase64(arrayBuffer);
-          this.emit("data", arrayBufferString);
+          // Raw PCM for binary transports; base64 only if someone wants it
+          this.emit("pcm", arrayBuffer);
+          if (this.listenerCount("data") > 0) {
+            const arrayBufferString = arrayBufferToBase64(arrayBuffer);
+            this.emit("data", arrayBufferString);
+          }
         }
       };
       this.source.connect(this.recordingWorklet);
@@ -24,6 +24,7 @@ export class AudioStreamer {
       this.gainNode = this.context.createGain();
       this.gainNode.connect(this.context.destination);
       this.addPCM16 = this.addPCM16.bind(this);
+      this.addInt16 = this.addInt16.bind(this);
       this.onComplete = () => {};
       this.playbackTimeout = null;
       this.lastPlaybackTime = 0;
@@ -42,7 +43,19 @@ export class AudioStreamer {
           console.error(e);
         }
       }
+      this.addFloat32(float32Array);
+    }
+
+    addInt16(samples) {
+      // Samples of a binary audio frame, already in native int16 form
+      const float32Array = new Float32Array(samples.length);
+      for (let i = 0; i < samples.length; i++) {
+        float32Array[i] = samples[i] / 32768;
+      }
+      this.addFloat32(float32Array);
+    }
 
+    addFloat32(float32Array) {
       // Create and fill audio buffer
       const audioBuffer = this.context.createBuffer(1, float32Array.length, this.sampleRate);
       audioBuffer.getChannelData(0).set(float32Array);
@@ -1,8 +1,29 @@
 class GeminiLiveAPI {
-  constructor(endpoint, autoSetup = true, setupConfig = null) {
+  constructor(endpoint, autoSetup = true, setupConfig = null, binaryAudio = false,
+              inputSampleRate = 16000) {
+    // Ask the proxy to exchange audio as raw PCM binary frames
+    // (audio_in=pcm16 and audio_out=pcm16)
+    if (binaryAudio) {
+      const url = new URL(endpoint, window.location.href);
+      url.searchParams.set('audio_in', 'pcm16');
+      url.searchParams.set('audio_out', 'pcm16');
+      if (inputSampleRate !== 16000) {
+        // The proxy resamples microphone audio recorded at another rate
+        url.searchParams.set('audio_in_rate', String(inputSampleRate));
+      }
+      endpoint = url.toString();
+    }
+    this.inputSampleRate = inputSampleRate;
     this.ws = new WebSocket(endpoint);
+    if (binaryAudio) {
+      this.ws.binaryType = 'arraybuffer';
+    }
+    this.binaryAudioIn = false;
+    this.binaryAudioOut = false;
     this.onSetupComplete = () => {};
     this.onAudioData = () => {};
+    // Receives raw PCM of binary audio frames; defaults to onAudioData
+    this.onAudioBuffer = (pcmBuffer) => this.onAudioData(this.arrayBufferToBase64(pcmBuffer));
     this.onInterrupted = () => {};
     this.onTurnComplete = () => {};
     this.onError = () => {};
@@ -29,6 +50,11 @@ class GeminiLiveAPI {
 
     this.ws.onmessage = async (event) => {
       try {
+        if (event.data instanceof ArrayBuffer) {
+          this.handleAudioFrame(event.data);
+          return;
+        }
+
         let wsResponse;
         if (event.data instanceof Blob) {
           const responseText = await event.data.text();
@@ -39,7 +65,12 @@ class GeminiLiveAPI {
 
         console.log('WebSocket Response:', wsResponse);
 
-        if (wsResponse.setupComplete) {
+        if (wsResponse.authComplete) {
+          // The proxy confirms the extensions it accepted
+          this.binaryAudioIn = wsResponse.audioIn === 'pcm16' &&
+            (wsResponse.audioInRate || 16000) === this.inputSampleRate;
+          this.binaryAudioOut = wsResponse.audioOut === 'pcm16';
+        } else if (wsResponse.setupComplete) {
           this.onSetupComplete();
         } else if (wsResponse.toolCall) {
           this.onToolCall(wsResponse.toolCall);
@@ -79,6 +110,32 @@ class GeminiLiveAPI {
     };
   }
 
+  handleAudioFrame(frame) {
+    // Header: version, flags, turn, sequence, sample rate (little-endian)
+    const header = new DataView(frame, 0, 12);
+    const flags = header.getUint8(1);
+    const info = {
+      turn: header.getUint16(2, true),
+      sequence: header.getUint32(4, true),
+      sampleRate: header.getUint32(8, true),
+    };
+    this.onAudioBuffer(frame.slice(12), info);
+
+    // Flag 0x01: the message that carried this audio also completed the turn
+    if (!(flags & 0x01)) {
+      this.sendContinueSignal();
+    }
+  }
+
+  arrayBufferToBase64(buffer) {
+    const bytes = new Uint8Array(buffer);
+    let binary = '';
+    for (let i = 0; i < bytes.byteLength; i++) {
+      binary += String.fromCharCode(bytes[i]);
+    }
+    return btoa(binary);
+  }
+
   sendMessage(message) {
     if (this.ws.readyState === WebSocket.OPEN) {
       this.ws.send(JSON.stringify(message));
@@ -124,7 +181,9 @@ class GeminiLiveAPI {
     const message = {
       realtime_input: {
         media_chunks: [{
-          mime_type: "audio/pcm",
+          mime_type: this.inputSampleRate === 16000
+            ? "audio/pcm"
+            : `audio/pcm;rate=${this.inputSampleRate}`,
           data: base64Audio
         }]
       }
@@ -133,6 +192,15 @@ class GeminiLiveAPI {
     this.sendMessage(message);
   }
 
+  sendAudioBuffer(int16ArrayBuffer) {
+    // Raw PCM frames skip base64 encoding when the proxy supports them
+    if (this.binaryAudioIn && this.ws.readyState === WebSocket.OPEN) {
+      this.ws.send(int16ArrayBuffer);
+      return;
+    }
+    this.sendAudioChunk(this.arrayBufferToBase64(int16ArrayBuffer));
+  }
+
   sendEndMessage() {
     const message = {
       client_content: {
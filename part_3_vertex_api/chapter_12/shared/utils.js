@@ -15,7 +15,9 @@
  */
 
 export async function audioContext({ sampleRate }) {
-  const context = new (window.AudioContext || window.webkitAudioContext)({ sampleRate });
+  // Without a sampleRate the context runs at the device's native rate
+  const options = sampleRate ? { sampleRate } : {};
+  const context = new (window.AudioContext || window.webkitAudioContext)(options);
   await context.resume();
   return context;
 }
@@ -11,31 +11,385 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-""" Pastra Tutorial Web Server"""
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+""" Pastra Tutorial Web Server
+
+By default files are served from an in-memory cache that is refreshed when a
+file's mtime changes. Responses carry an ETag so browsers revalidate with
+If-None-Match and get a 304 for unchanged files, and text assets are sent
+gzip or brotli compressed (brotli needs `pip install brotli`). Run with
+--dev to disable caching entirely (Cache-Control: no-store).
+
+Connections are handled on their own threads and kept alive (HTTP/1.1).
+Large files are sent straight from disk with sendfile(), and Range requests
+are answered with 206 so audio and video can be seeked.
+"""
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from http import HTTPStatus
+from http.server import HTTPServer, SimpleHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import gzip
+import hashlib
+import io
 import os
+import threading
+import urllib.parse
+
+try:
+    # Optional: adds a brotli variant next to the gzip one
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content types worth compressing; images, audio and video already are
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/javascript',
+    'application/json',
+    'application/xml',
+    'image/svg+xml',
+    'application/wasm',
+)
+# Smaller files do not get smaller when compressed
+MIN_COMPRESS_SIZE = 1024
+# Uncompressible files above this size are not kept in memory but sent from
+# disk with sendfile(), which copies them in the kernel
+SENDFILE_THRESHOLD = 64 * 1024
+
+
+class CachedFile:
+    """A file's body, its compressed variants and validators."""
+
+    def __init__(self, path, stat, content_type, max_memory_size):
+        self.mtime_ns = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.content_type = content_type
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        self.compressible = (
+            content_type.startswith(COMPRESSIBLE_TYPES) and self.size >= MIN_COMPRESS_SIZE
+        )
+        # Content-Encoding -> body; '' is the identity encoding. Files sent
+        # from disk have no variants.
+        self.variants = {}
+        in_memory = self.size <= max_memory_size and (
+            self.compressible or self.size <= SENDFILE_THRESHOLD
+        )
+        if not in_memory:
+            self.etag = '"%x-%x"' % (self.mtime_ns, self.size)
+            return
+        with open(path, 'rb') as f:
+            body = f.read()
+        self.etag = '"%s"' % hashlib.blake2b(body, digest_size=12).hexdigest()
+        self.variants[''] = body
+        if self.compressible:
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.variants['gzip'] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    self.variants['br'] = compressed
+
+    @property
+    def memory(self):
+        return sum(len(body) for body in self.variants.values())
+
+    def etag_for(self, encoding):
+        # Each representation needs its own strong validator
+        return self.etag if not encoding else '%s-%s"' % (self.etag[:-1], encoding)
+
+
+class FileCache:
+    """
+    Cache of served files, keyed by path and checked against the file's
+    mtime and size on every request. Bodies larger than max_file_size are
+    not kept; least recently used files are dropped above max_size.
+    """
+
+    def __init__(self, max_size=256 * 1024 * 1024, max_file_size=16 * 1024 * 1024):
+        self.max_size = max_size
+        self.max_file_size = max_file_size
+        self._files = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, stat, content_type):
+        """Returns the up-to-date CachedFile for path."""
+        with self._lock:
+            cached = self._files.get(path)
+            if (
+                cached is not None
+                and cached.mtime_ns == stat.st_mtime_ns
+                and cached.size == stat.st_size
+            ):
+                self._files.move_to_end(path)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        # Read and compress without blocking requests for other files
+        cached = CachedFile(path, stat, content_type, self.max_file_size)
+        with self._lock:
+            previous = self._files.pop(path, None)
+            if previous is not None:
+                self._size -= previous.memory
+            self._files[path] = cached
+            self._size += cached.memory
+            while self._size > self.max_size and len(self._files) > 1:
+                self._size -= self._files.popitem(last=False)[1].memory
+        return cached
+
+
+class FileSlice:
+    """Part of an open file, sent with sendfile() by copyfile()."""
+
+    def __init__(self, path, offset, count):
+        self.file = open(path, 'rb')
+        self.offset = offset
+        self.count = count
+
+    def close(self):
+        self.file.close()
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """
+    Returns (first, last) byte positions of a single `bytes=` range, or None
+    to send the whole file (no, malformed or multiple ranges).
+    """
+    unit, _, spec = (header or '').partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    if size == 0:
+        raise RangeNotSatisfiable()
+    first, dash, last = spec.strip().partition('-')
+    if not dash:
+        return None
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable()
+            return max(size - length, 0), size - 1
+        first = int(first)
+        last = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if first >= size:
+        raise RangeNotSatisfiable()
+    if first > last:
+        return None
+    return first, min(last, size - 1)
+
+
+def accepted_encodings(header):
+    """Returns the content codings a client accepts (q > 0), from Accept-Encoding."""
+    accepted = set()
+    for item in (header or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding and quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def etag_matches(header, etag):
+    """Checks an If-None-Match header against an ETag (weak comparison)."""
+    if header.strip() == '*':
+        return True
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
 
 class CORSRequestHandler(SimpleHTTPRequestHandler):
+    # Set from the command line
+    dev = False
+    max_age = 0
+    cache = FileCache()
+    # Idle keep-alive connections are closed after this many seconds
+    timeout = 30
+    # Headers and body are separate writes; without TCP_NODELAY the body
+    # would wait for the client's delayed ACK on kept-alive connections
+    disable_nagle_algorithm = True
+
     def end_headers(self):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET')
-        self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate')
+        if self.dev:
+            self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate')
         return super().end_headers()
 
     def do_OPTIONS(self):
         self.send_response(200)
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     def list_directory(self, path):
         # Enable directory listing
         return super().list_directory(path)
 
+    def _file_path(self):
+        """Returns the file to serve for this request, or None for the default handling."""
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            if not urllib.parse.urlsplit(self.path).path.endswith('/'):
+                return None  # Redirected to the path with a trailing slash
+            for index in ('index.html', 'index.htm'):
+                index = os.path.join(path, index)
+                if os.path.isfile(index):
+                    return index
+            return None  # Directory listing
+        if path.endswith('/'):
+            return None
+        return path
+
+    def _not_modified(self, cached, etag):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return etag_matches(if_none_match, etag)
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            return int(cached.mtime_ns // 1_000_000_000) <= since.timestamp()
+        return False
+
+    def _byte_range(self, cached):
+        """Returns the requested (first, last) bytes, or None for the whole file."""
+        header = self.headers.get('Range')
+        if header is None:
+            return None
+        if_range = self.headers.get('If-Range')
+        if if_range is not None and if_range.strip() not in (cached.etag, cached.last_modified):
+            return None  # The client's copy is outdated: send it all
+        return parse_range(header, cached.size)
+
+    def send_head(self):
+        path = self._file_path()
+        if path is None:
+            return super().send_head()
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return super().send_head()  # Not found
+        content_type = self.guess_type(path)
+        if self.dev:
+            # Nothing is kept in memory; every file is read from disk
+            cached = CachedFile(path, stat, content_type, max_memory_size=-1)
+        else:
+            cached = self.cache.get(path, stat, content_type)
+
+        try:
+            byte_range = self._byte_range(cached)
+        except RangeNotSatisfiable:
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.send_header('Content-Range', 'bytes */%d' % cached.size)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None
+
+        # Ranges always refer to the uncompressed file
+        encoding = ''
+        if byte_range is None and len(cached.variants) > 1:
+            accepted = accepted_encodings(self.headers.get('Accept-Encoding'))
+            for candidate in ('br', 'gzip'):
+                if candidate in accepted and candidate in cached.variants:
+                    encoding = candidate
+                    break
+        etag = cached.etag_for(encoding)
+        size = len(cached.variants[encoding]) if cached.variants else cached.size
+        first, last = byte_range if byte_range is not None else (0, size - 1)
+
+        not_modified = not self.dev and self._not_modified(cached, etag)
+        if not_modified:
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+        else:
+            if byte_range is not None:
+                self.send_response(HTTPStatus.PARTIAL_CONTENT)
+                self.send_header('Content-Range', 'bytes %d-%d/%d' % (first, last, size))
+            else:
+                self.send_response(HTTPStatus.OK)
+            self.send_header('Content-Type', cached.content_type)
+            self.send_header('Content-Length', str(last - first + 1))
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Last-Modified', cached.last_modified)
+        if not self.dev:
+            self.send_header('ETag', etag)
+            if cached.compressible:
+                self.send_header('Vary', 'Accept-Encoding')
+            if self.max_age:
+                self.send_header('Cache-Control', 'public, max-age=%d' % self.max_age)
+            else:
+                # Stored, but revalidated on every use
+                self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        if self.command == 'HEAD' or not_modified:
+            return None
+        if cached.variants:
+            return io.BytesIO(memoryview(cached.variants[encoding])[first : last + 1])
+        return FileSlice(path, first, last - first + 1)
+
+    def copyfile(self, source, outputfile):
+        if not isinstance(source, FileSlice):
+            return super().copyfile(source, outputfile)
+        if not source.count:
+            return
+        # os.sendfile() underneath, with a fallback where it is missing
+        sent = self.connection.sendfile(source.file, source.offset, source.count)
+        if sent < source.count:
+            # The file shrank after the headers were sent
+            self.close_connection = True
+
+
+class TutorialServer(ThreadingHTTPServer):
+    # Browsers open several connections at once; the default backlog is 5
+    request_queue_size = 128
+
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pastra Tutorial Web Server')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--dev', action='store_true',
+                        help='disable all caching (Cache-Control: no-store)')
+    parser.add_argument('--max-age', type=int, default=0,
+                        help='seconds browsers may use a file without revalidating')
+    parser.add_argument('--single-threaded', action='store_true',
+                        help='serve one HTTP/1.0 connection at a time, as http.server does')
+    args = parser.parse_args()
+    CORSRequestHandler.dev = args.dev
+    CORSRequestHandler.max_age = args.max_age
+
     # Change to the directory containing this script
     os.chdir(os.path.dirname(os.path.abspath(__file__)))
-    
-    port = 8000
+
+    port = args.port
     print(f"Starting server at http://localhost:{port}")
-    
-    httpd = HTTPServer(('localhost', port), CORSRequestHandler)
-    httpd.serve_forever() 
\ No newline at end of file
+
+    if args.single_threaded:
+        httpd = HTTPServer(('localhost', port), CORSRequestHandler)
+    else:
+        # Keep-alive holds a thread per open connection
+        CORSRequestHandler.protocol_version = 'HTTP/1.1'
+        httpd = TutorialServer(('localhost', port), CORSRequestHandler)
+    httpd.serve_forever()
@@ -0,0 +1,220 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Benchmark for server.py
+
+Starts server.py once per mode and has concurrent clients load a chapter
+app's assets over and over, the way repeat page loads do: each client keeps
+its connection open where the server allows it, sends If-None-Match for
+files it has seen, and seeks in the sample WAV file with Range requests.
+Reports requests per second, p50/p99 latency and status codes per mode.
+
+The `baseline` mode runs the server as http.server would (one connection at
+a time, HTTP/1.0, no caching); `dev` and `default` are the threaded server
+without and with caching. --slow-clients adds connections that send half a
+request and then stall, which holds up everyone on a single-threaded server.
+
+Usage:
+    python server_bench.py
+    python server_bench.py --clients 32 --duration 10 --slow-clients 2
+"""
+import argparse
+import http.client
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+MODES = {
+    'baseline': ['--single-threaded', '--dev'],
+    'dev': ['--dev'],
+    'default': [],
+}
+
+# Assets of part_3_vertex_api/chapter_12, plus seekable media
+PATHS = (
+    '/part_3_vertex_api/chapter_12/',
+    '/part_3_vertex_api/chapter_12/style.css',
+    '/part_3_vertex_api/chapter_12/status-handler.js',
+    '/part_3_vertex_api/chapter_12/shared/gemini-live-api.js',
+    '/part_3_vertex_api/chapter_12/shared/audio-recorder.js',
+    '/part_3_vertex_api/chapter_12/shared/audio-streamer.js',
+    '/part_3_vertex_api/chapter_12/shared/audio-recording-worklet.js',
+    '/part_3_vertex_api/chapter_12/shared/media-handler.js',
+    '/part_3_vertex_api/chapter_12/shared/utils.js',
+    '/assets/hero-image.webp',
+    '/part_1_intro/chapter_01/audio.wav',
+)
+SEEKABLE = '/part_1_intro/chapter_01/audio.wav'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return float('nan')
+    ordered = sorted(samples)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(('localhost', port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+        self.bytes = 0
+
+
+def client(port, stop_at, results, seed):
+    rng = random.Random(seed)
+    etags = {}
+    connection = http.client.HTTPConnection('localhost', port, timeout=5)
+    latencies = []
+    statuses = {}
+    errors = received = 0
+    while time.perf_counter() < stop_at:
+        path = rng.choice(PATHS)
+        headers = {'Accept-Encoding': 'gzip, br'}
+        if path == SEEKABLE and rng.random() < 0.5:
+            first = rng.randrange(0, 120000)
+            headers['Range'] = 'bytes=%d-%d' % (first, first + 4095)
+        elif path in etags:
+            headers['If-None-Match'] = etags[path]
+        started = time.perf_counter()
+        try:
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+            continue
+        latencies.append(time.perf_counter() - started)
+        statuses[response.status] = statuses.get(response.status, 0) + 1
+        received += len(body)
+        etag = response.getheader('ETag')
+        if etag and 'Range' not in headers:
+            etags[path] = etag
+        if response.will_close:
+            connection.close()
+    connection.close()
+    with results.lock:
+        results.latencies.extend(latencies)
+        for status, count in statuses.items():
+            results.statuses[status] = results.statuses.get(status, 0) + count
+        results.errors += errors
+        results.bytes += received
+
+
+def slow_client(port, stop_at):
+    """Sends an incomplete request and stalls, reconnecting when dropped."""
+    while time.perf_counter() < stop_at:
+        try:
+            with socket.create_connection(('localhost', port)) as sock:
+                sock.sendall(b'GET / HTTP/1.1\r\nHost: localhost\r\n')
+                sock.settimeout(max(stop_at - time.perf_counter(), 0.01))
+                sock.recv(1)
+        except OSError:
+            pass
+
+
+def run(mode, args):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'server.py'), '--port', str(port)] + MODES[mode],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(port)
+        results = Results()
+        started = time.perf_counter()
+        stop_at = started + args.duration
+        threads = [
+            threading.Thread(target=slow_client, args=(port, stop_at), daemon=True)
+            for _ in range(args.slow_clients)
+        ]
+        for thread in threads:
+            thread.start()
+        # Let the slow clients get their connections in first
+        time.sleep(0.1 if args.slow_clients else 0)
+        threads = [
+            threading.Thread(target=client, args=(port, stop_at, results, n))
+            for n in range(args.clients)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+    requests = len(results.latencies)
+    return {
+        'mode': mode,
+        'requests': requests,
+        'rps': requests / elapsed,
+        'p50_ms': percentile(results.latencies, 0.5) * 1000,
+        'p99_ms': percentile(results.latencies, 0.99) * 1000,
+        'MB_per_s': results.bytes / elapsed / 1e6,
+        'errors': results.errors,
+        'statuses': ' '.join('%d:%d' % item for item in sorted(results.statuses.items())),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark for server.py')
+    parser.add_argument('--clients', type=int, default=16,
+                        help='concurrent client connections')
+    parser.add_argument('--duration', type=float, default=5.0,
+                        help='seconds each mode is measured')
+    parser.add_argument('--slow-clients', type=int, default=0,
+                        help='connections that stall halfway through a request')
+    parser.add_argument('--modes', default=','.join(MODES),
+                        help='comma-separated modes to run (%s)' % ', '.join(MODES))
+    args = parser.parse_args()
+
+    print('%-9s %9s %9s %9s %9s %9s %7s  %s' % (
+        'mode', 'requests', 'req/s', 'p50 ms', 'p99 ms', 'MB/s', 'errors', 'statuses'))
+    for mode in args.modes.split(','):
+        result = run(mode.strip(), args)
+        print('%-9s %9d %9.0f %9.2f %9.2f %9.1f %7d  %s' % (
+            result['mode'], result['requests'], result['rps'], result['p50_ms'],
+            result['p99_ms'], result['MB_per_s'], result['errors'], result['statuses']))
+
+
+if __name__ == '__main__':
+    main()
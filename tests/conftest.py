@@ -0,0 +1,30 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+The modules under test are scripts run from their own directories, which
+import each other by bare name; put those directories on the path.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+for directory in (
+    ROOT,
+    os.path.join(ROOT, "part_1_intro", "chapter_02"),
+    os.path.join(ROOT, "part_3_vertex_api", "chapter_12", "proxy"),
+    os.path.join(ROOT, "part_3_vertex_api", "chapter_12", "proxy", "bench"),
+):
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
@@ -0,0 +1,89 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+
+from audio_capture import AudioCapture, RingBuffer
+
+
+def test_write_and_read_wrap_around():
+    ring = RingBuffer(8)
+    assert ring.write(b"abcdef")
+    assert ring.read(4) == b"abcd"
+    # Starts at position 6 and wraps to the front of the ring
+    assert ring.write(b"ghijk")
+    assert ring.available() == 7
+    assert ring.read(7) == b"efghijk"
+    assert ring.available() == 0
+
+
+def test_full_ring_refuses_writes():
+    ring = RingBuffer(8)
+    assert ring.write(b"12345678")
+    assert not ring.write(b"9")
+    assert ring.read(3) == b"123"
+    assert not ring.write(b"abcd")
+    assert ring.write(b"abc")
+    assert ring.read(8) == b"45678abc"
+
+
+def test_short_read_returns_none():
+    ring = RingBuffer(8)
+    ring.write(b"abc")
+    assert ring.read(4) is None
+    assert ring.read(3) == b"abc"
+
+
+def test_many_rotations():
+    ring = RingBuffer(10)
+    expected = bytes(range(256)) * 4
+    received = bytearray()
+    for offset in range(0, len(expected), 7):
+        assert ring.write(expected[offset : offset + 7])
+        received += ring.read(ring.available() - ring.available() % 3) or b""
+    received += ring.read(ring.available())
+    assert bytes(received) == expected
+
+
+def capture_all(read_block):
+    async def main():
+        capture = AudioCapture(read_block, 32000, block_bytes=100, frame_bytes=300)
+        capture.start()
+        frames = []
+        while True:
+            frame = await asyncio.wait_for(capture.read_frame(), 5)
+            frames.append(frame)
+            if not frame:
+                break
+        capture.stop()
+        return frames
+
+    return asyncio.run(main())
+
+
+def test_capture_returns_the_rest_then_empty_frames():
+    blocks = [b"a" * 100] * 7 + [b""]
+    frames = capture_all(lambda: blocks.pop(0))
+    assert frames == [b"a" * 300, b"a" * 300, b"a" * 100, b""]
+
+
+def test_capture_error_ends_the_stream(capsys):
+    blocks = [b"a" * 100] * 3
+
+    def read_block():
+        if not blocks:
+            raise RuntimeError("device unplugged")
+        return blocks.pop(0)
+
+    assert capture_all(read_block) == [b"a" * 300, b""]
+    assert "device unplugged" in capsys.readouterr().err
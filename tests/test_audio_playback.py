@@ -0,0 +1,124 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import time
+
+from audio_playback import AudioPlayback
+
+# One byte per millisecond keeps the sizes readable
+BYTES_PER_SECOND = 1000
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+class Speaker:
+    def __init__(self) -> None:
+        self.blocks = []
+
+    def write(self, block: bytes) -> None:
+        self.blocks.append(block)
+
+    @property
+    def played(self) -> bytes:
+        return b"".join(self.blocks)
+
+
+def playback(speaker, **kwargs) -> AudioPlayback:
+    return AudioPlayback(speaker.write, BYTES_PER_SECOND, block_bytes=100, **kwargs)
+
+
+def test_turn_is_played_in_blocks():
+    speaker = Speaker()
+    player = playback(speaker, target_seconds=0.04)
+    audio = bytes(range(250))
+    # Queued before the writer starts, so the turn cannot run dry
+    player.put(audio)
+    player.end_turn()
+    player.start()
+    wait_until(lambda: not player.busy)
+    player.stop()
+    assert speaker.played == audio
+    assert [len(block) for block in speaker.blocks] == [100, 100, 50]
+    assert len(player.latencies) == 1 and player.underruns == 0
+    # A clean turn lowers the start-up delay of the next one
+    assert player.target_seconds < 0.04
+
+
+def test_short_turn_starts_without_reaching_the_target():
+    speaker = Speaker()
+    player = playback(speaker, target_seconds=0.4)
+    player.start()
+    player.put(b"x" * 10)
+    time.sleep(0.02)
+    assert speaker.blocks == []
+    player.end_turn()
+    wait_until(lambda: not player.busy)
+    player.stop()
+    assert speaker.played == b"x" * 10
+
+
+def test_running_dry_mid_turn_raises_the_target():
+    speaker = Speaker()
+    started = []
+    player = playback(speaker, target_seconds=0.04, on_start=started.append)
+    player.start()
+    player.put(b"a" * 150)
+    wait_until(lambda: player.underruns == 1)
+    assert speaker.played == b"a" * 100
+    assert player.target_seconds > 0.04
+    # Stays below the new target until the turn ends
+    player.put(b"b" * 5)
+    player.end_turn()
+    wait_until(lambda: not player.busy)
+    player.stop()
+    assert speaker.played == b"a" * 150 + b"b" * 5
+    # The gap was longer than the (zero) device latency
+    assert player.glitches == 1
+    assert len(started) == len(player.latencies) == 1
+    assert "1 underruns, 1 glitches" in player.summary()
+
+
+def test_flush_drops_queued_audio():
+    speaker = Speaker()
+    player = playback(speaker, target_seconds=1.0)
+    player.put(b"x" * 300)
+    assert player.busy and player.buffered_seconds() == 0.3
+    player.flush()
+    assert not player.busy and player.buffered_seconds() == 0
+    assert player.flushes == 1
+    # Flushing while idle is not counted
+    player.flush()
+    assert player.flushes == 1
+
+
+def test_device_errors_do_not_stop_playback(capsys):
+    written = []
+
+    def write(block):
+        written.append(block)
+        if len(written) == 1:
+            raise OSError("output underflowed")
+
+    player = AudioPlayback(write, BYTES_PER_SECOND, block_bytes=100)
+    player.put(b"x" * 200)
+    player.end_turn()
+    player.start()
+    wait_until(lambda: not player.busy)
+    player.stop()
+    assert len(written) == 2
+    assert "output underflowed" in capsys.readouterr().out
@@ -0,0 +1,98 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import wave
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from batch import FileSource, read_wav, run_batch, write_wav  # noqa: E402
+from live_stand_in import StandInLive  # noqa: E402
+
+RATE = 16000
+
+
+def tone(seconds, rate=RATE, amplitude=8000):
+    t = np.arange(int(seconds * rate)) / rate
+    return (np.sin(2 * np.pi * 300 * t) * amplitude).astype("<i2")
+
+
+def test_wav_round_trip(tmp_path):
+    pcm = tone(0.5).tobytes()
+    path = str(tmp_path / "tone.wav")
+    write_wav(path, pcm, RATE)
+    assert read_wav(path) == pcm
+
+
+def test_read_wav_mixes_down_and_resamples(tmp_path):
+    mono = tone(1.0, rate=48000)
+    path = str(tmp_path / "stereo.wav")
+    with wave.open(path, "wb") as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(48000)
+        f.writeframes(np.repeat(mono, 2).tobytes())
+    samples = np.frombuffer(read_wav(path), dtype="<i2")
+    assert len(samples) == RATE
+    assert np.abs(samples - mono[::3]).max() <= 1
+
+
+def test_read_wav_rejects_8_bit_files(tmp_path):
+    path = str(tmp_path / "8bit.wav")
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(1)
+        f.setframerate(8000)
+        f.writeframes(bytes(800))
+    with pytest.raises(ValueError):
+        read_wav(path)
+
+
+def test_file_source_hands_out_frames_then_empty():
+    source = FileSource(bytes(250), frame_bytes=100, bytes_per_second=32000, realtime=False)
+
+    async def read_all():
+        frames = []
+        while True:
+            frame = await source.read_frame()
+            frames.append(len(frame))
+            if not frame:
+                return frames
+
+    assert source.captured_at() is None
+    assert asyncio.run(read_all()) == [100, 100, 50, 0]
+    assert source.captured_at() is not None
+
+
+def test_batch_answers_every_turn(tmp_path, capsys):
+    rng = np.random.default_rng(1)
+    quiet = rng.normal(0, 30, RATE).astype("<i2")
+    path = str(tmp_path / "hello.wav")
+    write_wav(path, np.concatenate([quiet, tone(1.0)]).tobytes(), RATE)
+
+    live = StandInLive(response_delay=0.0, speed=None)
+    results = asyncio.run(
+        run_batch(live.connect, "model", None, [path], str(tmp_path / "out"), repeat=2, realtime=False)
+    )
+    assert [result.label for result in results] == ["hello-1", "hello-2"]
+    for result in results:
+        assert result.turns_sent == result.turns_answered == 1
+        assert not result.timed_out
+        # The stand-in echoes the speech (and its pre-roll) back
+        assert 1.0 <= result.output_seconds < result.input_seconds
+        with wave.open(str(tmp_path / "out" / f"{result.label}.wav"), "rb") as f:
+            assert f.getframerate() == 24000
+            assert f.getnframes() == round(result.output_seconds * 24000)
+    assert "batch: 2 sessions" in capsys.readouterr().out
@@ -0,0 +1,103 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import time
+
+import pytest
+
+from coalesce import COALESCE_MAX_DELAY, COALESCE_TARGET_BYTES, coalesce_audio
+from frame_queue import FrameQueue
+from frames import REALTIME_INPUT, SETUP, extract_pcm_audio, wrap_pcm_audio
+from session import CLIENT_TO_SERVER
+from test_proxy import forward
+
+
+def audio(value: int, size: int = 320) -> bytes:
+    return wrap_pcm_audio(bytes([value]) * size)
+
+
+def test_merges_small_chunks_up_to_the_first_other_message():
+    async def main():
+        queue = FrameQueue()
+        now = time.perf_counter()
+        await queue.put(audio(2), context=(REALTIME_INPUT, now, False))
+        await queue.put(audio(3), context=(REALTIME_INPUT, now, False))
+        setup = b'{"setup": {}}'
+        await queue.put(setup, context=(SETUP, now, False))
+        await queue.put(audio(4), context=(REALTIME_INPUT, now, False))
+
+        frame, merged, pending = await coalesce_audio(queue, audio(1), now)
+        assert merged == 3
+        assert extract_pcm_audio(frame) == b"\x01" * 320 + b"\x02" * 320 + b"\x03" * 320
+        assert pending == (setup, (SETUP, now, False))
+        # Audio after the other message is left for the next merge
+        assert len(queue) == 1
+
+    asyncio.run(main())
+
+
+def test_stops_at_the_target_size():
+    async def main():
+        queue = FrameQueue()
+        now = time.perf_counter()
+        chunk = COALESCE_TARGET_BYTES // 2
+        for value in (2, 3):
+            await queue.put(audio(value, chunk), context=(REALTIME_INPUT, now, False))
+
+        frame, merged, pending = await coalesce_audio(queue, audio(1, chunk), now)
+        assert merged == 2 and pending is None
+        assert len(extract_pcm_audio(frame)) == COALESCE_TARGET_BYTES
+        assert len(queue) == 1
+
+    asyncio.run(main())
+
+
+def test_large_or_lone_chunks_are_not_rewrapped():
+    async def main():
+        queue = FrameQueue()
+        large = audio(1, COALESCE_TARGET_BYTES)
+        assert await coalesce_audio(queue, large, time.perf_counter()) == (None, 1, None)
+        assert await coalesce_audio(queue, b'{"setup": {}}', time.perf_counter()) == (None, 1, None)
+
+        started = time.perf_counter()
+        assert await coalesce_audio(queue, audio(1), started) == (None, 1, None)
+        # Waited for more audio, but not much longer than the maximum delay
+        assert time.perf_counter() - started < COALESCE_MAX_DELAY + 0.5
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize(
+    "frame",
+    [
+        # Fast path: the browser's envelope with bad base64
+        '{"realtime_input":{"media_chunks":[{"mime_type":"audio/pcm","data":"abc"}]}}',
+        b'{"realtime_input":{"media_chunks":[{"mime_type":"audio/pcm","data":"abc"}]}}',
+        # Slow path: bad base64, a chunk that is not an object, no data
+        '{"realtimeInput": {"mediaChunks": [{"mimeType": "audio/pcm", "data": "abc"}]}}',
+        '{"realtime_input": {"media_chunks": ["audio/pcm"]}}',
+        '{"realtime_input": {"media_chunks": [{"mime_type": "audio/pcm", "blob": ""}]}}',
+        '{"realtime_input": {"media_chunks": [{"mime_type": "audio/pcm", "data": 5}]}}',
+    ],
+)
+def test_malformed_audio_is_not_extracted(frame):
+    assert extract_pcm_audio(frame) is None
+
+
+def test_malformed_audio_is_forwarded_as_is():
+    # It used to end the session from the writer
+    bad = '{"realtime_input":{"media_chunks":[{"mime_type":"audio/pcm","data":"abc"}]}}'
+    target = forward([audio(1), bad, audio(2)], CLIENT_TO_SERVER)
+    frames = [frame for frame, _ in target.sent]
+    assert frames == [audio(1), bad, audio(2)]
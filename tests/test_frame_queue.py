@@ -0,0 +1,115 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+
+import pytest
+
+from frame_queue import FrameQueue, QueueClosed
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_frames_come_out_in_order_with_their_context():
+    async def main():
+        queue = FrameQueue(high_watermark=100, low_watermark=50)
+        await queue.put(b"a", context=1)
+        await queue.put(b"bb", context=2)
+        assert len(queue) == 2 and queue.bytes == 3
+        assert await queue.get() == (b"a", 1)
+        assert await queue.get() == (b"bb", 2)
+        assert queue.bytes == 0
+
+    run(main())
+
+
+def test_droppable_frames_are_dropped_oldest_first():
+    async def main():
+        queue = FrameQueue(high_watermark=100, low_watermark=40)
+        await queue.put(b"v" * 30, droppable=True, context="video1")
+        await queue.put(b"a" * 30, context="audio")
+        await queue.put(b"v" * 30, droppable=True, context="video2")
+        # Over the high watermark: video is dropped, oldest first, until
+        # the queue is back at the low watermark
+        assert await queue.put(b"c" * 20, context="control")
+        assert queue.dropped == 2
+        assert queue.dropped_bytes == 60
+        assert [(await queue.get())[1] for _ in range(len(queue))] == ["audio", "control"]
+
+    run(main())
+
+
+def test_droppable_frame_is_refused_when_nothing_can_be_dropped():
+    async def main():
+        queue = FrameQueue(high_watermark=100, low_watermark=40)
+        await queue.put(b"a" * 90)
+        assert not await queue.put(b"v" * 20, droppable=True)
+        assert queue.dropped == 1 and len(queue) == 1
+
+    run(main())
+
+
+def test_oversized_frame_is_accepted_into_an_empty_queue():
+    async def main():
+        queue = FrameQueue(high_watermark=100, low_watermark=40)
+        assert await queue.put(b"x" * 500)
+        assert queue.max_bytes == 500
+
+    run(main())
+
+
+def test_put_waits_for_the_low_watermark():
+    async def main():
+        queue = FrameQueue(high_watermark=100, low_watermark=40)
+        for _ in range(3):
+            await queue.put(b"a" * 30)
+        blocked = asyncio.create_task(queue.put(b"b" * 30))
+        await asyncio.sleep(0)
+        assert not blocked.done()
+        # 60 bytes left: below the high but not yet the low watermark
+        await queue.get()
+        await asyncio.sleep(0)
+        assert not blocked.done()
+        await queue.get()
+        await asyncio.sleep(0)
+        assert blocked.done() and blocked.result()
+        assert queue.bytes == 60
+
+    run(main())
+
+
+def test_close_releases_waiters_and_ends_get():
+    async def main():
+        queue = FrameQueue(high_watermark=100, low_watermark=40)
+        await queue.put(b"a" * 90)
+        blocked = asyncio.create_task(queue.put(b"b" * 30))
+        await asyncio.sleep(0)
+        queue.close()
+        await blocked
+        assert (await queue.get())[0] == b"a" * 90
+        assert (await queue.get())[0] == b"b" * 30
+        with pytest.raises(QueueClosed):
+            await queue.get()
+
+    run(main())
+
+
+def test_get_times_out():
+    async def main():
+        queue = FrameQueue()
+        with pytest.raises(asyncio.TimeoutError):
+            await queue.get(timeout=0.01)
+
+    run(main())
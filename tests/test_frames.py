@@ -0,0 +1,103 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import base64
+import json
+
+import pytest
+
+from frames import (
+    REALTIME_INPUT,
+    SERVER_CONTENT,
+    SETUP,
+    SNIFF_LIMIT,
+    TOOL_CALL_CANCELLATION,
+    TURN_COMPLETE,
+    TURN_INTERRUPTED,
+    UNKNOWN,
+    declares_audio_format,
+    extract_pcm_audio,
+    has_inline_data,
+    is_video_frame,
+    prefix_contains,
+    sniff_message_type,
+    turn_end,
+    wrap_pcm_audio,
+)
+
+
+@pytest.mark.parametrize(
+    "frame, expected",
+    [
+        ('{"setup": {"model": "m"}}', SETUP),
+        (b'{"realtime_input": {}}', REALTIME_INPUT),
+        ('  {  "realtimeInput": {}}', REALTIME_INPUT),
+        (b'{"server_content": {}}', SERVER_CONTENT),
+        ('{"tool_call_cancellation": {"ids": []}}', TOOL_CALL_CANCELLATION),
+        ("[1, 2]", UNKNOWN),
+        (b"", UNKNOWN),
+    ],
+)
+def test_sniff_message_type(frame, expected):
+    assert sniff_message_type(frame) == expected
+
+
+@pytest.mark.parametrize("as_bytes", [False, True])
+def test_sniff_message_type_only_reads_the_prefix(as_bytes):
+    message = '{"setup": {}}'
+    key = len('{"setup"')
+    fits = " " * (SNIFF_LIMIT - key) + message
+    # The closing quote of the key is one character past the limit
+    cut = " " * (SNIFF_LIMIT - key + 1) + message
+    if as_bytes:
+        fits, cut = fits.encode(), cut.encode()
+    assert sniff_message_type(fits) == SETUP
+    assert sniff_message_type(cut) == UNKNOWN
+
+
+def test_markers_are_only_looked_for_in_the_prefix():
+    data = "A" * SNIFF_LIMIT
+    assert has_inline_data(b'{"serverContent": {"modelTurn": {"parts": [{"inlineData": {}}]}}}')
+    assert is_video_frame('{"realtime_input": {"media_chunks": [{"mime_type": "image/jpeg"}]}}')
+    assert not prefix_contains('{"x": "%s", "image/": 1}' % data, '"image/')
+
+
+def test_wrap_pcm_audio():
+    pcm = bytes(range(256))
+    frame = wrap_pcm_audio(pcm)
+    assert sniff_message_type(frame) == REALTIME_INPUT
+    chunk = json.loads(frame)["realtime_input"]["media_chunks"][0]
+    assert chunk["mime_type"] == "audio/pcm"
+    assert base64.b64decode(chunk["data"]) == pcm
+
+
+def test_extract_pcm_audio():
+    pcm = bytes(range(256)) * 4
+    frame = wrap_pcm_audio(pcm)
+    assert extract_pcm_audio(frame) == pcm
+    assert extract_pcm_audio(frame.decode()) == pcm
+    assert extract_pcm_audio('{"realtime_input": {"media_chunks": [{"mime_type": "image/jpeg", "data": ""}]}}') is None
+
+
+def test_declares_audio_format():
+    assert declares_audio_format('{"realtime_input": {"media_chunks": [{"mime_type": "audio/pcm;rate=48000"}]}}')
+    assert not declares_audio_format(b'{"realtime_input": {"media_chunks": [{"mime_type": "audio/pcm;rate=16000"}]}}')
+    assert not declares_audio_format('{"realtime_input": {"media_chunks": [{"mime_type": "audio/pcm"}]}}')
+
+
+def test_turn_end_after_a_large_model_turn():
+    data = "A" * (SNIFF_LIMIT * 4)
+    frame = '{"serverContent": {"modelTurn": {"data": "%s"}, "turnComplete": true}}' % data
+    assert turn_end(frame) == TURN_COMPLETE
+    assert turn_end(b'{"serverContent": {"interrupted": true}}') == TURN_INTERRUPTED
+    assert turn_end('{"serverContent": {"modelTurn": {}}}') is None
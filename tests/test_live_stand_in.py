@@ -0,0 +1,64 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from live_stand_in import StandInLive, upsample  # noqa: E402
+
+
+def test_upsample_to_24_khz():
+    pcm = np.arange(0, 1600, 10, dtype="<i2")
+    samples = np.frombuffer(upsample(pcm.tobytes()), dtype="<i2")
+    assert len(samples) == len(pcm) * 3 // 2
+    assert samples[0] == 0 and samples[3] == 20
+    assert upsample(b"") == b""
+
+
+def test_each_turn_is_echoed_in_chunks():
+    live = StandInLive(response_delay=0.0, chunk_ms=40, speed=None)
+
+    async def chat():
+        async with live.connect(model="model") as session:
+            await session.send(input="hello")
+            await session.send(input={"data": bytes(3200), "mime_type": "audio/pcm"})
+            await session.send(input={"data": bytes(3200), "mime_type": "audio/pcm"}, end_of_turn=True)
+            responses = [response async for response in session.receive()]
+            return session, responses
+
+    session, responses = asyncio.run(chat())
+    assert session.turns == 1
+    *audio, last = [response.server_content for response in responses]
+    assert last.turn_complete and last.model_turn is None
+    chunks = [content.model_turn.parts[0].inline_data.data for content in audio]
+    # 200 ms at 24 kHz in 40 ms chunks
+    assert [len(chunk) for chunk in chunks] == [1920] * 5
+
+
+def test_closing_the_session_cancels_pending_answers():
+    live = StandInLive(response_delay=60.0, speed=1.0)
+
+    async def chat():
+        async with live.connect(model="model") as session:
+            await session.send(input={"data": bytes(320), "mime_type": "audio/pcm"}, end_of_turn=True)
+            await asyncio.sleep(0)
+            answering = asyncio.all_tasks() - {asyncio.current_task()}
+        await asyncio.sleep(0)
+        return session, answering
+
+    session, [answer] = asyncio.run(chat())
+    assert session.turns == 1
+    assert answer.cancelled()
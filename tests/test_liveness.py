@@ -0,0 +1,53 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from liveness import TimerWheel
+
+
+def test_keys_expire_at_their_deadline():
+    wheel = TimerWheel(slots=8, resolution=1.0)
+    wheel.schedule("a", 2.5)
+    wheel.schedule("b", 3.0)
+    assert len(wheel) == 2
+    assert wheel.expired(2.0) == []
+    assert wheel.expired(2.9) == []
+    assert wheel.expired(3.0) == ["a", "b"]
+    assert len(wheel) == 0
+
+
+def test_late_tick_collects_every_passed_slot():
+    wheel = TimerWheel(slots=8, resolution=1.0)
+    wheel.expired(0.0)
+    for n in range(1, 6):
+        wheel.schedule(n, float(n))
+    assert sorted(wheel.expired(4.5)) == [1, 2, 3, 4]
+    assert wheel.expired(5.0) == [5]
+
+
+def test_cancel_and_reschedule():
+    wheel = TimerWheel(slots=8, resolution=1.0)
+    wheel.schedule("a", 1.0)
+    wheel.schedule("b", 1.0)
+    wheel.cancel("a")
+    wheel.cancel("missing")
+    wheel.schedule("b", 2.0)
+    assert wheel.expired(1.0) == []
+    assert wheel.expired(2.0) == ["b"]
+
+
+def test_deadline_beyond_one_rotation_waits_in_its_slot():
+    wheel = TimerWheel(slots=4, resolution=1.0)
+    wheel.schedule("far", 9.0)
+    for now in range(9):
+        assert wheel.expired(float(now)) == []
+    assert wheel.expired(9.0) == ["far"]
@@ -0,0 +1,70 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import pytest
+
+import metrics
+from metrics import Counter, Gauge, Histogram
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    # Metrics created by a test stay out of the process-wide registry
+    monkeypatch.setattr(metrics, "REGISTRY", [])
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        metrics._Metric("test_metric", "Help.")
+
+
+def test_counter_with_labels():
+    counter = Counter("test_total", "Things.", ("kind",))
+    counter.labels("a").inc()
+    counter.labels("a").inc(2)
+    counter.labels("b").inc()
+    assert list(counter.render()) == [
+        "# HELP test_total Things.",
+        "# TYPE test_total counter",
+        'test_total{kind="a"} 3',
+        'test_total{kind="b"} 1',
+    ]
+
+
+def test_unlabeled_series_are_reported_before_use():
+    assert list(Counter("test_total", "Things.").render())[-1] == "test_total 0"
+
+
+def test_gauge_callback_is_read_at_scrape_time():
+    value = [1]
+    gauge = Gauge("test_gauge", "Level.", callback=lambda: value[0])
+    value[0] = 5
+    assert list(gauge.render())[-1] == "test_gauge 5"
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("test_seconds", "Time.", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    assert list(histogram.render())[2:] == [
+        'test_seconds_bucket{le="0.1"} 2',
+        'test_seconds_bucket{le="1"} 3',
+        'test_seconds_bucket{le="+Inf"} 4',
+        "test_seconds_sum 2.65",
+        "test_seconds_count 4",
+    ]
+
+
+def test_message_type_label_is_bounded():
+    assert metrics.message_type_label("setup") == "setup"
+    assert metrics.message_type_label("somethingNew") == "other"
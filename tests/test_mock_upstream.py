@@ -0,0 +1,72 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import base64
+import json
+import time
+
+import pytest
+
+websockets = pytest.importorskip("websockets")
+
+from mock_upstream import TIMESTAMP_KEY, MockUpstream, read_timestamp, tone  # noqa: E402
+
+
+def test_read_timestamp():
+    frame = json.dumps({"serverContent": {}, TIMESTAMP_KEY: 12.5})
+    assert read_timestamp(frame) == 12.5
+    assert read_timestamp(frame.encode()) == 12.5
+    assert read_timestamp('{"setupComplete": {}}') is None
+
+
+def test_tone_length():
+    assert len(tone(0.5, 16000)) == 16000
+    assert len(tone(0.0, 24000)) == 0
+
+
+def test_answers_setup_and_turns():
+    async def main():
+        mock = MockUpstream(turn_seconds=0.1, response_seconds=0.08, chunk_ms=40, speed=10.0)
+        server = await mock.serve("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            async with websockets.connect(f"ws://127.0.0.1:{port}") as websocket:
+                await websocket.send(json.dumps({"setup": {"model": "test"}}))
+                assert json.loads(await websocket.recv()) == {"setupComplete": {}}
+
+                audio = base64.b64encode(bytes(3200)).decode("ascii")
+                await websocket.send(
+                    json.dumps(
+                        {
+                            "realtime_input": {"media_chunks": [{"mime_type": "audio/pcm", "data": audio}]},
+                            TIMESTAMP_KEY: time.perf_counter(),
+                        }
+                    )
+                )
+                messages = []
+                while True:
+                    message = json.loads(await websocket.recv())
+                    messages.append(message)
+                    if message["serverContent"].get("turnComplete"):
+                        break
+        finally:
+            server.close()
+
+        # Two 40 ms chunks of audio, then the end of the turn
+        assert len(messages) == 3
+        assert all(TIMESTAMP_KEY in message for message in messages[:2])
+        assert mock.stats.setups == 1 and mock.stats.messages_in == 2
+        assert len(mock.stats.uplink_latencies) == 1
+
+    asyncio.run(asyncio.wait_for(main(), 10))
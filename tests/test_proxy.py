@@ -0,0 +1,120 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+proxy_task() between stand-ins for the two WebSockets: the source yields
+the given frames and ends, the target records what is sent to it.
+"""
+import asyncio
+import base64
+import json
+import types
+
+import pytest
+
+import proxy
+from frames import extract_pcm_audio
+from session import CLIENT_TO_SERVER, SERVER_TO_CLIENT, Session
+
+
+class Source:
+    def __init__(self, frames, path: str = "/") -> None:
+        self.frames = frames
+        self.request = types.SimpleNamespace(path=path)
+
+    async def __aiter__(self):
+        for frame in self.frames:
+            yield frame
+
+
+class Target:
+    def __init__(self, stalled: bool = False) -> None:
+        self.stalled = stalled
+        # (frame, sent as text)
+        self.sent = []
+        self.closed = False
+
+    async def send(self, message, text=None) -> None:
+        if self.stalled:
+            await asyncio.Event().wait()
+        self.sent.append((message, bool(text) or isinstance(message, str)))
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+def forward(frames, name, path="/", target=None):
+    """Runs proxy_task over `frames`; returns the target."""
+    source = Source(frames, path)
+    target = target or Target()
+    session = Session(source)
+    asyncio.run(asyncio.wait_for(proxy.proxy_task(source, target, name, session), 5))
+    return target
+
+
+def test_frames_are_forwarded_unchanged():
+    frames = ['{"setup": {}}', b'{"realtime_input": {"media_chunks": []}}']
+    target = forward(frames, CLIENT_TO_SERVER)
+    assert target.sent == [('{"setup": {}}', True), (b'{"realtime_input": {"media_chunks": []}}', False)]
+    assert target.closed
+
+
+def test_stalled_target_does_not_hold_up_teardown(monkeypatch):
+    monkeypatch.setattr(proxy, "DRAIN_TIMEOUT", 0.1)
+    target = forward(['{"serverContent": {}}'], SERVER_TO_CLIENT, target=Target(stalled=True))
+    assert target.sent == [] and target.closed
+
+
+def test_binary_audio_is_wrapped_and_sent_as_text():
+    # Large enough not to wait for coalescing
+    pcm = bytes(range(256)) * 16
+    target = forward([pcm], CLIENT_TO_SERVER, path="/?audio_in=pcm16")
+    [(frame, as_text)] = target.sent
+    assert as_text
+    assert extract_pcm_audio(frame) == pcm
+
+
+def test_binary_audio_is_forwarded_as_is_without_audio_in():
+    target = forward([bytes(4096)], CLIENT_TO_SERVER)
+    assert target.sent == [(bytes(4096), False)]
+
+
+
+
+
+def test_model_audio_is_unwrapped_for_audio_out():
+    pcm = bytes(range(256)) * 4
+    message = {
+        "serverContent": {
+            "modelTurn": {
+                "parts": [{"inlineData": {"mimeType": "audio/pcm;rate=24000", "data": base64.b64encode(pcm).decode()}}]
+            },
+            "turnComplete": True,
+        }
+    }
+    target = forward([json.dumps(message).encode()], SERVER_TO_CLIENT, path="/?audio_out=pcm16")
+    (audio, audio_as_text), (rest, rest_as_text) = target.sent
+    assert not audio_as_text and audio.endswith(pcm)
+    assert rest_as_text and json.loads(rest) == {"serverContent": {"turnComplete": True}}
+
+
+def test_converted_audio_is_sent_as_text():
+    pytest.importorskip("numpy")
+    # 100 ms of 48 kHz audio in a binary frame
+    pcm = bytes(9600)
+    chunk = {"mime_type": "audio/pcm;rate=48000", "data": base64.b64encode(pcm).decode()}
+    frame = json.dumps({"realtime_input": {"media_chunks": [chunk]}}).encode()
+    target = forward([frame], CLIENT_TO_SERVER)
+    [(sent, as_text)] = target.sent
+    assert as_text
+    assert 0 < len(extract_pcm_audio(sent)) <= len(pcm) // 3
@@ -0,0 +1,125 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import types
+
+import pytest
+
+websockets = pytest.importorskip("websockets")
+
+from frames import SETUP_COMPLETE, sniff_message_type, turn_end, wrap_pcm_audio  # noqa: E402
+from mock_upstream import MockUpstream  # noqa: E402
+from reconnect import ResumableUpstream  # noqa: E402
+
+SETUP = b'{"setup": {"model": "test"}}'
+
+
+class Router:
+    """Connects straight to the stand-in, like a single-region RegionRouter."""
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.acquired = 0
+
+    async def acquire(self):
+        self.acquired += 1
+        websocket = await websockets.connect(self.url)
+        return websocket, types.SimpleNamespace(name="test", adapt_setup=lambda frame: frame)
+
+
+async def start_session(mock: MockUpstream):
+    server = await mock.serve("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    router = Router(f"ws://127.0.0.1:{port}")
+    websocket, region = await router.acquire()
+    await websocket.send(SETUP)
+    assert sniff_message_type(await websocket.recv()) == SETUP_COMPLETE
+    session = types.SimpleNamespace(
+        id="test", region=region, setup_message=SETUP, setup_completed=True
+    )
+    return server, router, ResumableUpstream(router, websocket, session)
+
+
+def test_setup_is_replayed_and_setup_complete_swallowed():
+    async def main():
+        mock = MockUpstream(
+            turn_seconds=0.01, response_seconds=0.08, chunk_ms=40, speed=10.0,
+            close_after=0.1, close_code=1012,
+        )
+        server, router, upstream = await start_session(mock)
+        try:
+            await asyncio.sleep(0.2)
+            assert mock.stats.closes == 1
+
+            # The first send after the close reconnects and replays the setup
+            await upstream.send(wrap_pcm_audio(bytes(640)))
+            assert upstream.reconnects == 1
+            assert router.acquired == 2
+            assert mock.stats.setups == 2
+
+            types_seen = []
+            async for frame in upstream:
+                types_seen.append(sniff_message_type(frame))
+                if turn_end(frame):
+                    break
+            assert SETUP_COMPLETE not in types_seen
+            assert types_seen[-1] == "serverContent"
+        finally:
+            await upstream.close()
+            server.close()
+
+    asyncio.run(asyncio.wait_for(main(), 10))
+
+
+def test_reader_reconnects_too():
+    async def main():
+        mock = MockUpstream(close_after=0.1, close_code=1001)
+        server, router, upstream = await start_session(mock)
+        frames = []
+
+        async def read():
+            async for frame in upstream:
+                frames.append(frame)
+
+        reader = asyncio.create_task(read())
+        try:
+            await asyncio.sleep(0.35)
+            # Every close was noticed by the reading side, which reconnected
+            assert upstream.reconnects >= 2
+            assert mock.stats.setups == upstream.reconnects + 1
+            assert not reader.done()
+        finally:
+            await upstream.close()
+            await reader
+            server.close()
+        # Only the stand-in's setupComplete answers were sent, all swallowed
+        assert frames == []
+
+    asyncio.run(asyncio.wait_for(main(), 10))
+
+
+def test_other_close_codes_end_the_session():
+    async def main():
+        mock = MockUpstream(close_after=0.05, close_code=1008)
+        server, router, upstream = await start_session(mock)
+        try:
+            await asyncio.sleep(0.15)
+            with pytest.raises(websockets.exceptions.ConnectionClosed):
+                await upstream.send(wrap_pcm_audio(bytes(640)))
+            assert upstream.reconnects == 0 and router.acquired == 1
+        finally:
+            await upstream.close()
+            server.close()
+
+    asyncio.run(asyncio.wait_for(main(), 10))
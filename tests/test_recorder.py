@@ -0,0 +1,109 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+
+import pytest
+
+import recorder
+from frames import REALTIME_INPUT, SERVER_CONTENT, SETUP, SETUP_COMPLETE
+from recorder import DOWNLINK, UPLINK, SessionRecording, read_recording
+from replay import ClientStats, ReplayUpstream, Script, replay_client
+
+SESSION = [
+    (UPLINK, SETUP, '{"setup": {}}', True),
+    (DOWNLINK, SETUP_COMPLETE, b'{"setupComplete": {}}', False),
+    (UPLINK, REALTIME_INPUT, b'{"realtime_input": {"media_chunks": []}}', False),
+    (DOWNLINK, SERVER_CONTENT, '{"serverContent": {"turnComplete": true}}', True),
+]
+
+
+def record(path, frames=SESSION):
+    recording = SessionRecording(str(path), {"session": 7, "path": "/?audio_in=pcm16"})
+    for direction, msg_type, frame, text in frames:
+        recording.record(direction, msg_type, frame, text)
+    recording.close()
+    # Waits for the writer thread to write everything out
+    recorder.shutdown()
+
+
+def test_recording_round_trip(tmp_path):
+    path = tmp_path / "session.rec"
+    record(path)
+    metadata, records = read_recording(str(path))
+    assert metadata == {"session": 7, "path": "/?audio_in=pcm16"}
+    assert [
+        (r.direction, r.msg_type, bytes(r.payload), r.text) for r in records
+    ] == [
+        (direction, msg_type, frame.encode() if isinstance(frame, str) else frame, text)
+        for direction, msg_type, frame, text in SESSION
+    ]
+    timestamps = [r.timestamp for r in records]
+    assert timestamps == sorted(timestamps)
+
+
+def test_a_truncated_last_frame_is_left_out(tmp_path):
+    path = tmp_path / "session.rec"
+    record(path)
+    data = path.read_bytes()
+    path.write_bytes(data[:-5])
+    _, records = read_recording(str(path))
+    assert len(records) == len(SESSION) - 1
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_bytes(b"not a recording at all")
+    with pytest.raises(ValueError):
+        read_recording(str(path))
+
+
+def test_recording_is_off_without_a_directory(monkeypatch):
+    monkeypatch.setattr(recorder, "RECORD_DIR", "")
+    assert recorder.start_recording(1, "/") is None
+
+
+def test_replay_script_orders_server_frames_after_control_messages(tmp_path):
+    path = tmp_path / "session.rec"
+    record(path)
+    _, records = read_recording(str(path))
+    script = Script(records)
+    assert len(script.uplink) == 2
+    # realtime_input does not count as a control message
+    assert [needed for _, _, _, needed in script.downlink] == [1, 1]
+    assert script.start == records[0].timestamp
+
+
+def test_replay_upstream_answers_with_the_recorded_frames(tmp_path):
+    path = tmp_path / "session.rec"
+    record(path)
+    _, records = read_recording(str(path))
+    script = Script(records)
+
+    async def replay():
+        upstream = ReplayUpstream(script, speed=0.0)
+        server = await upstream.serve("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        stats = ClientStats()
+        try:
+            await asyncio.wait_for(
+                replay_client(f"ws://127.0.0.1:{port}", script, 0.0, stats, upstream), 5
+            )
+        finally:
+            server.close()
+        return upstream, stats
+
+    upstream, stats = asyncio.run(replay())
+    assert stats.errors == 0
+    assert stats.sent == upstream.frames_in == 2
+    assert stats.received == upstream.frames_out == 2
@@ -0,0 +1,92 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+
+import pytest
+
+import regions
+from regions import Region, RegionRouter, configured_regions
+
+
+def test_region_urls(monkeypatch):
+    monkeypatch.setattr(regions, "REGION_URLS", "a=ws://127.0.0.1:9001, b=ws://127.0.0.1:9002")
+    assert [(r.name, r.url, r.location) for r in configured_regions()] == [
+        ("a", "ws://127.0.0.1:9001", None),
+        ("b", "ws://127.0.0.1:9002", None),
+    ]
+
+
+def test_regions(monkeypatch):
+    monkeypatch.setattr(regions, "REGIONS", "us-central1, europe-west4,")
+    assert [(r.name, r.location) for r in configured_regions()] == [
+        ("us-central1", "us-central1"),
+        ("europe-west4", "europe-west4"),
+    ]
+    assert configured_regions()[1].url.startswith("wss://europe-west4-aiplatform.")
+
+
+@pytest.mark.parametrize(
+    "setting, value",
+    [
+        ("REGION_URLS", "=ws://127.0.0.1:9001"),
+        ("REGION_URLS", "a=ws://127.0.0.1:9001,a=ws://127.0.0.1:9002"),
+        ("REGION_URLS", "a=ws://127.0.0.1:9001,ws://127.0.0.1:9002"),
+        ("REGIONS", "us-central1,us-central1"),
+    ],
+)
+def test_invalid_region_names_are_rejected(monkeypatch, setting, value):
+    monkeypatch.setattr(regions, setting, value)
+    with pytest.raises(ValueError):
+        configured_regions()
+
+
+def test_ranked_prefers_healthy_then_fast():
+    slow, fast, down = Region("slow", "ws://a"), Region("fast", "ws://b"), Region("down", "ws://c")
+    slow.latency, fast.latency, down.latency = 0.2, 0.1, 0.01
+    down.healthy = False
+    assert RegionRouter([down, slow, fast]).ranked() == [fast, slow, down]
+
+
+def test_adapt_setup_rewrites_the_location():
+    region = Region("eu", "ws://a", "europe-west4")
+    setup = '{"setup": {"model": "projects/p/locations/us-central1/publishers/google/models/m"}}'
+    assert "/locations/europe-west4/" in region.adapt_setup(setup)
+    assert b"/locations/europe-west4/" in region.adapt_setup(setup.encode())
+    assert Region("a", "ws://a").adapt_setup(setup) == setup
+
+
+def test_probe_results_are_logged_for_any_region_name(monkeypatch):
+    # A region named like a log() argument used to make the log call fail
+    logged = []
+    monkeypatch.setattr(regions, "log", lambda level, event, **fields: logged.append((event, fields)))
+    router = RegionRouter([Region("preferred", "ws://a"), Region("level", "ws://b")])
+
+    async def probe(region):
+        if region.name == "preferred":
+            region.record_latency(0.0123)
+        else:
+            region.record_failure(OSError("refused"))
+
+    monkeypatch.setattr(router, "_probe", probe)
+
+    async def run():
+        prober = asyncio.create_task(router._run())
+        while not logged:
+            await asyncio.sleep(0)
+        prober.cancel()
+
+    asyncio.run(asyncio.wait_for(run(), 5))
+    assert logged == [
+        ("regions probed", {"preferred": "preferred", "latencies": "preferred=12.3,level=down"})
+    ]
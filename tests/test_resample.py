@@ -0,0 +1,79 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from resample import FLOAT32, NATIVE, AudioFormat, StreamResampler, parse_mime_type  # noqa: E402
+
+
+def process_in_chunks(audio_format, data, sizes):
+    resampler = StreamResampler(audio_format)
+    output = []
+    offset = 0
+    for size in sizes:
+        output.append(resampler.process(data[offset : offset + size]))
+        offset += size
+    output.append(resampler.process(data[offset:]))
+    return b"".join(output)
+
+
+@pytest.mark.parametrize(
+    "audio_format",
+    [
+        AudioFormat(48000, 2),
+        AudioFormat(44100, 1),
+        AudioFormat(8000, 1),
+        AudioFormat(24000, 1, FLOAT32),
+    ],
+)
+def test_output_does_not_depend_on_chunking(audio_format):
+    rng = np.random.default_rng(1)
+    seconds = 0.5
+    count = int(audio_format.rate * seconds) * audio_format.channels
+    if audio_format.encoding == FLOAT32:
+        data = rng.uniform(-0.5, 0.5, count).astype("<f4").tobytes()
+    else:
+        data = rng.integers(-16000, 16000, count).astype("<i2").tobytes()
+
+    whole = StreamResampler(audio_format).process(data)
+    # Odd sizes split samples and frames between chunks
+    sizes = [1, 3, 7, 1000, 333, 4097, 2, 5]
+    assert process_in_chunks(audio_format, data, sizes) == whole
+    assert process_in_chunks(audio_format, data, [1] * 500) == whole
+
+
+def test_native_audio_is_unchanged():
+    data = np.arange(-1000, 1000, dtype="<i2").tobytes()
+    assert StreamResampler(NATIVE).process(data) == data
+
+
+def test_tone_keeps_its_level():
+    rate = 48000
+    t = np.arange(rate) / rate
+    data = (np.sin(2 * np.pi * 1000 * t) * 16000).astype("<i2").tobytes()
+    resampler = StreamResampler(AudioFormat(rate, 1))
+    output = np.frombuffer(resampler.process(data), dtype="<i2")
+    # About a third of the samples, less the filter delay
+    assert 15900 < len(output) <= 16000
+    assert resampler.samples_in == rate
+    steady = output[1000:-1000].astype(np.float64)
+    assert np.sqrt(np.mean(steady**2)) == pytest.approx(16000 / np.sqrt(2), rel=0.01)
+
+
+def test_parse_mime_type():
+    assert parse_mime_type("audio/pcm") == NATIVE
+    assert parse_mime_type("audio/pcm;rate=48000;channels=2;encoding=float32") == AudioFormat(48000, 2, FLOAT32)
+    assert parse_mime_type("audio/pcm;rate=1000") is None
+    assert parse_mime_type("image/jpeg") is None
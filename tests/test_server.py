@@ -0,0 +1,57 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import pytest
+
+from server import RangeNotSatisfiable, etag_matches, parse_range
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes=0-99", (0, 99)),
+        ("bytes=500-", (500, 999)),
+        ("bytes=-100", (900, 999)),
+        # Suffix longer than the file: the whole file
+        ("bytes=-5000", (0, 999)),
+        # Last position past the end is clamped
+        ("bytes=900-5000", (900, 999)),
+        ("bytes=999-999", (999, 999)),
+        (" Bytes = 0-0", (0, 0)),
+    ],
+)
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize(
+    "header",
+    [None, "", "items=0-1", "bytes=0-1,5-6", "bytes=5", "bytes=a-b", "bytes=5-1"],
+)
+def test_parse_range_serves_the_whole_file(header):
+    assert parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize("header, size", [("bytes=1000-", 1000), ("bytes=2000-3000", 1000), ("bytes=-0", 1000), ("bytes=0-", 0)])
+def test_parse_range_not_satisfiable(header, size):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, size)
+
+
+def test_etag_matches():
+    etag = '"abc-123"'
+    assert etag_matches('"abc-123"', etag)
+    assert etag_matches('"other", W/"abc-123"', etag)
+    assert etag_matches(" * ", etag)
+    assert not etag_matches('"abc-1234"', etag)
+    assert not etag_matches("", etag)
@@ -0,0 +1,59 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import base64
+import json
+import types
+
+import pytest
+
+import session as session_module
+from frames import extract_pcm_audio
+from resample import UnsupportedAudioFormat
+from session import Session
+
+
+def realtime_input(mime_type: str, pcm: bytes) -> str:
+    data = base64.b64encode(pcm).decode("ascii")
+    return json.dumps({"realtime_input": {"media_chunks": [{"mime_type": mime_type, "data": data}]}})
+
+
+@pytest.fixture
+def session():
+    return Session(types.SimpleNamespace(path="/"))
+
+
+def test_declared_rate_is_converted(session):
+    pytest.importorskip("numpy")
+    frame = session.convert_realtime_audio(realtime_input("audio/pcm;rate=48000", bytes(9600)))
+    # 100 ms at 48 kHz, less the filter delay, at 16 kHz
+    pcm = extract_pcm_audio(frame)
+    assert 0 < len(pcm) <= 3200
+
+
+def test_native_format_spelled_out_is_kept(session, monkeypatch):
+    monkeypatch.setattr(session_module, "resampling_available", lambda: False)
+    frame = realtime_input("audio/pcm;rate=16000;channels=1", bytes(640))
+    assert session.convert_realtime_audio(frame) == frame
+
+
+@pytest.mark.parametrize("mime_type", ["audio/pcm;rate=1000", "audio/pcm;encoding=mulaw"])
+def test_invalid_format_is_rejected(session, mime_type):
+    with pytest.raises(UnsupportedAudioFormat):
+        session.convert_realtime_audio(realtime_input(mime_type, bytes(640)))
+
+
+def test_other_format_is_rejected_without_resampling(session, monkeypatch):
+    monkeypatch.setattr(session_module, "resampling_available", lambda: False)
+    with pytest.raises(UnsupportedAudioFormat):
+        session.convert_realtime_audio(realtime_input("audio/pcm;rate=48000", bytes(9600)))
@@ -0,0 +1,51 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import pytest
+
+import tools
+from tools import TtlCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(tools.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_values_expire_after_the_ttl(clock):
+    cache = TtlCache(size=4, ttl=10.0)
+    cache.put("a", 1)
+    clock[0] += 9.9
+    assert cache.get("a") == 1
+    clock[0] += 0.1
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_is_evicted(clock):
+    cache = TtlCache(size=2, ttl=10.0)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+@pytest.mark.parametrize("size, ttl", [(0, 10.0), (4, 0.0)])
+def test_disabled_cache_keeps_nothing(clock, size, ttl):
+    cache = TtlCache(size=size, ttl=ttl)
+    cache.put("a", 1)
+    assert cache.get("a") is None and len(cache) == 0
@@ -0,0 +1,57 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import types
+
+from frames import TURN_COMPLETE
+from turns import TurnTracker
+
+
+def tracker():
+    return TurnTracker(types.SimpleNamespace(id=1, region=None))
+
+
+def test_turn_ends_with_the_last_frame_of_a_split_message():
+    turns = tracker()
+    turns.client_input(1.0)
+    turns.input_sent(1.1)
+    # One serverContent with audio and turnComplete, sent as three frames
+    turns.server_content(2.0, True, TURN_COMPLETE, 3)
+    turns.server_content_sent(2.0, 2.1)
+    turns.server_content_sent(2.0, 2.2)
+    assert turns.turns == 0
+    turns.server_content_sent(2.0, 2.3)
+    assert turns.turns == 1
+    # Later frames with the same stamp are not counted again
+    turns.server_content_sent(2.0, 2.4)
+    assert turns.turns == 1
+
+
+def test_first_audio_is_the_first_frame_sent():
+    turns = tracker()
+    turns.client_input(1.0)
+    turns.server_content(2.0, True, None, 2)
+    pending = turns._pending[2.0][0]
+    turns.server_content_sent(2.0, 2.5)
+    turns.server_content_sent(2.0, 2.9)
+    assert pending.audio_sent == 2.5
+    turns.server_content(3.0, False, TURN_COMPLETE)
+    turns.server_content_sent(3.0, 3.1)
+    assert turns.turns == 1 and turns._pending == {}
+
+
+def test_unprompted_answer_is_not_a_turn():
+    turns = tracker()
+    turns.server_content(1.0, True, TURN_COMPLETE, 2)
+    turns.server_content_sent(1.0, 1.1)
+    assert turns.turns == 0 and turns._pending == {}
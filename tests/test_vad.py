@@ -0,0 +1,67 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from vad import VoiceActivityDetector  # noqa: E402
+
+RATE = 16000
+CHUNK = RATE // 10  # 100 ms
+
+
+def noise(rng, amplitude=30):
+    return rng.normal(0, amplitude, CHUNK).astype("<i2").tobytes()
+
+
+def speech():
+    t = np.arange(CHUNK) / RATE
+    return (np.sin(2 * np.pi * 300 * t) * 8000).astype("<i2").tobytes()
+
+
+def test_speech_is_sent_with_preroll_and_hangover():
+    rng = np.random.default_rng(1)
+    vad = VoiceActivityDetector(RATE, preroll_seconds=0.15, hangover_seconds=0.5)
+    for _ in range(10):
+        result = vad.process(noise(rng))
+        assert result.chunks == [] and not result.speech
+
+    chunk = speech()
+    result = vad.process(chunk)
+    assert result.speech_started and result.speech
+    # Two chunks of pre-roll cover 150 ms before the speech
+    assert len(result.chunks) == 3 and result.chunks[-1] == chunk
+
+    result = vad.process(speech())
+    assert result.speech and not result.speech_started and len(result.chunks) == 1
+
+    ended = None
+    for n in range(1, 8):
+        result = vad.process(noise(rng))
+        assert len(result.chunks) == 1 and not result.speech
+        if result.turn_ended:
+            ended = n
+            break
+    assert ended in (5, 6)
+    assert not vad.in_speech
+    assert vad.process(noise(rng)).chunks == []
+
+
+def test_margin_raises_the_threshold():
+    rng = np.random.default_rng(2)
+    vad = VoiceActivityDetector(RATE)
+    for _ in range(5):
+        vad.process(noise(rng))
+    assert not vad.process(speech(), margin_db=80.0).speech
+    assert vad.process(speech()).speech
@@ -0,0 +1,108 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import base64
+import io
+import json
+import threading
+
+import pytest
+
+import video
+from video import BITRATE, DUPLICATE, FPS, VideoFilter
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def jpeg(box=None) -> bytes:
+    """A gray screen, with a black box drawn at (left, top, right, bottom)."""
+    image = Image.new("L", (320, 240), 200)
+    if box is not None:
+        image.paste(0, box)
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+def frame(picture: bytes) -> str:
+    chunk = {"mime_type": "image/jpeg", "data": base64.b64encode(picture).decode()}
+    return json.dumps({"realtime_input": {"media_chunks": [chunk]}})
+
+
+def admit(video_filter, message, now):
+    return asyncio.run(video_filter.admit(message, now))
+
+
+def test_dedup_is_opt_in():
+    assert not VideoFilter(dedup=False).enabled
+    still = frame(jpeg())
+    video_filter = VideoFilter(dedup=False, max_fps=0, max_kbps=0)
+    assert admit(video_filter, still, 0.0) is None
+    assert admit(video_filter, still, 0.1) is None
+
+
+def test_same_picture_is_dropped_until_it_gets_old():
+    still = frame(jpeg())
+    video_filter = VideoFilter(dedup=True, dedup_max_age=2.0, max_fps=0, max_kbps=0)
+    assert admit(video_filter, still, 0.0) is None
+    assert admit(video_filter, still, 1.0) == DUPLICATE
+    assert admit(video_filter, frame(jpeg((0, 0, 1, 1))), 1.5) == DUPLICATE
+    # The model is shown the picture again at least every dedup_max_age
+    assert admit(video_filter, still, 2.0) is None
+    assert admit(video_filter, still, 2.5) == DUPLICATE
+
+
+def test_small_screen_changes_are_forwarded():
+    # A line of text appearing in a corner flips only a few gradients
+    video_filter = VideoFilter(dedup=True, max_fps=0, max_kbps=0)
+    assert admit(video_filter, frame(jpeg()), 0.0) is None
+    assert admit(video_filter, frame(jpeg((20, 20, 120, 32))), 0.1) is None
+
+
+def test_pictures_are_hashed_off_the_event_loop(monkeypatch):
+    threads = []
+    hash_picture = video._difference_hash
+
+    def record_thread(picture):
+        threads.append(threading.current_thread())
+        return hash_picture(picture)
+
+    monkeypatch.setattr(video, "_difference_hash", record_thread)
+    admit(VideoFilter(dedup=True), frame(jpeg()), 0.0)
+    assert threads and threading.main_thread() not in threads
+
+
+def test_undecodable_pictures_fall_back_to_exact_matches():
+    broken = frame(b"not a jpeg")
+    video_filter = VideoFilter(dedup=True, max_fps=0, max_kbps=0)
+    assert admit(video_filter, broken, 0.0) is None
+    assert admit(video_filter, broken, 0.1) == DUPLICATE
+    assert admit(video_filter, frame(b"not a png"), 0.2) is None
+
+
+def test_frame_rate_limit_allows_half_an_interval_of_jitter():
+    video_filter = VideoFilter(dedup=False, max_fps=2, max_kbps=0)
+    assert admit(video_filter, frame(jpeg()), 0.0) is None
+    assert admit(video_filter, frame(jpeg()), 0.2) == FPS
+    assert admit(video_filter, frame(jpeg()), 0.3) is None
+
+
+def test_bitrate_limit():
+    message = frame(jpeg())
+    # Room for about two frames a second
+    video_filter = VideoFilter(dedup=False, max_fps=0, max_kbps=len(message) * 2 * 8 / 1000)
+    assert admit(video_filter, message, 0.0) is None
+    assert admit(video_filter, message, 0.0) is None
+    assert admit(video_filter, message, 0.1) == BITRATE
+    assert admit(video_filter, message, 1.0) is None